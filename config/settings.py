@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Optional
+from typing import List, Literal, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -27,15 +27,101 @@ class Settings(BaseSettings):
 
     # Database Configuration
     database_url: str
+    db_pool_min_size: int = 5
+    db_pool_max_size: int = 20
+    # Адаптивный лимит выданных соединений между min и max по времени ожидания
+    db_pool_adaptive: bool = False
+    db_pool_target_wait: float = 0.05
+    db_pool_adjust_interval: float = 10.0
+    # Реплики только для чтения, в env задаются JSON-списком
+    database_replica_urls: List[str] = []
+    replica_sticky_seconds: float = 5.0
+    replica_max_lag: float = 5.0
+    replica_check_interval: float = 5.0
 
     # Redis Configuration
     redis_url: str = "redis://localhost:6379/0"
+    # Узлы для шардирования по user_id (JSON-список); пусто - только redis_url
+    redis_urls: List[str] = []
+    # Локальный кеш горячих контекстов (объем - по размеру значений в Redis)
+    context_cache_enabled: bool = True
+    context_cache_max_bytes: int = 64 * 1024 * 1024
+    context_cache_ttl: float = 30.0
+    # Сроки жизни ключей по классам (секунды), продлеваются при чтении
+    context_ttl: int = 3600
+    summary_ttl: int = 7 * 86400
+    preferences_ttl: int = 30 * 86400
+    memory_ttl: int = 30 * 86400
 
     # Bot Settings
     default_gender: Gender = Gender.NEUTRAL
     max_message_length: int = 4096
     cache_ttl: int = 3600
 
+    # Long-term memory (BM25 по старым репликам пользователя)
+    memory_enabled: bool = True
+    memory_top_k: int = 3
+    memory_token_budget: int = 300
+    memory_max_docs: int = 2000
+    memory_skip_recent: int = 10
+
+    # Token quotas (0 - без лимита) и поведение при превышении:
+    # shorten - короткие ответы, cheap_model - дешевая модель, cooldown - отказ
+    token_quota_daily: int = 0
+    token_quota_monthly: int = 0
+    token_quota_degrade: Literal["shorten", "cheap_model", "cooldown"] = "shorten"
+    token_quota_degraded_max_tokens: int = 150
+    token_quota_cheap_model: str = "gpt-3.5-turbo"
+    token_usage_flush_interval: float = 60.0
+
+    # Anti-flood: ведро на пользователя вытекает со скоростью flood_rate
+    # апдейтов в секунду и вмещает flood_burst; лишние апдейты ждут до
+    # flood_queue_delay секунд (0 - сразу отбрасываются)
+    flood_control_enabled: bool = True
+    flood_rate: float = 1.0
+    flood_burst: int = 5
+    flood_queue_delay: float = 0.0
+
+    # Повторно доставленные апдейты: update_id помнится dedup_ttl секунд
+    # (0 - без проверки); очередь апдейтов при старте по умолчанию сохраняется.
+    # Повтор приходит сразу после перезапуска или таймаута вебхука, поэтому
+    # хватает минут; окно должно перекрывать самый долгий ожидаемый простой
+    update_dedup_ttl: int = 600
+    drop_pending_updates: bool = False
+
+    # Исходящие запросы к Telegram: общий лимит бота и лимиты чатов
+    # (личных и групп, сообщений в секунду). Ведра живут в процессе, поэтому
+    # при N репликах общий лимит нужно делить на N
+    telegram_global_rate: float = 30.0
+    telegram_chat_rate: float = 1.0
+    telegram_group_rate: float = 20 / 60
+    telegram_chat_burst: int = 3
+    telegram_max_retries: int = 3
+
+    # Процессы-воркеры: 0 - один процесс; N - прием апдейтов отдельным
+    # процессом и обработка в N воркерах, выбранных по user_id
+    worker_processes: int = 0
+
+    # Timeouts (seconds)
+    update_deadline: float = 25.0
+    db_command_timeout: float = 10.0
+    redis_timeout: float = 2.0
+    openai_timeout: float = 20.0
+
+    # Maintenance
+    maintenance_enabled: bool = True
+    maintenance_interval: int = 3600
+    conversation_retention_days: int = 90
+    partition_months_ahead: int = 3
+    purge_batch_size: int = 1000
+    purge_batch_pause: float = 0.5
+    rollup_batch_size: int = 10000
+    inactive_user_days: int = 30
+    archive_batch_size: int = 5000
+
+    # Metrics (порт HTTP-эндпоинта Prometheus, 0 - выключено)
+    metrics_port: int = 0
+
     # Logging
     log_level: str = "INFO"
 
@@ -0,0 +1,94 @@
+"""
+Архивирование неактивных пользователей по user_stats.last_activity
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+from loguru import logger
+
+from database.cursors import get_cursor, set_cursor
+
+ARCHIVE_JOB = "inactive_users_archive"
+
+# Начало шкалы для первого запуска, когда курсора еще нет
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Следующая пачка по индексу (last_activity, user_id) после курсора и
+# отключение тех, кто в ней еще активен. Возвращает размер пачки, число
+# архивированных и позицию последней строки для курсора
+ARCHIVE_BATCH_SQL = """
+WITH batch AS (
+    SELECT user_id, last_activity FROM user_stats
+    WHERE (last_activity, user_id) > ($1, $2) AND last_activity < $3
+    ORDER BY last_activity, user_id
+    LIMIT $4
+), archived AS (
+    UPDATE users u SET is_active = false, updated_at = NOW()
+    FROM batch b
+    WHERE u.user_id = b.user_id AND u.is_active
+    RETURNING u.user_id
+), last AS (
+    SELECT user_id, last_activity FROM batch
+    ORDER BY last_activity DESC, user_id DESC
+    LIMIT 1
+)
+SELECT (SELECT COUNT(*) FROM batch) AS scanned,
+       (SELECT COUNT(*) FROM archived) AS archived,
+       (SELECT user_id FROM last) AS last_id,
+       (SELECT last_activity FROM last) AS last_ts
+"""
+
+
+@dataclass
+class ArchiveResult:
+    """Итог прохода архивирования"""
+
+    archived: int = 0
+    scanned: int = 0
+    duration: float = 0.0
+
+
+async def archive_inactive_users(
+    conn: asyncpg.Connection,
+    days_inactive: int = 30,
+    batch_size: int = 5000,
+    pause: float = 0.1,
+) -> ArchiveResult:
+    """Отключение пользователей без активности дольше days_inactive дней.
+
+    Пользователи перебираются по индексу user_stats (last_activity, user_id)
+    от сохраненного курсора. last_activity только растет, а граница отсечки
+    только сдвигается вперед, поэтому курсор не сбрасывается: каждый запуск
+    читает лишь тех, кто стал неактивным после прошлого. Пачка и курсор
+    коммитятся вместе, прерванный проход продолжается с места остановки.
+    """
+    started = time.monotonic()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days_inactive)
+    last_id, last_ts = await get_cursor(conn, ARCHIVE_JOB)
+    last_id = last_id or 0
+    last_ts = last_ts or _EPOCH
+
+    result = ArchiveResult()
+    while True:
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                ARCHIVE_BATCH_SQL, last_ts, last_id, cutoff, batch_size
+            )
+            if row["scanned"]:
+                last_id, last_ts = row["last_id"], row["last_ts"]
+                await set_cursor(conn, ARCHIVE_JOB, last_id=last_id, last_ts=last_ts)
+        result.scanned += row["scanned"]
+        result.archived += row["archived"]
+        if row["scanned"] < batch_size:
+            break
+        await asyncio.sleep(pause)
+
+    result.duration = time.monotonic() - started
+    logger.info(
+        f"Archived {result.archived} inactive users in {result.duration:.2f}s "
+        f"({result.scanned} rows scanned)"
+    )
+    return result
@@ -1,22 +1,88 @@
-from typing import Any, Dict, List, Optional
+from datetime import date, datetime, timezone
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, cast
 
 import asyncpg
 from loguru import logger
 
 from config.settings import Settings, settings
-from database.models import (
-    CREATE_TABLES_SQL,
-    CommunicationStyle,
-    Conversation,
-    Gender,
-    User,
-    UserStats,
+from database.mapping import (
+    record_to_conversation,
+    record_to_search_result,
+    record_to_user,
+    record_to_user_stats,
 )
+from database.migrations import migrate
+from database.models import Conversation, SearchResult, User, UserStats
+from database.partitions import check_partition_coverage
+from database.pool import MonitoredPool
+from database.replicas import REPLICA_ERRORS, ReplicaRouter
+from database.statements import STATEMENTS, USER_COLUMNS
+from services import deadline
+from services.metrics import DB_QUERY_SECONDS
+
+# Поля пользователя, которые можно менять через patch_user
+PATCHABLE_USER_FIELDS = frozenset(
+    {
+        "username",
+        "first_name",
+        "last_name",
+        "gender",
+        "bot_gender",
+        "communication_style",
+        "consent_given",
+        "stop_words",
+        "persona",
+        "is_active",
+    }
+)
+
+
+class TimedStatement:
+    """Подготовленный запрос, время выполнения которого пишется в метрики"""
+
+    __slots__ = ("statement", "timer")
+
+    def __init__(
+        self, name: str, statement: asyncpg.prepared_stmt.PreparedStatement
+    ) -> None:
+        self.statement = statement
+        self.timer = DB_QUERY_SECONDS.labels(name)
+
+    async def fetch(
+        self, *args: Any, timeout: Optional[float] = None
+    ) -> List[asyncpg.Record]:
+        with self.timer.time():
+            rows = await self.statement.fetch(*args, timeout=timeout)
+        return cast(List[asyncpg.Record], rows)
+
+    async def fetchrow(self, *args: Any, timeout: Optional[float] = None) -> Any:
+        with self.timer.time():
+            return await self.statement.fetchrow(*args, timeout=timeout)
+
+
+class BotConnection(asyncpg.Connection):
+    """Соединение пула с заранее подготовленными горячими запросами"""
+
+    __slots__ = ("statements",)
+
+    async def prepare_statements(self) -> None:
+        """Подготовка всех запросов из реестра STATEMENTS"""
+        self.statements: Dict[str, TimedStatement] = {
+            name: TimedStatement(name, await self.prepare(query))
+            for name, query in STATEMENTS.items()
+        }
+
+
+async def _init_connection(conn: BotConnection) -> None:
+    """init-хук пула: вызывается один раз для каждого нового соединения"""
+    await conn.prepare_statements()
 
 
 class DatabaseManager:
     def __init__(self) -> None:
-        self.pool: Optional[asyncpg.Pool] = None
+        self.pool: Optional[MonitoredPool] = None
+        self.replicas: Optional[ReplicaRouter] = None
         # Используем settings или создаем новый экземпляр
         if settings is None:
             # В тестах или CI/CD создаем с дефолтными значениями
@@ -33,68 +99,120 @@ class DatabaseManager:
     async def connect(self) -> None:
         """Создание пула соединений с базой данных"""
         try:
-            self.pool = await asyncpg.create_pool(
-                self.settings.database_url, min_size=5, max_size=20, command_timeout=60
-            )
+            # Схема должна быть актуальной до того, как init-хук пула
+            # начнет подготавливать запросы
+            conn = await asyncpg.connect(self.settings.database_url)
+            try:
+                applied = await migrate(conn)
+                if applied:
+                    logger.info(f"Applied database migrations: {applied}")
+                # Без default-партиции вставки за последней партицией падают
+                await check_partition_coverage(
+                    conn, self.settings.partition_months_ahead
+                )
+            finally:
+                await conn.close()
+
+            self.pool = await self._create_pool(self.settings.database_url, "primary")
             logger.info("Database connection pool created successfully")
 
-            # Создание таблиц при первом подключении
-            async with self.pool.acquire() as conn:
-                await conn.execute(CREATE_TABLES_SQL)
-                logger.info("Database tables created/verified")
+            if self.settings.database_replica_urls:
+                self.replicas = ReplicaRouter(
+                    self.settings.database_replica_urls,
+                    self._create_replica_pool,
+                    sticky_seconds=self.settings.replica_sticky_seconds,
+                    max_lag=self.settings.replica_max_lag,
+                    check_interval=self.settings.replica_check_interval,
+                )
+                await self.replicas.start()
+                logger.info(
+                    f"Read routing over {len(self.settings.database_replica_urls)} "
+                    "replica(s) enabled"
+                )
 
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
 
+    async def _create_pool(self, url: str, name: str) -> MonitoredPool:
+        """Пул с подготовленными запросами и телеметрией"""
+        pool = await asyncpg.create_pool(
+            url,
+            min_size=self.settings.db_pool_min_size,
+            max_size=self.settings.db_pool_max_size,
+            command_timeout=self.settings.db_command_timeout,
+            connection_class=BotConnection,
+            init=_init_connection,
+        )
+        return MonitoredPool(
+            pool,
+            name,
+            min_size=self.settings.db_pool_min_size,
+            max_size=self.settings.db_pool_max_size,
+            adaptive=self.settings.db_pool_adaptive,
+            target_wait=self.settings.db_pool_target_wait,
+            adjust_interval=self.settings.db_pool_adjust_interval,
+        )
+
+    async def _create_replica_pool(self, url: str) -> MonitoredPool:
+        """Пул реплики, в метриках подписан хостом реплики"""
+        return await self._create_pool(url, "replica:" + url.rsplit("@", 1)[-1])
+
     async def close(self) -> None:
         """Закрытие пула соединений"""
+        if self.replicas:
+            await self.replicas.close()
+            self.replicas = None
         if self.pool:
             await self.pool.close()
             logger.info("Database connection pool closed")
 
-    async def get_user(self, user_id: int) -> Optional[User]:
-        """Получение пользователя по ID"""
+    def _timeout(self) -> Optional[float]:
+        """Таймаут запроса с учетом оставшегося бюджета апдейта"""
+        return deadline.timeout(self.settings.db_command_timeout)
+
+    def _mark_write(self, user_id: int) -> None:
+        """Чтения пользователя после записи какое-то время идут на основной"""
+        if self.replicas:
+            self.replicas.mark_write(user_id)
+
+    async def _read(
+        self, user_id: int, statement: str, *args: Any, one: bool = False
+    ) -> Any:
+        """Выполнение читающего запроса на реплике с откатом на основной"""
         if not self.pool:
             raise RuntimeError("Database not connected")
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                """
-                SELECT user_id, username, first_name, last_name, gender, bot_gender,
-                       communication_style, consent_given, stop_words, created_at, updated_at, is_active
-                FROM users WHERE user_id = $1
-                """,
-                user_id,
-            )
+        router = self.replicas
+        replica = router.pick(user_id) if router else None
+        if router and replica is not None:
+            try:
+                return await self._fetch(replica, statement, args, one)
+            except deadline.DeadlineExceeded:
+                raise
+            except REPLICA_ERRORS as e:
+                router.mark_down(replica, e)
+        return await self._fetch(self.pool, statement, args, one)
 
-            if row:
-                return User(
-                    user_id=row["user_id"],
-                    username=row["username"],
-                    first_name=row["first_name"],
-                    last_name=row["last_name"],
-                    gender=Gender(row["gender"]),
-                    bot_gender=Gender(row["bot_gender"]),
-                    communication_style=CommunicationStyle(row["communication_style"]),
-                    consent_given=row["consent_given"],
-                    stop_words=row["stop_words"] or [],
-                    created_at=row["created_at"],
-                    updated_at=row["updated_at"],
-                    is_active=row["is_active"],
-                )
-            return None
+    async def _fetch(
+        self, pool: MonitoredPool, statement: str, args: tuple, one: bool
+    ) -> Any:
+        async with pool.acquire(timeout=self._timeout()) as conn:
+            prepared = conn.statements[statement]
+            if one:
+                return await prepared.fetchrow(*args, timeout=self._timeout())
+            return await prepared.fetch(*args, timeout=self._timeout())
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        """Получение пользователя по ID"""
+        row = await self._read(user_id, "get_user", user_id, one=True)
+        return record_to_user(row) if row else None
 
     async def create_user(self, user: User) -> User:
         """Создание нового пользователя"""
         if not self.pool:
             raise RuntimeError("Database not connected")
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """
-                INSERT INTO users (user_id, username, first_name, last_name, gender, bot_gender,
-                                 communication_style, consent_given, stop_words, persona)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                """,
+        async with self.pool.acquire(timeout=self._timeout()) as conn:
+            await conn.statements["insert_user"].fetch(
                 user.user_id,
                 user.username,
                 user.first_name,
@@ -105,16 +223,15 @@ class DatabaseManager:
                 user.consent_given,
                 user.stop_words,
                 user.persona,
+                timeout=self._timeout(),
             )
 
             # Создание записи статистики
-            await conn.execute(
-                """
-                INSERT INTO user_stats (user_id) VALUES ($1)
-                """,
-                user.user_id,
+            await conn.statements["insert_user_stats"].fetch(
+                user.user_id, timeout=self._timeout()
             )
 
+            self._mark_write(user.user_id)
             logger.info(f"Created new user: {user.user_id}")
             return user
 
@@ -122,14 +239,8 @@ class DatabaseManager:
         """Обновление данных пользователя"""
         if not self.pool:
             raise RuntimeError("Database not connected")
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """
-                UPDATE users SET username = $2, first_name = $3, last_name = $4,
-                                gender = $5, bot_gender = $6, communication_style = $7,
-                                consent_given = $8, stop_words = $9, persona = $10, updated_at = NOW()
-                WHERE user_id = $1
-                """,
+        async with self.pool.acquire(timeout=self._timeout()) as conn:
+            await conn.statements["update_user"].fetch(
                 user.user_id,
                 user.username,
                 user.first_name,
@@ -140,96 +251,139 @@ class DatabaseManager:
                 user.consent_given,
                 user.stop_words,
                 user.persona,
+                timeout=self._timeout(),
             )
+            self._mark_write(user.user_id)
             return user
 
+    async def patch_user(self, user_id: int, **fields: Any) -> Optional[User]:
+        """Точечное обновление полей пользователя одним UPDATE ... RETURNING.
+
+        Меняются только переданные колонки, поэтому параллельные правки разных
+        настроек не затирают друг друга. Возвращает обновленного пользователя
+        или None, если его нет.
+        """
+        if not self.pool:
+            raise RuntimeError("Database not connected")
+        unknown = set(fields) - PATCHABLE_USER_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown user fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return await self.get_user(user_id)
+
+        assignments = []
+        values = []
+        for position, (name, value) in enumerate(fields.items(), start=2):
+            assignments.append(f"{name} = ${position}")
+            values.append(value.value if isinstance(value, Enum) else value)
+
+        async with self.pool.acquire(timeout=self._timeout()) as conn:
+            with DB_QUERY_SECONDS.labels("patch_user").time():
+                row = await conn.fetchrow(
+                    f"""
+                    UPDATE users SET {", ".join(assignments)}, updated_at = NOW()
+                    WHERE user_id = $1
+                    RETURNING {USER_COLUMNS}
+                    """,
+                    user_id,
+                    *values,
+                    timeout=self._timeout(),
+                )
+            self._mark_write(user_id)
+            return record_to_user(row) if row else None
+
     async def save_conversation(self, conversation: Conversation) -> Conversation:
         """Сохранение диалога"""
         if not self.pool:
             raise RuntimeError("Database not connected")
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """
-                INSERT INTO conversations (user_id, message, bot_response, communication_style, tokens_used)
-                VALUES ($1, $2, $3, $4, $5)
-                """,
+        async with self.pool.acquire(timeout=self._timeout()) as conn:
+            row = await conn.statements["insert_conversation"].fetchrow(
                 conversation.user_id,
                 conversation.message,
                 conversation.bot_response,
                 conversation.communication_style.value,
                 conversation.tokens_used,
+                timeout=self._timeout(),
             )
+            conversation.id = row["id"]
+            conversation.created_at = row["created_at"]
 
             # Обновление статистики пользователя
-            await conn.execute(
-                """
-                UPDATE user_stats SET total_messages = total_messages + 1,
-                                    total_tokens = total_tokens + $2,
-                                    last_activity = NOW(),
-                                    updated_at = NOW()
-                WHERE user_id = $1
-                """,
+            await conn.statements["bump_user_stats"].fetch(
                 conversation.user_id,
                 conversation.tokens_used,
+                conversation.communication_style.value,
+                timeout=self._timeout(),
             )
 
+            self._mark_write(conversation.user_id)
             return conversation
 
     async def get_user_stats(self, user_id: int) -> Optional[UserStats]:
         """Получение статистики пользователя"""
-        if not self.pool:
-            raise RuntimeError("Database not connected")
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                """
-                SELECT user_id, total_messages, total_tokens, favorite_style,
-                       last_activity, created_at, updated_at
-                FROM user_stats WHERE user_id = $1
-                """,
-                user_id,
-            )
-
-            if row:
-                return UserStats(
-                    user_id=row["user_id"],
-                    total_messages=row["total_messages"],
-                    total_tokens=row["total_tokens"],
-                    favorite_style=CommunicationStyle(row["favorite_style"]),
-                    last_activity=row["last_activity"],
-                    created_at=row["created_at"],
-                    updated_at=row["updated_at"],
-                )
-            return None
+        row = await self._read(user_id, "get_user_stats", user_id, one=True)
+        return record_to_user_stats(row) if row else None
 
     async def get_recent_conversations(
         self, user_id: int, limit: int = 10
     ) -> List[Conversation]:
         """Получение последних диалогов пользователя"""
-        if not self.pool:
-            raise RuntimeError("Database not connected")
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT id, user_id, message, bot_response, communication_style, tokens_used, created_at
-                FROM conversations WHERE user_id = $1
-                ORDER BY created_at DESC LIMIT $2
-                """,
+        rows = await self._read(user_id, "get_recent_conversations", user_id, limit)
+        return [record_to_conversation(row) for row in rows]
+
+    async def iter_conversations(
+        self, user_id: int, batch_size: int = 500
+    ) -> AsyncIterator[Conversation]:
+        """Вся история пользователя от старых к новым диалогам.
+
+        Страницы читаются по ключу (created_at, id), соединение берется
+        только на время одной страницы, поэтому память и занятость пула не
+        зависят от длины истории и скорости потребителя.
+        """
+        last_created = datetime.min.replace(tzinfo=timezone.utc)
+        last_id = 0
+        while True:
+            rows = await self._read(
+                user_id,
+                "get_conversations_page",
                 user_id,
-                limit,
+                last_created,
+                last_id,
+                batch_size,
             )
+            for row in rows:
+                yield record_to_conversation(row)
+            if len(rows) < batch_size:
+                return
+            last_created, last_id = rows[-1]["created_at"], rows[-1]["id"]
 
-            return [
-                Conversation(
-                    id=row["id"],
-                    user_id=row["user_id"],
-                    message=row["message"],
-                    bot_response=row["bot_response"],
-                    communication_style=CommunicationStyle(row["communication_style"]),
-                    tokens_used=row["tokens_used"],
-                    created_at=row["created_at"],
-                )
-                for row in rows
-            ]
+    async def search_conversations(
+        self, user_id: int, query: str, limit: int = 5, offset: int = 0
+    ) -> List[SearchResult]:
+        """Полнотекстовый поиск по диалогам пользователя, лучшие совпадения первыми"""
+        rows = await self._read(
+            user_id, "search_conversations", user_id, query, limit, offset
+        )
+        return [record_to_search_result(row) for row in rows]
+
+    async def get_conversations_by_ids(
+        self, user_id: int, ids: List[int]
+    ) -> List[Conversation]:
+        """Диалоги пользователя с указанными id (порядок не гарантируется)"""
+        rows = await self._read(user_id, "get_conversations_by_ids", user_id, ids)
+        return [record_to_conversation(row) for row in rows]
+
+    async def add_token_usage(self, usage: List[Tuple[int, date, int]]) -> None:
+        """Прибавление израсходованных токенов (user_id, день, токены)"""
+        if not self.pool:
+            raise RuntimeError("Database not connected")
+        if not usage:
+            return
+        user_ids, days, tokens = (list(column) for column in zip(*usage))
+        async with self.pool.acquire(timeout=self._timeout()) as conn:
+            await conn.statements["add_token_usage"].fetch(
+                user_ids, days, tokens, timeout=self._timeout()
+            )
 
 
 # Глобальный экземпляр менеджера базы данных
@@ -0,0 +1,43 @@
+"""
+Курсоры возобновляемых пакетных задач (таблица job_cursors)
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+
+import asyncpg
+
+
+async def get_cursor(
+    conn: asyncpg.Connection, job: str
+) -> Tuple[Optional[int], Optional[datetime]]:
+    """Сохраненная позиция задачи: (last_id, last_ts)"""
+    row = await conn.fetchrow(
+        "SELECT last_id, last_ts FROM job_cursors WHERE job = $1", job
+    )
+    if row is None:
+        return None, None
+    return row["last_id"], row["last_ts"]
+
+
+async def set_cursor(
+    conn: asyncpg.Connection,
+    job: str,
+    last_id: Optional[int] = None,
+    last_ts: Optional[datetime] = None,
+) -> None:
+    """Сохранение позиции задачи"""
+    await conn.execute(
+        """
+        INSERT INTO job_cursors (job, last_id, last_ts) VALUES ($1, $2, $3)
+        ON CONFLICT (job) DO UPDATE
+        SET last_id = EXCLUDED.last_id, last_ts = EXCLUDED.last_ts, updated_at = NOW()
+        """,
+        job,
+        last_id,
+        last_ts,
+    )
+
+
+async def clear_cursor(conn: asyncpg.Connection, job: str) -> None:
+    """Сброс позиции задачи после ее завершения"""
+    await conn.execute("DELETE FROM job_cursors WHERE job = $1", job)
@@ -0,0 +1,77 @@
+"""
+Преобразование строк asyncpg.Record в модели
+"""
+from typing import Any, Mapping
+
+from database.models import (
+    STYLE_COUNTER_COLUMNS,
+    CommunicationStyle,
+    Conversation,
+    Gender,
+    SearchResult,
+    User,
+    UserStats,
+)
+
+# Прямой поиск значения в словаре дешевле, чем вызов Enum(value)
+_GENDERS = {gender.value: gender for gender in Gender}
+_STYLES = {style.value: style for style in CommunicationStyle}
+
+Row = Mapping[str, Any]
+
+
+def record_to_user(row: Row) -> User:
+    """Строка users -> User"""
+    return User(
+        user_id=row["user_id"],
+        username=row["username"],
+        first_name=row["first_name"],
+        last_name=row["last_name"],
+        gender=_GENDERS[row["gender"]],
+        bot_gender=_GENDERS[row["bot_gender"]],
+        communication_style=_STYLES[row["communication_style"]],
+        consent_given=row["consent_given"],
+        stop_words=row["stop_words"] or [],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+        is_active=row["is_active"],
+        persona=row["persona"],
+    )
+
+
+def record_to_user_stats(row: Row) -> UserStats:
+    """Строка user_stats -> UserStats"""
+    return UserStats(
+        user_id=row["user_id"],
+        total_messages=row["total_messages"],
+        total_tokens=row["total_tokens"],
+        favorite_style=_STYLES[row["favorite_style"]],
+        last_activity=row["last_activity"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+        style_messages={
+            style: row[column] for style, column in STYLE_COUNTER_COLUMNS.items()
+        },
+    )
+
+
+def record_to_conversation(row: Row) -> Conversation:
+    """Строка conversations -> Conversation"""
+    return Conversation(
+        id=row["id"],
+        user_id=row["user_id"],
+        message=row["message"],
+        bot_response=row["bot_response"],
+        communication_style=_STYLES[row["communication_style"]],
+        tokens_used=row["tokens_used"],
+        created_at=row["created_at"],
+    )
+
+
+def record_to_search_result(row: Row) -> SearchResult:
+    """Строка поиска по conversations -> SearchResult"""
+    return SearchResult(
+        conversation=record_to_conversation(row),
+        rank=row["rank"],
+        headline=row["headline"],
+    )
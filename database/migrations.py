@@ -0,0 +1,267 @@
+"""
+Версионированные миграции схемы базы данных
+"""
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+import asyncpg
+from loguru import logger
+
+from database.partitions import create_index_online, is_partitioned
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Шаг миграции схемы.
+
+    transactional=False нужен для команд, которые нельзя выполнять внутри
+    транзакции (CREATE INDEX CONCURRENTLY); такой шаг должен быть
+    идемпотентным, потому что версия записывается после него отдельно.
+    Если шагу нужна логика, вместо sql задается функция run, она всегда
+    выполняется вне транзакции.
+    """
+
+    version: int
+    name: str
+    sql: str = ""
+    transactional: bool = True
+    run: Optional[Callable[[asyncpg.Connection], Awaitable[None]]] = None
+
+
+async def _create_user_date_index(conn: asyncpg.Connection) -> None:
+    """Индекс диалогов пользователя по дате.
+
+    Индекс уже создается scripts/optimize_database.py под тем же именем, на
+    таких базах шаг ничего не делает. У партиционированной таблицы такой
+    индекс есть с момента перевода (idx_conversations_part_user_created).
+    """
+    if await is_partitioned(conn):
+        return
+    await create_index_online(
+        conn, "idx_conversations_user_date", "(user_id, created_at DESC)"
+    )
+
+
+async def _create_search_index(conn: asyncpg.Connection) -> None:
+    """GIN-индекс полнотекстового поиска по диалогам.
+
+    У партиционированной таблицы он уже есть (idx_conversations_part_search),
+    второй такой же только удвоил бы запись на каждую вставку.
+    """
+    if await is_partitioned(conn):
+        return
+    await create_index_online(
+        conn, "idx_conversations_search", "USING GIN (search_vector)"
+    )
+
+
+# Ключ advisory-лока: миграции выполняет только одна реплика
+MIGRATION_LOCK_ID = 0x4348_4B59_0002
+
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(128) NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+)
+"""
+
+# Первые шаги написаны через IF NOT EXISTS: на базах, созданных до появления
+# миграций (init.sql или старым CREATE_TABLES_SQL), они только дописывают
+# недостающее
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "initial_schema",
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            first_name VARCHAR(255) NOT NULL,
+            last_name VARCHAR(255),
+            gender VARCHAR(20) NOT NULL DEFAULT 'neutral',
+            bot_gender VARCHAR(20) NOT NULL DEFAULT 'neutral',
+            communication_style VARCHAR(20) NOT NULL DEFAULT 'playful',
+            consent_given BOOLEAN NOT NULL DEFAULT FALSE,
+            stop_words TEXT[] DEFAULT '{}',
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            is_active BOOLEAN DEFAULT TRUE
+        );
+
+        CREATE TABLE IF NOT EXISTS conversations (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            message TEXT NOT NULL,
+            bot_response TEXT NOT NULL,
+            communication_style VARCHAR(20) NOT NULL,
+            tokens_used INTEGER DEFAULT 0,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id BIGINT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            total_messages INTEGER DEFAULT 0,
+            total_tokens INTEGER DEFAULT 0,
+            favorite_style VARCHAR(20) DEFAULT 'playful',
+            last_activity TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
+        CREATE INDEX IF NOT EXISTS idx_conversations_created_at
+            ON conversations(created_at);
+        CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+        """,
+    ),
+    Migration(
+        2,
+        "users_persona",
+        """
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS persona VARCHAR(32) NOT NULL DEFAULT 'default'
+        """,
+    ),
+    Migration(
+        3,
+        "job_cursors",
+        """
+        CREATE TABLE IF NOT EXISTS job_cursors (
+            job VARCHAR(64) PRIMARY KEY,
+            last_id BIGINT,
+            last_ts TIMESTAMP WITH TIME ZONE,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+        """,
+    ),
+    Migration(
+        4,
+        "daily_rollups",
+        """
+        CREATE TABLE IF NOT EXISTS style_daily_stats (
+            day DATE NOT NULL,
+            communication_style VARCHAR(20) NOT NULL,
+            message_count BIGINT NOT NULL DEFAULT 0,
+            tokens_used BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, communication_style)
+        );
+
+        CREATE TABLE IF NOT EXISTS user_daily_stats (
+            day DATE NOT NULL,
+            user_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            tokens_used BIGINT NOT NULL DEFAULT 0,
+            last_message TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (day, user_id)
+        );
+        """,
+    ),
+    Migration(
+        5,
+        "user_stats_style_counters",
+        """
+        ALTER TABLE user_stats
+            ADD COLUMN IF NOT EXISTS playful_messages INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS romantic_messages INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS passionate_messages INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS mysterious_messages INTEGER NOT NULL DEFAULT 0
+        """,
+    ),
+    Migration(
+        6,
+        "user_stats_last_activity_index",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_stats_last_activity
+        ON user_stats (last_activity, user_id)
+        """,
+        transactional=False,
+    ),
+    Migration(
+        7,
+        "conversations_user_date_index",
+        run=_create_user_date_index,
+    ),
+    # Колонка без значения по умолчанию добавляется без перезаписи таблицы;
+    # новые строки получают вектор при вставке, старые заполняет
+    # scripts/backfill_search_vectors.py
+    Migration(
+        8,
+        "conversations_search_vector",
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector TSVECTOR",
+    ),
+    Migration(
+        9,
+        "conversations_search_index",
+        run=_create_search_index,
+    ),
+    Migration(
+        10,
+        "user_token_usage",
+        """
+        CREATE TABLE IF NOT EXISTS user_token_usage (
+            user_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            tokens BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+        """,
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def current_version(conn: asyncpg.Connection) -> int:
+    """Примененная версия схемы, 0 для пустой базы"""
+    exists = await conn.fetchval("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not exists:
+        return 0
+    version = await conn.fetchval("SELECT MAX(version) FROM schema_version")
+    return int(version) if version is not None else 0
+
+
+def pending_migrations(version: int, target: Optional[int] = None) -> List[Migration]:
+    """Миграции после version до target включительно"""
+    target = LATEST_VERSION if target is None else target
+    return [m for m in MIGRATIONS if version < m.version <= target]
+
+
+async def migrate(conn: asyncpg.Connection, target: Optional[int] = None) -> List[int]:
+    """Применение недостающих миграций. Возвращает примененные версии.
+
+    Если схема актуальна, выполняются два чтения каталога без блокировок. Иначе
+    берется advisory-лок: остальные реплики ждут его и после получения видят
+    уже обновленную версию.
+    """
+    if not pending_migrations(await current_version(conn), target):
+        return []
+
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await conn.execute(SCHEMA_VERSION_SQL)
+        applied: List[int] = []
+        for migration in pending_migrations(await current_version(conn), target):
+            logger.info(f"Applying migration {migration.version}: {migration.name}")
+            if migration.run is not None:
+                await migration.run(conn)
+                await _record(conn, migration)
+            elif migration.transactional:
+                async with conn.transaction():
+                    await conn.execute(migration.sql)
+                    await _record(conn, migration)
+            else:
+                await conn.execute(migration.sql)
+                await _record(conn, migration)
+            applied.append(migration.version)
+        return applied
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def _record(conn: asyncpg.Connection, migration: Migration) -> None:
+    await conn.execute(
+        "INSERT INTO schema_version (version, name) VALUES ($1, $2)",
+        migration.version,
+        migration.name,
+    )
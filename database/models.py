@@ -1,7 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class Gender(str, Enum):
@@ -45,6 +45,13 @@ class Conversation:
     created_at: datetime
 
 
+@dataclass
+class SearchResult:
+    conversation: Conversation
+    rank: float
+    headline: str
+
+
 @dataclass
 class UserStats:
     user_id: int
@@ -54,51 +61,10 @@ class UserStats:
     last_activity: datetime
     created_at: datetime
     updated_at: datetime
+    style_messages: Dict[CommunicationStyle, int] = field(default_factory=dict)
 
 
-# SQL queries for database operations
-CREATE_TABLES_SQL = """
--- Users table
-CREATE TABLE IF NOT EXISTS users (
-    user_id BIGINT PRIMARY KEY,
-    username VARCHAR(255),
-    first_name VARCHAR(255) NOT NULL,
-    last_name VARCHAR(255),
-    gender VARCHAR(20) NOT NULL DEFAULT 'neutral',
-    bot_gender VARCHAR(20) NOT NULL DEFAULT 'neutral',
-    communication_style VARCHAR(20) NOT NULL DEFAULT 'playful',
-    consent_given BOOLEAN NOT NULL DEFAULT FALSE,
-    stop_words TEXT[] DEFAULT '{}',
-    persona VARCHAR(32) NOT NULL DEFAULT 'default',
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    is_active BOOLEAN DEFAULT TRUE
-);
-
--- Conversations table
-CREATE TABLE IF NOT EXISTS conversations (
-    id SERIAL PRIMARY KEY,
-    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
-    message TEXT NOT NULL,
-    bot_response TEXT NOT NULL,
-    communication_style VARCHAR(20) NOT NULL,
-    tokens_used INTEGER DEFAULT 0,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
-
--- User statistics table
-CREATE TABLE IF NOT EXISTS user_stats (
-    user_id BIGINT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
-    total_messages INTEGER DEFAULT 0,
-    total_tokens INTEGER DEFAULT 0,
-    favorite_style VARCHAR(20) DEFAULT 'playful',
-    last_activity TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
-
--- Indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
-CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at);
-CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
-"""
+# Счетчики сообщений по стилям в user_stats
+STYLE_COUNTER_COLUMNS: Dict[CommunicationStyle, str] = {
+    style: f"{style.value}_messages" for style in CommunicationStyle
+}
@@ -0,0 +1,399 @@
+"""
+Помесячное декларативное партиционирование таблицы conversations
+"""
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+import asyncpg
+from loguru import logger
+
+from database.cursors import clear_cursor, get_cursor, set_cursor
+from services.metrics import CONVERSATION_PARTITIONS_AHEAD
+
+TABLE = "conversations"
+# Поисковый вектор диалога, тот же, что пишется при вставке
+SEARCH_VECTOR_SQL = "to_tsvector('russian', message || ' ' || bot_response)"
+# Временная таблица, в которую идет перенос данных до переключения
+SHADOW_TABLE = "conversations_partitioned"
+# Старая таблица остается после переключения для отката
+OLD_TABLE = "conversations_old"
+MIGRATION_JOB = "conversations_partitioning"
+# Ключ advisory-лока переноса: пока он взят, старые диалоги не удаляются
+MIGRATION_LOCK_ID = 0x4348_4B59_0003
+
+_PARTITION_RE = re.compile(rf"^{TABLE}_(\d{{4}})_(\d{{2}})$")
+
+
+def month_start(day: date) -> date:
+    """Первое число месяца"""
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    """Сдвиг на целое число календарных месяцев (результат - первое число)"""
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Имя партиции для месяца, например conversations_2024_01"""
+    return f"{TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def parse_partition_month(name: str) -> Optional[date]:
+    """Месяц партиции по ее имени (None для чужих таблиц)"""
+    match = _PARTITION_RE.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def current_month() -> date:
+    """Текущий месяц по UTC"""
+    return month_start(datetime.now(timezone.utc).date())
+
+
+async def is_partitioned(conn: asyncpg.Connection, table: str = TABLE) -> bool:
+    """Является ли таблица партиционированной"""
+    relkind = await conn.fetchval(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass($1)", table
+    )
+    return bool(relkind == "p")
+
+
+async def list_partitions(
+    conn: asyncpg.Connection, table: str = TABLE
+) -> List[Tuple[str, date]]:
+    """Помесячные партиции таблицы, отсортированные по месяцу"""
+    rows = await conn.fetch(
+        """
+        SELECT child.relname AS name
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.oid = to_regclass($1)
+        """,
+        table,
+    )
+    partitions = []
+    for row in rows:
+        month = parse_partition_month(row["name"])
+        if month is not None:
+            partitions.append((row["name"], month))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+async def ensure_month_partitions(
+    conn: asyncpg.Connection, first: date, last: date, table: str = TABLE
+) -> List[str]:
+    """Создание недостающих партиций для месяцев first..last включительно"""
+    existing = {name for name, _ in await list_partitions(conn, table)}
+    created = []
+    month = month_start(first)
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            start, end = month.isoformat(), add_months(month, 1).isoformat()
+            await conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {name}
+                PARTITION OF {table}
+                FOR VALUES FROM ('{start}') TO ('{end}')
+                """
+            )
+            created.append(name)
+        month = add_months(month, 1)
+
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+
+async def ensure_future_partitions(
+    conn: asyncpg.Connection, months_ahead: int = 3, table: str = TABLE
+) -> List[str]:
+    """Партиции на текущий месяц и months_ahead месяцев вперед"""
+    this_month = current_month()
+    return await ensure_month_partitions(
+        conn, this_month, add_months(this_month, months_ahead), table
+    )
+
+
+async def months_covered(conn: asyncpg.Connection, table: str = TABLE) -> int:
+    """Сколько месяцев подряд, начиная с текущего, уже имеют партиции"""
+    existing = {month for _, month in await list_partitions(conn, table)}
+    month, covered = current_month(), 0
+    while month in existing:
+        covered += 1
+        month = add_months(month, 1)
+    return covered
+
+
+async def check_partition_coverage(
+    conn: asyncpg.Connection, months_ahead: int, table: str = TABLE
+) -> Optional[int]:
+    """Запас партиций после текущего месяца; None - таблица не партиционирована.
+
+    Default-партиции нет, поэтому вставка в месяц без партиции падает. Если
+    запас меньше months_ahead (обслуживание выключено или отстает), это
+    ошибка в логе и метрика conversation_partitions_ahead - до того, как
+    начнут падать вставки. -1 значит, что нет даже текущего месяца.
+    """
+    if not await is_partitioned(conn, table):
+        return None
+    ahead = await months_covered(conn, table) - 1
+    CONVERSATION_PARTITIONS_AHEAD.set(ahead)
+    if ahead < months_ahead:
+        logger.error(
+            f"{table} has partitions for {ahead} month(s) ahead, "
+            f"expected {months_ahead}: inserts past the last partition will fail"
+        )
+    return ahead
+
+
+async def drop_partitions_before(
+    conn: asyncpg.Connection,
+    cutoff: date,
+    concurrently: bool = True,
+    table: str = TABLE,
+) -> List[str]:
+    """Отсоединение и удаление партиций, целиком лежащих раньше cutoff.
+
+    Вместо DELETE по всей таблице партиция целиком отсоединяется (DETACH
+    CONCURRENTLY не блокирует запись, PostgreSQL 14+) и удаляется.
+    Default-партиции у таблицы нет как раз ради DETACH CONCURRENTLY, поэтому
+    партиции на будущие месяцы должны создаваться заранее.
+    """
+    dropped = []
+    for name, month in await list_partitions(conn, table):
+        if add_months(month, 1) > cutoff:
+            continue
+        mode = " CONCURRENTLY" if concurrently else ""
+        await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name}{mode}")
+        await conn.execute(f"DROP TABLE {name}")
+        dropped.append(name)
+
+    if dropped:
+        logger.info(f"Dropped expired partitions: {', '.join(dropped)}")
+    return dropped
+
+
+async def drop_expired_partitions(
+    conn: asyncpg.Connection,
+    keep_months: int,
+    concurrently: bool = True,
+    table: str = TABLE,
+) -> List[str]:
+    """Удаление партиций старше keep_months месяцев"""
+    cutoff = add_months(current_month(), -keep_months)
+    return await drop_partitions_before(conn, cutoff, concurrently, table)
+
+
+async def create_index_online(
+    conn: asyncpg.Connection, name: str, definition: str, table: str = TABLE
+) -> None:
+    """Создание индекса без блокировки записи.
+
+    Для обычной таблицы - CREATE INDEX CONCURRENTLY. У партиционированной
+    так нельзя: индекс создается на самой таблице через ON ONLY (мгновенно,
+    пока невалиден), затем конкурентно на каждой партиции и присоединяется;
+    после присоединения всех партиций индекс становится валидным, а новые
+    партиции получают его автоматически.
+    """
+    if not await is_partitioned(conn, table):
+        await conn.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}"
+        )
+        return
+
+    await conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}"
+    )
+    for partition, _ in await list_partitions(conn, table):
+        index = f"{name}_{partition}"
+        if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", index):
+            continue
+        await conn.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} "
+            f"ON {partition} {definition}"
+        )
+        await conn.execute(f"ALTER INDEX {name} ATTACH PARTITION {index}")
+
+
+CREATE_SHADOW_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {SHADOW_TABLE} (
+    id INTEGER NOT NULL,
+    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+    message TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    communication_style VARCHAR(20) NOT NULL,
+    tokens_used INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    search_vector TSVECTOR,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_conversations_part_user_created
+    ON {SHADOW_TABLE} (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_part_created_at
+    ON {SHADOW_TABLE} (created_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_part_search
+    ON {SHADOW_TABLE} USING GIN (search_vector);
+"""
+
+# Зеркалирование изменений старой таблицы в новую на время переноса
+CREATE_MIRROR_TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION conversations_mirror() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {SHADOW_TABLE}
+        WHERE id = OLD.id AND created_at = COALESCE(OLD.created_at, NOW());
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {SHADOW_TABLE}
+            (id, user_id, message, bot_response, communication_style, tokens_used,
+             created_at, search_vector)
+        VALUES
+            (NEW.id, NEW.user_id, NEW.message, NEW.bot_response,
+             NEW.communication_style, NEW.tokens_used, COALESCE(NEW.created_at, NOW()),
+             NEW.search_vector)
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS conversations_mirror ON {TABLE};
+CREATE TRIGGER conversations_mirror
+    AFTER INSERT OR UPDATE OR DELETE ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION conversations_mirror();
+"""
+
+BACKFILL_BATCH_SQL = f"""
+INSERT INTO {SHADOW_TABLE}
+    (id, user_id, message, bot_response, communication_style, tokens_used,
+     created_at, search_vector)
+SELECT id, user_id, message, bot_response, communication_style, tokens_used,
+       COALESCE(created_at, NOW()),
+       COALESCE(search_vector, {SEARCH_VECTOR_SQL})
+FROM {TABLE}
+WHERE id > $1 AND id <= $2
+ON CONFLICT DO NOTHING
+"""
+
+
+@asynccontextmanager
+async def try_migration_lock(conn: asyncpg.Connection) -> AsyncIterator[bool]:
+    """Лок переноса без ожидания; False - перенос идет в другом сеансе"""
+    locked = bool(
+        await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID)
+    )
+    try:
+        yield locked
+    finally:
+        if locked:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def migrate_to_partitioned(
+    conn: asyncpg.Connection,
+    batch_size: int = 5000,
+    pause: float = 0.1,
+    months_ahead: int = 3,
+    lock_timeout: str = "5s",
+) -> None:
+    """Онлайн-перевод conversations в таблицу, партиционированную по created_at.
+
+    1. Создается теневая партиционированная таблица с помесячными партициями.
+    2. Триггер зеркалирует в нее все новые изменения старой таблицы.
+    3. Старые строки переносятся пачками по id, каждая пачка - отдельная
+       короткая транзакция; прогресс хранится в job_cursors, поэтому перенос
+       можно прервать и продолжить.
+    4. Таблицы переключаются переименованием в одной короткой транзакции.
+
+    Удаление строки, которую пачка уже прочитала, но еще не записала, не
+    зеркалируется. Поэтому перенос держит MIGRATION_LOCK_ID, и очистка
+    старых диалогов (MaintenanceService) на это время пропускается.
+    """
+    if await is_partitioned(conn):
+        logger.info(f"{TABLE} is already partitioned, nothing to migrate")
+        return
+
+    # Ждет окончания очистки, если она идет сейчас
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await _migrate(conn, batch_size, pause, months_ahead, lock_timeout)
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def _migrate(
+    conn: asyncpg.Connection,
+    batch_size: int,
+    pause: float,
+    months_ahead: int,
+    lock_timeout: str,
+) -> None:
+    await conn.execute(CREATE_SHADOW_TABLE_SQL)
+
+    oldest = await conn.fetchval(f"SELECT MIN(created_at) FROM {TABLE}")
+    first_month = month_start(oldest.date()) if oldest else current_month()
+    await ensure_month_partitions(
+        conn, first_month, add_months(current_month(), months_ahead), SHADOW_TABLE
+    )
+
+    # Триггер ставится до начала переноса: все, что вставлено после него,
+    # зеркалируется, все, что до - попадает в диапазон переноса
+    await conn.execute(CREATE_MIRROR_TRIGGER_SQL)
+    upper = await conn.fetchval(f"SELECT COALESCE(MAX(id), 0) FROM {TABLE}")
+
+    last_id, _ = await get_cursor(conn, MIGRATION_JOB)
+    cursor = last_id or 0
+    logger.info(
+        f"Backfilling {TABLE} ids ({cursor}, {upper}] in batches of {batch_size}"
+    )
+    while cursor < upper:
+        batch_end = min(cursor + batch_size, upper)
+        async with conn.transaction():
+            await conn.execute(BACKFILL_BATCH_SQL, cursor, batch_end)
+            await set_cursor(conn, MIGRATION_JOB, last_id=batch_end)
+        cursor = batch_end
+        await asyncio.sleep(pause)
+
+    await _swap_tables(conn, lock_timeout)
+    await clear_cursor(conn, MIGRATION_JOB)
+    logger.info(
+        f"{TABLE} is now partitioned by created_at; "
+        f"the previous table is kept as {OLD_TABLE} and can be dropped"
+    )
+
+
+async def _swap_tables(
+    conn: asyncpg.Connection, lock_timeout: str, attempts: int = 10
+) -> None:
+    """Переключение таблиц под коротким эксклюзивным локом"""
+    for attempt in range(1, attempts + 1):
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+                await conn.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+                sequence = await conn.fetchval(
+                    "SELECT pg_get_serial_sequence($1, 'id')", TABLE
+                )
+                await conn.execute(f"DROP TRIGGER conversations_mirror ON {TABLE}")
+                await conn.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+                await conn.execute(f"ALTER TABLE {SHADOW_TABLE} RENAME TO {TABLE}")
+                await conn.execute(
+                    f"ALTER TABLE {TABLE} ALTER COLUMN id "
+                    f"SET DEFAULT nextval('{sequence}'::regclass)"
+                )
+                await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id")
+            await conn.execute("DROP FUNCTION IF EXISTS conversations_mirror()")
+            return
+        except asyncpg.LockNotAvailableError:
+            logger.warning(f"Swap attempt {attempt}/{attempts} could not get the lock")
+            await asyncio.sleep(attempt)
+    raise RuntimeError(f"Could not lock {TABLE} to swap in the partitioned table")
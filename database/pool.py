@@ -0,0 +1,118 @@
+"""
+Пул соединений с телеметрией и адаптивным ограничением размера
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import asyncpg
+from loguru import logger
+
+from services.metrics import DB_POOL_ACQUIRE_SECONDS, DB_POOL_CONNECTIONS
+
+
+class MonitoredPool:
+    """Обертка над asyncpg.Pool: время ожидания, занятость и лимит.
+
+    asyncpg не умеет менять max_size работающего пула, поэтому адаптивный
+    режим ограничивает число одновременно выданных соединений воротами
+    перед пулом. Лимит растет, когда среднее ожидание за интервал выше
+    target_wait, и медленно снижается, когда пул простаивает; лишние
+    соединения закрываются пулом по max_inactive_connection_lifetime.
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        name: str,
+        min_size: int,
+        max_size: int,
+        adaptive: bool = False,
+        target_wait: float = 0.05,
+        adjust_interval: float = 10.0,
+    ) -> None:
+        self.pool = pool
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.adaptive = adaptive
+        self.target_wait = target_wait
+        self.adjust_interval = adjust_interval
+        self.limit = min_size if adaptive else max_size
+        self.in_use = 0
+
+        self._released = asyncio.Condition()
+        self._window_started = time.monotonic()
+        self._window_waits = 0.0
+        self._window_acquires = 0
+        self._window_peak = 0
+
+        gauges = {
+            "in_use": lambda: self.in_use,
+            "idle": self.pool.get_idle_size,
+            "limit": lambda: self.limit,
+            "max": lambda: self.max_size,
+        }
+        for state, value in gauges.items():
+            DB_POOL_CONNECTIONS.labels(name, state).set_function(value)
+
+    @asynccontextmanager
+    async def acquire(
+        self, timeout: Optional[float] = None
+    ) -> AsyncIterator[asyncpg.Connection]:
+        """Выдача соединения; timeout покрывает и ворота, и сам пул"""
+        started = time.monotonic()
+        if self.adaptive:
+            await asyncio.wait_for(self._enter(), timeout)
+        else:
+            self.in_use += 1
+        try:
+            remaining = None
+            if timeout is not None:
+                remaining = max(timeout - (time.monotonic() - started), 0.0)
+            async with self.pool.acquire(timeout=remaining) as conn:
+                self._observe(time.monotonic() - started)
+                yield conn
+        finally:
+            self.in_use -= 1
+            if self.adaptive:
+                # После роста лимита пропускаем сразу всех, кто помещается
+                async with self._released:
+                    self._released.notify(max(self.limit - self.in_use, 1))
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def _enter(self) -> None:
+        async with self._released:
+            await self._released.wait_for(lambda: self.in_use < self.limit)
+            self.in_use += 1
+
+    def _observe(self, wait: float) -> None:
+        DB_POOL_ACQUIRE_SECONDS.labels(self.name).observe(wait)
+        if not self.adaptive:
+            return
+        self._window_waits += wait
+        self._window_acquires += 1
+        self._window_peak = max(self._window_peak, self.in_use)
+        if time.monotonic() - self._window_started >= self.adjust_interval:
+            self._adjust()
+
+    def _adjust(self) -> None:
+        mean_wait = self._window_waits / max(self._window_acquires, 1)
+        limit = self.limit
+        if mean_wait > self.target_wait:
+            limit = min(self.max_size, limit + max(1, limit // 4))
+        elif mean_wait < self.target_wait / 4 and self._window_peak < limit // 2:
+            limit = max(self.min_size, limit - 1)
+        if limit != self.limit:
+            logger.info(
+                f"Pool {self.name} limit {self.limit} -> {limit} "
+                f"(mean wait {mean_wait * 1000:.1f}ms, peak {self._window_peak})"
+            )
+            self.limit = limit
+        self._window_started = time.monotonic()
+        self._window_waits = 0.0
+        self._window_acquires = 0
+        self._window_peak = 0
@@ -0,0 +1,164 @@
+"""
+Маршрутизация чтений на реплики PostgreSQL
+"""
+import asyncio
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+from loguru import logger
+
+from database.pool import MonitoredPool
+
+# Отставание реплики: 0, если все полученные WAL уже применены, иначе время с
+# последней примененной транзакции
+REPLICA_HEALTH_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+END AS lag
+"""
+
+# Ошибки, после которых реплика считается недоступной, а чтение повторяется
+# на основном сервере
+REPLICA_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.OperatorInterventionError,
+)
+
+PoolFactory = Callable[[str], Awaitable[MonitoredPool]]
+
+
+class Replica:
+    """Пул одной реплики и ее состояние"""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.pool: Optional[MonitoredPool] = None
+        self.healthy = False
+        self.lag = 0.0
+        self.error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        # Адрес без учетных данных для логов
+        return self.url.rsplit("@", 1)[-1]
+
+
+class ReplicaRouter:
+    """Выбор пула для чтения с защитой read-your-writes.
+
+    После записи пользователь на sticky_seconds закрепляется за основным
+    сервером. Реплика с отставанием больше max_lag или с ошибкой проверки
+    выводится из ротации до следующей успешной проверки.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        create_pool: PoolFactory,
+        sticky_seconds: float = 5.0,
+        max_lag: float = 5.0,
+        check_interval: float = 5.0,
+        check_timeout: float = 2.0,
+    ) -> None:
+        self.replicas = [Replica(url) for url in urls]
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self._create_pool = create_pool
+        self._sticky: Dict[int, float] = {}
+        self._round_robin = itertools.count()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        """Первая проверка реплик и запуск фоновых проверок"""
+        await self.check_all()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        """Остановка проверок и закрытие пулов реплик"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+
+    def mark_write(self, user_id: int) -> None:
+        """Закрепление пользователя за основным сервером после записи"""
+        self._sticky[user_id] = time.monotonic() + self.sticky_seconds
+
+    def is_sticky(self, user_id: int) -> bool:
+        expires = self._sticky.get(user_id)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._sticky[user_id]
+            return False
+        return True
+
+    def pick(self, user_id: Optional[int] = None) -> Optional[MonitoredPool]:
+        """Пул здоровой реплики или None, если читать нужно с основного"""
+        if user_id is not None and self.is_sticky(user_id):
+            return None
+        healthy = [r for r in self.replicas if r.healthy and r.pool is not None]
+        if not healthy:
+            return None
+        return healthy[next(self._round_robin) % len(healthy)].pool
+
+    def mark_down(self, pool: MonitoredPool, error: BaseException) -> None:
+        """Вывод реплики из ротации после ошибки чтения"""
+        for replica in self.replicas:
+            if replica.pool is pool and replica.healthy:
+                replica.healthy = False
+                logger.warning(f"Replica {replica.name} marked down: {error}")
+
+    async def check_all(self) -> None:
+        """Проверка доступности и отставания всех реплик"""
+        await asyncio.gather(*(self._check(r) for r in self.replicas))
+        now = time.monotonic()
+        self._sticky = {u: t for u, t in self._sticky.items() if t > now}
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_all()
+
+    async def _check(self, replica: Replica) -> None:
+        try:
+            if replica.pool is None:
+                replica.pool = await asyncio.wait_for(
+                    self._create_pool(replica.url), self.check_timeout
+                )
+            async with replica.pool.acquire(timeout=self.check_timeout) as conn:
+                replica.lag = float(
+                    await conn.fetchval(REPLICA_HEALTH_SQL, timeout=self.check_timeout)
+                )
+        except Exception as e:
+            # Повторяющаяся ошибка логируется один раз
+            if replica.healthy or str(e) != replica.error:
+                logger.warning(f"Replica {replica.name} health check failed: {e}")
+            replica.healthy = False
+            replica.error = str(e)
+            return
+
+        replica.error = None
+
+        healthy = replica.lag <= self.max_lag
+        if healthy != replica.healthy:
+            state = "back in rotation" if healthy else "lagging, out of rotation"
+            logger.info(f"Replica {replica.name} {state} (lag {replica.lag:.1f}s)")
+        replica.healthy = healthy
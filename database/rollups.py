@@ -0,0 +1,79 @@
+"""
+Инкрементальные дневные агрегаты по диалогам (стили и пользователи)
+"""
+import asyncio
+
+import asyncpg
+from loguru import logger
+
+from database.cursors import get_cursor, set_cursor
+
+ROLLUP_JOB = "usage_rollups"
+
+# Верхняя граница пачки - только строки старше settle-интервала, чтобы не
+# пропустить транзакцию, которая получила id раньше, а закоммитилась позже
+SETTLED_UPPER_BOUND_SQL = """
+SELECT MAX(id) FROM conversations
+WHERE id > $1 AND created_at < NOW() - make_interval(secs => $2)
+"""
+
+AGGREGATE_BATCH_SQL = """
+WITH batch AS (
+    SELECT user_id, communication_style, tokens_used,
+           created_at, (created_at AT TIME ZONE 'UTC')::date AS day
+    FROM conversations
+    WHERE id > $1 AND id <= $2
+), styles AS (
+    INSERT INTO style_daily_stats AS s
+        (day, communication_style, message_count, tokens_used)
+    SELECT day, communication_style, COUNT(*), COALESCE(SUM(tokens_used), 0)
+    FROM batch
+    GROUP BY day, communication_style
+    ON CONFLICT (day, communication_style) DO UPDATE
+    SET message_count = s.message_count + EXCLUDED.message_count,
+        tokens_used = s.tokens_used + EXCLUDED.tokens_used
+)
+INSERT INTO user_daily_stats AS u
+    (day, user_id, message_count, tokens_used, last_message)
+SELECT day, user_id, COUNT(*), COALESCE(SUM(tokens_used), 0), MAX(created_at)
+FROM batch
+WHERE user_id IS NOT NULL
+GROUP BY day, user_id
+ON CONFLICT (day, user_id) DO UPDATE
+SET message_count = u.message_count + EXCLUDED.message_count,
+    tokens_used = u.tokens_used + EXCLUDED.tokens_used,
+    last_message = GREATEST(u.last_message, EXCLUDED.last_message)
+"""
+
+
+async def aggregate_new_conversations(
+    conn: asyncpg.Connection,
+    batch_size: int = 10000,
+    settle_seconds: int = 60,
+    pause: float = 0.1,
+) -> int:
+    """Добавление в агрегаты диалогов, появившихся после прошлого запуска.
+
+    Стоимость зависит только от числа новых строк: диапазон id берется от
+    сохраненного курсора. Пачка и сдвиг курсора коммитятся вместе, поэтому
+    каждая строка учитывается ровно один раз. Возвращает номер последней
+    учтенной строки.
+    """
+    cursor, _ = await get_cursor(conn, ROLLUP_JOB)
+    cursor = cursor or 0
+    upper = await conn.fetchval(SETTLED_UPPER_BOUND_SQL, cursor, settle_seconds)
+    if upper is None:
+        return cursor
+
+    start = cursor
+    while cursor < upper:
+        batch_end = min(cursor + batch_size, upper)
+        async with conn.transaction():
+            await conn.execute(AGGREGATE_BATCH_SQL, cursor, batch_end)
+            await set_cursor(conn, ROLLUP_JOB, last_id=batch_end)
+        cursor = batch_end
+        if cursor < upper:
+            await asyncio.sleep(pause)
+
+    logger.debug(f"Rolled up conversations ({start}, {cursor}]")
+    return cursor
@@ -0,0 +1,116 @@
+"""
+Реестр горячих запросов, которые подготавливаются на каждом соединении пула
+"""
+from typing import Dict
+
+from database.models import STYLE_COUNTER_COLUMNS
+
+# Колонки, из которых собирается User
+USER_COLUMNS = (
+    "user_id, username, first_name, last_name, gender, bot_gender, "
+    "communication_style, consent_given, stop_words, persona, "
+    "created_at, updated_at, is_active"
+)
+
+# Колонки, из которых собирается UserStats
+USER_STATS_COLUMNS = (
+    "user_id, total_messages, total_tokens, favorite_style, "
+    "last_activity, created_at, updated_at, "
+    + ", ".join(STYLE_COUNTER_COLUMNS.values())
+)
+
+# Прибавка счетчика стиля $3 и пересчет любимого стиля по новым значениям.
+# В SET видны старые значения колонок, поэтому прибавка повторяется в VALUES;
+# при равенстве остается текущий любимый стиль
+_STYLE_INCREMENTS = {
+    column: f"{column} + ($3::text = '{style.value}')::int"
+    for style, column in STYLE_COUNTER_COLUMNS.items()
+}
+_STYLE_COUNTER_ASSIGNMENTS = ",\n".join(
+    f"{column} = {increment}" for column, increment in _STYLE_INCREMENTS.items()
+)
+_FAVORITE_STYLE_VALUES = ",\n".join(
+    f"('{style.value}', {_STYLE_INCREMENTS[column]})"
+    for style, column in STYLE_COUNTER_COLUMNS.items()
+)
+
+# Колонки, из которых собирается Conversation
+CONVERSATION_COLUMNS = (
+    "id, user_id, message, bot_response, communication_style, tokens_used, created_at"
+)
+
+STATEMENTS: Dict[str, str] = {
+    "get_user": f"SELECT {USER_COLUMNS} FROM users WHERE user_id = $1",
+    "insert_user": """
+        INSERT INTO users (user_id, username, first_name, last_name, gender, bot_gender,
+                           communication_style, consent_given, stop_words, persona)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+    """,
+    "insert_user_stats": "INSERT INTO user_stats (user_id) VALUES ($1)",
+    "update_user": """
+        UPDATE users SET username = $2, first_name = $3, last_name = $4,
+                         gender = $5, bot_gender = $6, communication_style = $7,
+                         consent_given = $8, stop_words = $9, persona = $10,
+                         updated_at = NOW()
+        WHERE user_id = $1
+    """,
+    "insert_conversation": """
+        INSERT INTO conversations (user_id, message, bot_response, communication_style,
+                                   tokens_used, search_vector)
+        VALUES ($1, $2, $3, $4, $5, to_tsvector('russian', $2::text || ' ' || $3::text))
+        RETURNING id, created_at
+    """,
+    "bump_user_stats": f"""
+        UPDATE user_stats SET total_messages = total_messages + 1,
+                              total_tokens = total_tokens + $2,
+                              {_STYLE_COUNTER_ASSIGNMENTS},
+                              favorite_style = (
+                                  SELECT v.style FROM (VALUES {_FAVORITE_STYLE_VALUES})
+                                      AS v(style, messages)
+                                  ORDER BY v.messages DESC,
+                                           v.style = favorite_style DESC
+                                  LIMIT 1
+                              ),
+                              last_activity = NOW(),
+                              updated_at = NOW()
+        WHERE user_id = $1
+    """,
+    "get_user_stats": f"SELECT {USER_STATS_COLUMNS} FROM user_stats WHERE user_id = $1",
+    "get_recent_conversations": f"""
+        SELECT {CONVERSATION_COLUMNS}
+        FROM conversations WHERE user_id = $1
+        ORDER BY created_at DESC LIMIT $2
+    """,
+    "get_conversations_page": f"""
+        SELECT {CONVERSATION_COLUMNS}
+        FROM conversations
+        WHERE user_id = $1 AND (created_at, id) > ($2, $3)
+        ORDER BY created_at, id LIMIT $4
+    """,
+    # Пользователи, удаленные до сброса счетчиков, пропускаются
+    "add_token_usage": """
+        INSERT INTO user_token_usage (user_id, day, tokens)
+        SELECT t.user_id, t.day, t.tokens
+        FROM unnest($1::bigint[], $2::date[], $3::bigint[]) AS t(user_id, day, tokens)
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.user_id = t.user_id)
+        ON CONFLICT (user_id, day)
+        DO UPDATE SET tokens = user_token_usage.tokens + EXCLUDED.tokens
+    """,
+    "get_conversations_by_ids": f"""
+        SELECT {CONVERSATION_COLUMNS}
+        FROM conversations WHERE user_id = $1 AND id = ANY($2::int[])
+    """,
+    # Фрагмент с совпадением размечается «», чтобы текст можно было
+    # экранировать перед отправкой в HTML
+    "search_conversations": f"""
+        SELECT {CONVERSATION_COLUMNS},
+               ts_rank_cd(search_vector, query) AS rank,
+               ts_headline('russian', message || ' — ' || bot_response, query,
+                           'StartSel=«, StopSel=», MaxWords=25, MinWords=10')
+                   AS headline
+        FROM conversations, websearch_to_tsquery('russian', $2) AS query
+        WHERE user_id = $1 AND search_vector @@ query
+        ORDER BY rank DESC, created_at DESC
+        LIMIT $3 OFFSET $4
+    """,
+}
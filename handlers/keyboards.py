@@ -1,3 +1,5 @@
+from typing import Optional
+
 from aiogram.types import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -180,3 +182,25 @@ def get_stop_keyboard() -> InlineKeyboardMarkup:
         ]
     )
     return keyboard
+
+
+def get_search_pagination_keyboard(
+    page: int, has_next: bool
+) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура листания результатов поиска"""
+    buttons = []
+    if page > 0:
+        buttons.append(
+            InlineKeyboardButton(
+                text="◀️ Назад", callback_data=f"search_page_{page - 1}"
+            )
+        )
+    if has_next:
+        buttons.append(
+            InlineKeyboardButton(
+                text="Дальше ▶️", callback_data=f"search_page_{page + 1}"
+            )
+        )
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
@@ -0,0 +1,120 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, Update, User
+from loguru import logger
+
+from services import deadline
+from services.flood_control import FLOOD_COOLDOWN_MESSAGE, FloodControl
+from services.metrics import DUPLICATE_UPDATES, FLOOD_CONTROL_UPDATES
+from services.openai_service import TIMEOUT_FALLBACK_MESSAGE
+from services.update_dedup import UpdateDeduplicator
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+
+async def _reply(event: TelegramObject, data: Dict[str, Any], text: str) -> None:
+    """Короткий ответ в чат, из которого пришел апдейт"""
+    if not isinstance(event, Update):
+        return
+    bot: Bot = data["bot"]
+    if event.message is not None:
+        await bot.send_message(event.message.chat.id, text)
+    elif event.callback_query is not None:
+        await bot.answer_callback_query(event.callback_query.id, text)
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """Пропуск апдейтов, которые Telegram доставил повторно.
+
+    Без него перезапуск бота или таймаут вебхука оборачивается вторым
+    запросом к OpenAI и дублем в conversations.
+    """
+
+    def __init__(self, deduplicator: UpdateDeduplicator) -> None:
+        self.deduplicator = deduplicator
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update) or not self.deduplicator.enabled:
+            return await handler(event, data)
+
+        if not await self.deduplicator.claim(event.update_id):
+            DUPLICATE_UPDATES.inc()
+            logger.info(f"Skipped redelivered update {event.update_id}")
+            return None
+        try:
+            return await handler(event, data)
+        except Exception:
+            await self.deduplicator.release(event.update_id)
+            raise
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Ограничение частоты апдейтов пользователя до любых обработчиков.
+
+    Апдейты сверх лимита FloodControl задерживаются или отбрасываются, не
+    доходя до БД, Redis-контекста и OpenAI. О первом отброшенном апдейте
+    серии пользователь получает одно предупреждение.
+    """
+
+    def __init__(self, flood_control: FloodControl) -> None:
+        self.flood_control = flood_control
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if user is None or not self.flood_control.enabled:
+            return await handler(event, data)
+
+        decision = await self.flood_control.check(user.id)
+        if decision.allowed:
+            if decision.wait > 0:
+                FLOOD_CONTROL_UPDATES.labels("queued").inc()
+                await asyncio.sleep(decision.wait)
+            return await handler(event, data)
+
+        FLOOD_CONTROL_UPDATES.labels("dropped").inc()
+        logger.debug(f"Dropped update of flooding user {user.id}")
+        if decision.notify:
+            try:
+                await _reply(event, data, FLOOD_COOLDOWN_MESSAGE)
+            except Exception as e:
+                logger.error(f"Failed to send flood notice: {e}")
+        return None
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    """Ограничение общего времени обработки апдейта.
+
+    Дедлайн кладется в contextvar, из него БД, Redis и OpenAI берут свои
+    таймауты. Если бюджет исчерпан, обработчик отменяется и пользователь
+    получает быстрый ответ-заглушку.
+    """
+
+    def __init__(self, budget: float) -> None:
+        self.budget = budget
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        token = deadline.start(self.budget)
+        try:
+            return await asyncio.wait_for(handler(event, data), self.budget)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update handling exceeded deadline of {self.budget}s")
+        finally:
+            deadline.reset(token)
+
+        await self._send_fallback(event, data)
+        return None
+
+    async def _send_fallback(self, event: TelegramObject, data: Dict[str, Any]) -> None:
+        """Отправка заглушки в чат, из которого пришел апдейт"""
+        try:
+            await _reply(event, data, TIMEOUT_FALLBACK_MESSAGE)
+        except Exception as e:
+            logger.error(f"Failed to send deadline fallback: {e}")
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 
 from aiogram import F, Router
@@ -9,7 +10,12 @@ from loguru import logger
 from database.connection import db
 from database.models import Conversation, User
 from handlers.keyboards import get_back_keyboard, get_stop_keyboard
-from services.openai_service import openai_service
+from services.memory_index import memory_index
+from services.openai_service import (
+    QUOTA_COOLDOWN_MESSAGE,
+    TIMEOUT_FALLBACK_MESSAGE,
+    openai_service,
+)
 
 router = Router()
 
@@ -112,10 +118,13 @@ async def handle_roleplay_message(message: Message, state: FSMContext) -> None:
         user.communication_style,
         user.gender,
         user.bot_gender,
-        user.stop_words,
+        stop_words=user.stop_words,
+        user_id=user_id,
     )
 
-    if bot_response:
+    if bot_response in (TIMEOUT_FALLBACK_MESSAGE, QUOTA_COOLDOWN_MESSAGE):
+        await message.answer(bot_response)
+    elif bot_response:
         await message.answer(bot_response)
 
         # Сохраняем диалог в базу
@@ -128,7 +137,11 @@ async def handle_roleplay_message(message: Message, state: FSMContext) -> None:
             tokens_used=len(message.text.split()) + len(bot_response.split()),
             created_at=datetime.now(),
         )
-        await db.save_conversation(conversation)
+        try:
+            await db.save_conversation(conversation)
+            await memory_index.add_conversation(conversation)
+        except asyncio.TimeoutError:
+            logger.warning(f"Roleplay turn of user {user_id} not persisted: timeout")
     else:
         await message.answer("Извини, произошла ошибка. Попробуй еще раз.")
 
@@ -116,12 +116,9 @@ async def change_gender(callback: CallbackQuery, state: FSMContext) -> None:
     gender = Gender(gender_value)
 
     user_id = callback.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.patch_user(user_id, gender=gender)
 
     if user:
-        user.gender = gender
-        await db.update_user(user)
-
         await callback.message.edit_text(
             f"✅ <b>Пол успешно изменен на: {gender.value}</b>",
             reply_markup=get_back_keyboard(),
@@ -147,12 +144,9 @@ async def change_bot_gender(callback: CallbackQuery, state: FSMContext) -> None:
     bot_gender = Gender(bot_gender_value)
 
     user_id = callback.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.patch_user(user_id, bot_gender=bot_gender)
 
     if user:
-        user.bot_gender = bot_gender
-        await db.update_user(user)
-
         await callback.message.edit_text(
             f"✅ <b>Пол бота успешно изменен на: {bot_gender.value}</b>",
             reply_markup=get_back_keyboard(),
@@ -176,12 +170,9 @@ async def change_style(callback: CallbackQuery, state: FSMContext) -> None:
     style = CommunicationStyle(style_value)
 
     user_id = callback.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.patch_user(user_id, communication_style=style)
 
     if user:
-        user.communication_style = style
-        await db.update_user(user)
-
         await callback.message.edit_text(
             f"✅ <b>Стиль общения успешно изменен на: {style.value}</b>",
             reply_markup=get_back_keyboard(),
@@ -205,29 +196,25 @@ async def change_stop_words(message: Message, state: FSMContext) -> None:
         return
 
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
-
-    if not user:
-        await message.answer("❌ Ошибка: пользователь не найден")
-        await state.clear()
-        return
-
     text = message.text.strip().lower()
 
     if text == "нет":
-        user.stop_words = []
-        await db.update_user(user)
+        stop_words = []
+    else:
+        # Разбираем стоп-слова
+        stop_words = [word.strip() for word in text.split(",") if word.strip()]
+
+    user = await db.patch_user(user_id, stop_words=stop_words)
+
+    if not user:
+        await message.answer("❌ Ошибка: пользователь не найден")
+    elif not stop_words:
         await message.answer(
             "✅ <b>Стоп-слова очищены</b>",
             reply_markup=get_back_keyboard(),
             parse_mode="HTML",
         )
     else:
-        # Разбираем стоп-слова
-        stop_words = [word.strip() for word in text.split(",") if word.strip()]
-        user.stop_words = stop_words
-        await db.update_user(user)
-
         words_text = ", ".join(stop_words)
         await message.answer(
             f"✅ <b>Стоп-слова установлены:</b>\n{words_text}",
@@ -1,11 +1,16 @@
+import asyncio
+import html
+import os
 import re
+import tempfile
 from datetime import datetime
+from typing import Optional, Set, Tuple
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+from aiogram.types import CallbackQuery, FSInputFile, InlineKeyboardMarkup, Message
 from loguru import logger
 
 from database.connection import db
@@ -18,14 +23,32 @@ from handlers.keyboards import (
     get_gender_selection_keyboard,
     get_main_menu_keyboard,
     get_roleplay_scenarios_keyboard,
+    get_search_pagination_keyboard,
     get_settings_keyboard,
     get_stop_keyboard,
 )
+from services import deadline, outbound
 from services.context_manager import context_manager
-from services.openai_service import openai_service
+from services.export import export_conversations
+from services.memory_index import memory_index
+from services.openai_service import (
+    QUOTA_COOLDOWN_MESSAGE,
+    TIMEOUT_FALLBACK_MESSAGE,
+    openai_service,
+)
 
 router = Router()
 
+# Результатов поиска на одной странице
+SEARCH_PAGE_SIZE = 5
+
+# Лимит Telegram на отправку документа ботом
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+# Пользователи, для которых выгрузка уже готовится, и сами фоновые задачи
+_exports_in_progress: Set[int] = set()
+_export_tasks: Set["asyncio.Task[None]"] = set()
+
 
 class UserStates(StatesGroup):
     """Состояния пользователя для FSM"""
@@ -74,6 +97,8 @@ async def cmd_help(message: Message) -> None:
 /help - Показать эту справку
 /settings - Настройки профиля
 /stats - Ваша статистика
+/export - Выгрузить историю диалогов
+/search - Поиск по прошлым диалогам
 
 <b>Возможности:</b>
 • 4 стиля общения: игривый, романтичный, страстный, загадочный
@@ -123,6 +148,67 @@ async def cmd_stats(message: Message) -> None:
     await message.answer(stats_text, parse_mode="HTML")
 
 
+@router.message(Command("export"))  # type: ignore[misc]
+async def cmd_export(message: Message) -> None:
+    """Выгрузка всей истории диалогов файлом"""
+    user_id = message.from_user.id
+    if user_id in _exports_in_progress:
+        await message.answer("⏳ Выгрузка уже готовится, подождите немного.")
+        return
+
+    _exports_in_progress.add(user_id)
+    await message.answer("📦 Готовлю выгрузку истории, пришлю файлом.")
+    # Выгрузка может идти дольше дедлайна апдейта, поэтому выполняется
+    # отдельной задачей
+    task = asyncio.create_task(_send_export(message.bot, message.chat.id, user_id))
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
+
+
+async def _send_export(bot: Bot, chat_id: int, user_id: int) -> None:
+    """Запись истории во временный файл и отправка документом"""
+    deadline.clear()
+    fd, path = tempfile.mkstemp(suffix=".jsonl.gz")
+    os.close(fd)
+    # Файл может подождать, пока уходят ответы в диалогах
+    with outbound.background():
+        try:
+            count = await export_conversations(user_id, path)
+            if count == 0:
+                await bot.send_message(chat_id, "📭 История диалогов пока пуста.")
+            elif os.path.getsize(path) > EXPORT_MAX_BYTES:
+                await bot.send_message(
+                    chat_id, "😔 История слишком большая для отправки одним файлом."
+                )
+            else:
+                await bot.send_document(
+                    chat_id,
+                    FSInputFile(path, filename=f"conversations_{user_id}.jsonl.gz"),
+                    caption=f"📦 Диалогов в выгрузке: {count}",
+                )
+            logger.info(f"Exported {count} conversations for user {user_id}")
+        except Exception as e:
+            logger.error(f"Failed to export conversations for user {user_id}: {e}")
+            await bot.send_message(chat_id, "😔 Не удалось подготовить выгрузку.")
+        finally:
+            _exports_in_progress.discard(user_id)
+            os.unlink(path)
+
+
+@router.message(Command("search"))  # type: ignore[misc]
+async def cmd_search(message: Message, state: FSMContext) -> None:
+    """Полнотекстовый поиск по прошлым диалогам"""
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2 or not args[1].strip():
+        await message.answer("Что ищем? Например: /search море отпуск")
+        return
+
+    query = args[1].strip()
+    await state.update_data(search_query=query)
+    text, keyboard = await _render_search_page(message.from_user.id, query, 0)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
 @router.message(F.text == "💬 Начать общение")  # type: ignore[misc]
 async def start_conversation(message: Message, state: FSMContext) -> None:
     """Начало общения с ботом"""
@@ -359,6 +445,10 @@ async def handle_conversation(message: Message, state: FSMContext) -> None:
         ranevskaya, ranevskaya_mood = detect_ranevskaya_mood(message.text)
         # Приоритет: если оба триггера, оба флага True, mood выбираем по приоритету (ranevskaya > poetic)
         mood = ranevskaya_mood if ranevskaya else poetic_mood
+        # Давние реплики, относящиеся к сообщению, вне окна контекста
+        memories = await memory_index.retrieve(user_id, message.text)
+        # Профиль предпочтений из счетчиков, без повторного разбора истории
+        preferences = await context_manager.get_user_preferences(user_id)
         # Формируем prompt через openai_service
         bot_response = await openai_service.generate_response(
             message.text,
@@ -370,13 +460,16 @@ async def handle_conversation(message: Message, state: FSMContext) -> None:
             poetic=poetic,
             mood=mood,
             ranevskaya=ranevskaya,
+            memories=memories,
+            profile_hint=preferences.prompt_hint(),
+            user_id=user_id,
         )
 
-        if bot_response:
+        if bot_response in (TIMEOUT_FALLBACK_MESSAGE, QUOTA_COOLDOWN_MESSAGE):
+            # Бюджет на апдейт или квота исчерпаны - заглушку не сохраняем
+            await message.answer(bot_response)
+        elif bot_response:
             await message.answer(bot_response)
-            await context_manager.add_message_to_context(
-                user_id, message.text, bot_response, user.communication_style.value
-            )
             conversation = Conversation(
                 id=0,
                 user_id=user_id,
@@ -386,7 +479,15 @@ async def handle_conversation(message: Message, state: FSMContext) -> None:
                 tokens_used=len(message.text.split()) + len(bot_response.split()),
                 created_at=datetime.now(),
             )
-            await db.save_conversation(conversation)
+            try:
+                await context_manager.add_message_to_context(
+                    user_id, message.text, bot_response, user.communication_style.value
+                )
+                await db.save_conversation(conversation)
+                await memory_index.add_conversation(conversation)
+            except asyncio.TimeoutError:
+                # Ответ уже отправлен, повторная заглушка пользователю не нужна
+                logger.warning(f"Conversation of user {user_id} not persisted: timeout")
         else:
             await message.answer("Извини, произошла ошибка. Попробуй еще раз.")
     else:
@@ -493,11 +594,7 @@ async def handle_style_selection(callback: CallbackQuery, state: FSMContext) ->
 async def handle_consent_yes(callback: CallbackQuery, state: FSMContext) -> None:
     """Обработка согласия на контент 18+"""
     user_id = callback.from_user.id
-    user = await db.get_user(user_id)
-
-    if user:
-        user.consent_given = True
-        await db.update_user(user)
+    await db.patch_user(user_id, consent_given=True)
 
     await callback.message.edit_text(
         "✅ Согласие получено! Теперь можно начинать общение.\n\n"
@@ -563,9 +660,9 @@ async def cmd_context_info(message: Message) -> None:
 📊 <b>Информация о контексте</b>
 
 💬 Сообщений в контексте: {len(context) // 2}
-🎭 Предпочитаемый стиль: {preferences['communication_style']}
-😊 Настроение: {preferences['mood']}
-📝 Темы: {', '.join(preferences['topics']) if preferences['topics'] else 'не определены'}
+🎭 Предпочитаемый стиль: {preferences.communication_style}
+😊 Настроение: {preferences.mood}
+📝 Темы: {', '.join(preferences.topics) if preferences.topics else 'не определены'}
 
 <i>Контекст автоматически очищается через час неактивности</i>
     """
@@ -577,10 +674,6 @@ async def cmd_context_info(message: Message) -> None:
 async def cmd_persona(message: Message, state: FSMContext) -> None:
     """Смена личности пользователя (default/poet)"""
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
-    if user is None:
-        await message.answer("Сначала зарегистрируйтесь через /start.")
-        return
     args = message.text.split()
     if len(args) < 2:
         await message.answer("Укажите личность: /persona poet или /persona default")
@@ -589,6 +682,44 @@ async def cmd_persona(message: Message, state: FSMContext) -> None:
     if persona not in ("default", "poet"):
         await message.answer("Доступные личности: default, poet")
         return
-    user.persona = persona
-    await db.update_user(user)
+    user = await db.patch_user(user_id, persona=persona)
+    if user is None:
+        await message.answer("Сначала зарегистрируйтесь через /start.")
+        return
     await message.answer(f"Личность бота теперь: {persona}")
+
+
+@router.callback_query(F.data.startswith("search_page_"))  # type: ignore[misc]
+async def handle_search_page(callback: CallbackQuery, state: FSMContext) -> None:
+    """Листание результатов поиска"""
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.answer("Поиск устарел, повторите /search")
+        return
+
+    page = int(callback.data.removeprefix("search_page_"))
+    text, keyboard = await _render_search_page(callback.from_user.id, query, page)
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
+
+
+async def _render_search_page(
+    user_id: int, query: str, page: int
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Текст и клавиатура одной страницы результатов"""
+    # Лишняя строка показывает, есть ли следующая страница
+    results = await db.search_conversations(
+        user_id, query, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE
+    )
+    has_next = len(results) > SEARCH_PAGE_SIZE
+    results = results[:SEARCH_PAGE_SIZE]
+
+    if not results:
+        return f"🔍 По запросу «{html.escape(query)}» ничего не нашлось.", None
+
+    lines = [f"🔍 <b>{html.escape(query)}</b> — страница {page + 1}\n"]
+    for result in results:
+        created = result.conversation.created_at.strftime("%d.%m.%Y %H:%M")
+        headline = html.escape(result.headline)
+        lines.append(f"🕐 <i>{created}</i>\n{headline}\n")
+    return "\n".join(lines), get_search_pagination_keyboard(page, has_next)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Разовое заполнение search_vector у диалогов, сохраненных до появления поиска.
+Идет пачками по id, прогресс хранится в job_cursors
+
+Запуск: python -m scripts.backfill_search_vectors --batch-size 5000
+"""
+import argparse
+import asyncio
+
+import asyncpg
+from loguru import logger
+
+from config.settings import settings
+from database.cursors import clear_cursor, get_cursor, set_cursor
+from database.partitions import SEARCH_VECTOR_SQL
+
+BACKFILL_JOB = "search_vector_backfill"
+
+BACKFILL_BATCH_SQL = f"""
+UPDATE conversations SET search_vector = {SEARCH_VECTOR_SQL}
+WHERE id > $1 AND id <= $2 AND search_vector IS NULL
+"""
+
+
+async def backfill(batch_size: int, pause: float) -> None:
+    """Заполнение поискового вектора для всех старых диалогов"""
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        cursor, _ = await get_cursor(conn, BACKFILL_JOB)
+        cursor = cursor or 0
+        # Новые строки получают вектор при вставке, поэтому достаточно дойти
+        # до максимального id на момент запуска
+        upper = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM conversations")
+        updated = 0
+        while cursor < upper:
+            batch_end = min(cursor + batch_size, upper)
+            async with conn.transaction():
+                status = await conn.execute(BACKFILL_BATCH_SQL, cursor, batch_end)
+                await set_cursor(conn, BACKFILL_JOB, last_id=batch_end)
+            updated += int(status.split()[-1])
+            cursor = batch_end
+            logger.info(f"Backfilled search vectors up to conversation {cursor}")
+            await asyncio.sleep(pause)
+
+        await clear_cursor(conn, BACKFILL_JOB)
+        logger.info(f"Search vectors backfilled for {updated} conversations")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--pause", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.pause))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Разовое заполнение счетчиков стилей и favorite_style в user_stats по истории
+conversations. Идет пачками по user_id, прогресс хранится в job_cursors
+
+Запуск: python -m scripts.backfill_style_counters --batch-size 1000
+"""
+import argparse
+import asyncio
+
+import asyncpg
+from loguru import logger
+
+from config.settings import settings
+from database.cursors import clear_cursor, get_cursor, set_cursor
+from database.models import STYLE_COUNTER_COLUMNS
+
+BACKFILL_JOB = "style_counters_backfill"
+
+BATCH_END_SQL = """
+SELECT MAX(user_id) FROM (
+    SELECT user_id FROM user_stats WHERE user_id > $1 ORDER BY user_id LIMIT $2
+) AS batch
+"""
+
+_COUNTS = ",\n".join(
+    f"COUNT(*) FILTER (WHERE communication_style = '{style.value}') AS {column}"
+    for style, column in STYLE_COUNTER_COLUMNS.items()
+)
+_ASSIGNMENTS = ",\n".join(
+    f"{column} = counts.{column}" for column in STYLE_COUNTER_COLUMNS.values()
+)
+_FAVORITE_VALUES = ",\n".join(
+    f"('{style.value}', counts.{column})"
+    for style, column in STYLE_COUNTER_COLUMNS.items()
+)
+
+BACKFILL_BATCH_SQL = f"""
+WITH counts AS (
+    SELECT user_id, {_COUNTS}
+    FROM conversations
+    WHERE user_id > $1 AND user_id <= $2
+    GROUP BY user_id
+)
+UPDATE user_stats SET
+    {_ASSIGNMENTS},
+    favorite_style = (
+        SELECT v.style FROM (VALUES {_FAVORITE_VALUES}) AS v(style, messages)
+        ORDER BY v.messages DESC, v.style = user_stats.favorite_style DESC
+        LIMIT 1
+    )
+FROM counts
+WHERE user_stats.user_id = counts.user_id
+"""
+
+
+async def backfill(batch_size: int, pause: float) -> None:
+    """Пересчет счетчиков стилей для всех пользователей"""
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        cursor, _ = await get_cursor(conn, BACKFILL_JOB)
+        cursor = cursor or 0
+        updated = 0
+        while True:
+            batch_end = await conn.fetchval(BATCH_END_SQL, cursor, batch_size)
+            if batch_end is None:
+                break
+            async with conn.transaction():
+                status = await conn.execute(BACKFILL_BATCH_SQL, cursor, batch_end)
+                await set_cursor(conn, BACKFILL_JOB, last_id=batch_end)
+            updated += int(status.split()[-1])
+            cursor = batch_end
+            logger.info(f"Backfilled style counters up to user {cursor}")
+            await asyncio.sleep(pause)
+
+        await clear_cursor(conn, BACKFILL_JOB)
+        logger.info(f"Style counters backfilled for {updated} users")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.pause))
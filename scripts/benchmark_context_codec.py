@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сериализации контекста в Redis: JSON против бинарного кодека.
+Генерирует синтетические контексты из 20 сообщений, как после долгого
+диалога, и сообщает средний размер значения на пользователя, оценку
+памяти на заданное число пользователей и время кодирования/декодирования
+
+Запуск: python -m scripts.benchmark_context_codec --users 100000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from loguru import logger
+
+from scripts.benchmark_search import VOCABULARY
+from services.context_codec import decode_context, encode_context
+
+# Число сообщений в контексте, как в ContextManager
+CONTEXT_MESSAGES = 20
+
+
+def make_context(rng: random.Random) -> List[Dict[str, str]]:
+    """Контекст из чередующихся реплик пользователя и бота"""
+    started = datetime.now() - timedelta(minutes=rng.randint(1, 60))
+    context = []
+    for i in range(CONTEXT_MESSAGES):
+        role = "user" if i % 2 == 0 else "assistant"
+        # Ответы бота заметно длиннее сообщений пользователя
+        words = rng.randint(3, 20) if role == "user" else rng.randint(20, 80)
+        context.append(
+            {
+                "role": role,
+                "content": " ".join(rng.choices(VOCABULARY, k=words)),
+                "timestamp": (started + timedelta(seconds=i * 30)).isoformat(),
+            }
+        )
+    return context
+
+
+def encode_json(context: List[Dict[str, str]]) -> bytes:
+    return json.dumps(context, ensure_ascii=False).encode("utf-8")
+
+
+def measure(
+    name: str,
+    contexts: List[List[Dict[str, str]]],
+    encode: Callable[[List[Dict[str, str]]], bytes],
+    decode: Callable[[bytes], object],
+    users: int,
+) -> None:
+    started = time.perf_counter()
+    blobs = [encode(context) for context in contexts]
+    encode_us = (time.perf_counter() - started) / len(contexts) * 1e6
+    started = time.perf_counter()
+    for blob in blobs:
+        decode(blob)
+    decode_us = (time.perf_counter() - started) / len(blobs) * 1e6
+
+    per_user = sum(len(blob) for blob in blobs) / len(blobs)
+    logger.info(
+        f"{name:<6} {per_user:8.0f} B/user, "
+        f"{per_user * users / 2**20:8.1f} MiB per {users} users, "
+        f"encode {encode_us:6.1f} us, decode {decode_us:6.1f} us"
+    )
+
+
+def run_benchmark(users: int, samples: int, seed: int) -> None:
+    rng = random.Random(seed)
+    contexts = [make_context(rng) for _ in range(samples)]
+    measure("json", contexts, encode_json, json.loads, users)
+    measure("codec", contexts, encode_context, decode_context, users)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--samples", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run_benchmark(args.users, args.samples, args.seed)
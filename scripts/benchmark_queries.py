@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк горячих запросов: инлайновый SQL + Enum(...) против реестра
+подготовленных запросов и единого слоя преобразования
+
+Запуск: python -m scripts.benchmark_queries --iterations 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import asyncpg
+from loguru import logger
+
+from config.settings import settings
+from database.connection import BotConnection, _init_connection
+from database.mapping import (
+    record_to_conversation,
+    record_to_user,
+    record_to_user_stats,
+)
+from database.migrations import migrate
+from database.models import CommunicationStyle, Conversation, Gender, User, UserStats
+
+BENCH_USER_ID = -424242
+
+
+def _legacy_user(row: asyncpg.Record) -> User:
+    return User(
+        user_id=row["user_id"],
+        username=row["username"],
+        first_name=row["first_name"],
+        last_name=row["last_name"],
+        gender=Gender(row["gender"]),
+        bot_gender=Gender(row["bot_gender"]),
+        communication_style=CommunicationStyle(row["communication_style"]),
+        consent_given=row["consent_given"],
+        stop_words=row["stop_words"] or [],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+        is_active=row["is_active"],
+    )
+
+
+def _legacy_stats(row: asyncpg.Record) -> UserStats:
+    return UserStats(
+        user_id=row["user_id"],
+        total_messages=row["total_messages"],
+        total_tokens=row["total_tokens"],
+        favorite_style=CommunicationStyle(row["favorite_style"]),
+        last_activity=row["last_activity"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
+def _legacy_conversation(row: asyncpg.Record) -> Conversation:
+    return Conversation(
+        id=row["id"],
+        user_id=row["user_id"],
+        message=row["message"],
+        bot_response=row["bot_response"],
+        communication_style=CommunicationStyle(row["communication_style"]),
+        tokens_used=row["tokens_used"],
+        created_at=row["created_at"],
+    )
+
+
+async def _legacy_path(conn: asyncpg.Connection) -> None:
+    """Запросы в том виде, в каком их слал DatabaseManager до реестра"""
+    row = await conn.fetchrow(
+        """
+        SELECT user_id, username, first_name, last_name, gender, bot_gender,
+               communication_style, consent_given, stop_words, created_at, updated_at,
+               is_active
+        FROM users WHERE user_id = $1
+        """,
+        BENCH_USER_ID,
+    )
+    _legacy_user(row)
+    row = await conn.fetchrow(
+        """
+        SELECT user_id, total_messages, total_tokens, favorite_style,
+               last_activity, created_at, updated_at
+        FROM user_stats WHERE user_id = $1
+        """,
+        BENCH_USER_ID,
+    )
+    _legacy_stats(row)
+    rows = await conn.fetch(
+        """
+        SELECT id, user_id, message, bot_response, communication_style, tokens_used,
+               created_at
+        FROM conversations WHERE user_id = $1
+        ORDER BY created_at DESC LIMIT $2
+        """,
+        BENCH_USER_ID,
+        10,
+    )
+    [_legacy_conversation(r) for r in rows]
+
+
+async def _prepared_path(conn: BotConnection) -> None:
+    """Запросы через реестр подготовленных запросов"""
+    record_to_user(await conn.statements["get_user"].fetchrow(BENCH_USER_ID))
+    record_to_user_stats(
+        await conn.statements["get_user_stats"].fetchrow(BENCH_USER_ID)
+    )
+    rows = await conn.statements["get_recent_conversations"].fetch(BENCH_USER_ID, 10)
+    [record_to_conversation(r) for r in rows]
+
+
+async def _seed(conn: asyncpg.Connection) -> None:
+    await migrate(conn)
+    await conn.execute(
+        """
+        INSERT INTO users (user_id, first_name) VALUES ($1, 'bench')
+        ON CONFLICT (user_id) DO NOTHING
+        """,
+        BENCH_USER_ID,
+    )
+    await conn.execute(
+        """
+        INSERT INTO user_stats (user_id) VALUES ($1) ON CONFLICT (user_id) DO NOTHING
+        """,
+        BENCH_USER_ID,
+    )
+    await conn.execute(
+        """
+        INSERT INTO conversations (user_id, message, bot_response, communication_style)
+        SELECT $1, 'Привет ' || i, 'Ответ ' || i, 'playful'
+        FROM generate_series(1, 20) i
+        """,
+        BENCH_USER_ID,
+    )
+
+
+async def _measure(
+    name: str,
+    pool: asyncpg.Pool,
+    body: Callable[[Any], Awaitable[None]],
+    iterations: int,
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    async with pool.acquire() as conn:
+        for _ in range(min(100, iterations)):  # прогрев
+            await body(conn)
+        cpu_start = time.process_time()
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await body(conn)
+            latencies.append(time.perf_counter() - started)
+        cpu = time.process_time() - cpu_start
+
+    latencies.sort()
+    # В одной итерации три запроса
+    result = {
+        "mean_ms": statistics.mean(latencies) / 3 * 1000,
+        "p50_ms": latencies[len(latencies) // 2] / 3 * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] / 3 * 1000,
+        "cpu_us": cpu / iterations / 3 * 1_000_000,
+    }
+    logger.info(
+        f"{name:<9} per query: mean {result['mean_ms']:.3f} ms, "
+        f"p50 {result['p50_ms']:.3f} ms, p95 {result['p95_ms']:.3f} ms, "
+        f"client CPU {result['cpu_us']:.1f} us"
+    )
+    return result
+
+
+async def run_benchmark(iterations: int) -> None:
+    """Сравнение двух путей на одной и той же базе"""
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        await _seed(conn)
+    finally:
+        await conn.close()
+
+    legacy_pool = await asyncpg.create_pool(
+        settings.database_url, min_size=1, max_size=1
+    )
+    prepared_pool = await asyncpg.create_pool(
+        settings.database_url,
+        min_size=1,
+        max_size=1,
+        connection_class=BotConnection,
+        init=_init_connection,
+    )
+    try:
+        legacy = await _measure("inline", legacy_pool, _legacy_path, iterations)
+        prepared = await _measure("prepared", prepared_pool, _prepared_path, iterations)
+        logger.info(
+            f"prepared/inline: latency x{prepared['mean_ms'] / legacy['mean_ms']:.2f}, "
+            f"CPU x{prepared['cpu_us'] / legacy['cpu_us']:.2f}"
+        )
+    finally:
+        await legacy_pool.close()
+        await prepared_pool.close()
+        conn = await asyncpg.connect(settings.database_url)
+        try:
+            await conn.execute("DELETE FROM users WHERE user_id = $1", BENCH_USER_ID)
+        finally:
+            await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.iterations))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк полнотекстового поиска по диалогам на синтетических данных.
+Строит отдельную таблицу bench_conversations той же формы, что и
+conversations, с тем же поисковым вектором и индексами, и замеряет
+задержку запроса /search для частых, редких и составных запросов
+
+Запуск: python -m scripts.benchmark_search --rows 10000000 --users 100000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Dict, List
+
+import asyncpg
+from loguru import logger
+
+from config.settings import settings
+from database.statements import STATEMENTS
+
+BENCH_TABLE = "bench_conversations"
+
+# Словарь синтетических сообщений. Слова выбираются со смещением к началу
+# списка, как в живой речи: первые слова частые, последние редкие
+VOCABULARY = (
+    "привет как дела что делаешь скучаю тебя меня люблю хочу думаю знаю "
+    "сегодня завтра вечером утром ночью погода солнце дождь море пляж отпуск "
+    "работа начальник проект встреча кофе чай ужин ресторан кино фильм музыка "
+    "песня книга стихи прогулка парк город поезд самолет путешествие горы лес "
+    "кошка собака подарок цветы розы свидание поцелуй улыбка глаза голос мечта "
+    "секрет загадка тайна страсть нежность романтика шутка смех праздник день "
+    "рождения новый год весна лето осень зима снег звезды луна закат рассвет "
+    "океан остров маяк корабль парус ветер волна берег ракушка жемчуг янтарь "
+    "вишня клубника шоколад мороженое вино шампанское свечи камин плед"
+).split()
+
+CREATE_BENCH_TABLE_SQL = f"""
+DROP TABLE IF EXISTS {BENCH_TABLE};
+CREATE TABLE {BENCH_TABLE} (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    message TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    communication_style VARCHAR(20) NOT NULL DEFAULT 'playful',
+    tokens_used INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    search_vector TSVECTOR
+);
+"""
+
+# Фраза из 4-15 слов; ссылка на g делает подзапрос коррелированным, иначе
+# он вычислится один раз на весь INSERT
+_PHRASE = """(
+    SELECT string_agg(($3::text[])[1 + floor(power(random(), 3) * $4)::int], ' ')
+    FROM generate_series(1, 4 + (g % 12))
+)"""
+
+FILL_CHUNK_SQL = f"""
+INSERT INTO {BENCH_TABLE} (user_id, message, bot_response, created_at, search_vector)
+SELECT user_id, message, bot_response, created_at,
+       to_tsvector('russian', message || ' ' || bot_response)
+FROM (
+    SELECT 1 + floor(random() * $2)::bigint AS user_id,
+           {_PHRASE} AS message,
+           {_PHRASE} AS bot_response,
+           NOW() - random() * INTERVAL '90 days' AS created_at
+    FROM generate_series(1, $1) AS g
+) AS rows
+"""
+
+CREATE_BENCH_INDEXES_SQL = f"""
+CREATE INDEX ON {BENCH_TABLE} USING GIN (search_vector);
+CREATE INDEX ON {BENCH_TABLE} (user_id, created_at DESC);
+ANALYZE {BENCH_TABLE};
+"""
+
+SEARCH_SQL = STATEMENTS["search_conversations"].replace(
+    "FROM conversations", f"FROM {BENCH_TABLE}"
+)
+
+QUERIES = {
+    "common": VOCABULARY[1],
+    "rare": VOCABULARY[-3],
+    "two words": f"{VOCABULARY[20]} {VOCABULARY[60]}",
+    "phrase": f'"{VOCABULARY[0]} {VOCABULARY[1]}"',
+}
+
+
+async def fill(conn: asyncpg.Connection, rows: int, users: int, chunk: int) -> None:
+    """Генерация синтетических диалогов пачками"""
+    await conn.execute(CREATE_BENCH_TABLE_SQL)
+    started = time.monotonic()
+    done = 0
+    while done < rows:
+        size = min(chunk, rows - done)
+        await conn.execute(
+            FILL_CHUNK_SQL, size, users, VOCABULARY, len(VOCABULARY), timeout=None
+        )
+        done += size
+        logger.info(f"Generated {done}/{rows} rows")
+    await conn.execute(CREATE_BENCH_INDEXES_SQL, timeout=None)
+    logger.info(f"Data and indexes ready in {time.monotonic() - started:.0f}s")
+
+
+async def measure(
+    conn: asyncpg.Connection, query: str, users: int, iterations: int
+) -> Dict[str, float]:
+    """Задержка поиска для случайных пользователей"""
+    statement = await conn.prepare(SEARCH_SQL)
+    # Из плана нужен только способ доступа к таблице
+    plan_rows = await conn.fetch(f"EXPLAIN {SEARCH_SQL}", 1, query, 6, 0)
+    plan = next((row[0] for row in plan_rows if "Scan" in row[0]), plan_rows[0][0])
+    latencies: List[float] = []
+    for _ in range(iterations):
+        user_id = random.randint(1, users)
+        started = time.perf_counter()
+        await statement.fetch(user_id, query, 6, 0)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "plan": plan,
+    }
+
+
+async def run_benchmark(
+    rows: int, users: int, iterations: int, chunk: int, reuse: bool, keep: bool
+) -> None:
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        if not (reuse and await conn.fetchval("SELECT to_regclass($1)", BENCH_TABLE)):
+            await fill(conn, rows, users, chunk)
+        total = await conn.fetchval(f"SELECT COUNT(*) FROM {BENCH_TABLE}")
+        logger.info(f"Benchmarking search over {total} rows, {users} users")
+        for name, query in QUERIES.items():
+            result = await measure(conn, query, users, iterations)
+            logger.info(
+                f"{name:<10} {query!r}: p50 {result['p50_ms']:.2f} ms, "
+                f"p95 {result['p95_ms']:.2f} ms, mean {result['mean_ms']:.2f} ms "
+                f"[{result['plan'].strip()}]"
+            )
+    finally:
+        if not keep:
+            await conn.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--chunk", type=int, default=500_000)
+    parser.add_argument("--reuse", action="store_true", help="не пересоздавать данные")
+    parser.add_argument("--keep", action="store_true", help="не удалять таблицу")
+    args = parser.parse_args()
+    asyncio.run(
+        run_benchmark(
+            args.rows, args.users, args.iterations, args.chunk, args.reuse, args.keep
+        )
+    )
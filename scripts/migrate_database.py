@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Миграции схемы базы данных перед выкладкой
+
+    python -m scripts.migrate_database status
+    python -m scripts.migrate_database upgrade [--target 5]
+"""
+import argparse
+import asyncio
+
+import asyncpg
+from loguru import logger
+
+from config.settings import settings
+from database.migrations import (
+    LATEST_VERSION,
+    current_version,
+    migrate,
+    pending_migrations,
+)
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Выполнение выбранной команды"""
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        if args.command == "status":
+            version = await current_version(conn)
+            logger.info(f"Версия схемы: {version}, последняя: {LATEST_VERSION}")
+            for migration in pending_migrations(version):
+                logger.info(f"Ожидает: {migration.version} {migration.name}")
+        elif args.command == "upgrade":
+            applied = await migrate(conn, target=args.target)
+            if applied:
+                logger.info(f"Применены миграции: {applied}")
+            else:
+                logger.info("Схема актуальна")
+    except Exception as e:
+        logger.error(f"Ошибка миграции: {e}")
+        raise
+    finally:
+        await conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="текущая версия и ожидающие миграции")
+
+    upgrade = subparsers.add_parser("upgrade", help="применение миграций")
+    upgrade.add_argument("--target", type=int, default=None)
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
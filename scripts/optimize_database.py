@@ -3,12 +3,16 @@
 Скрипт для оптимизации базы данных для масштабирования
 """
 import asyncio
-from datetime import datetime, timedelta
 
 import asyncpg
 from loguru import logger
 
 from config.settings import settings
+from database.partitions import (
+    ensure_future_partitions,
+    is_partitioned,
+    list_partitions,
+)
 
 
 async def optimize_database() -> None:
@@ -26,13 +30,13 @@ async def optimize_database() -> None:
         # 2. Создание дополнительных индексов
         await create_optimized_indexes(conn)
 
-        # 3. Создание материализованного представления для статистики
+        # 3. Создание представлений отчетов по дневным агрегатам
         await create_materialized_views(conn)
 
         # 4. Настройка автовакуума
         await configure_autovacuum(conn)
 
-        # 5. Создание функции для очистки старых данных
+        # 5. Создание функций обслуживания
         await create_cleanup_functions(conn)
 
         logger.info("Оптимизация базы данных завершена!")
@@ -45,39 +49,17 @@ async def optimize_database() -> None:
 
 
 async def create_conversations_partitions(conn: asyncpg.Connection) -> None:
-    """Создание партиций для таблицы conversations"""
+    """Создание партиций для таблицы conversations на год вперед"""
 
-    # Создаем партиции по месяцам
-    current_date = datetime.now()
-
-    for i in range(12):  # Создаем партиции на год вперед
-        partition_date = current_date + timedelta(days=30 * i)
-        partition_name = f"conversations_{partition_date.strftime('%Y_%m')}"
-
-        # Создаем партицию
-        await conn.execute(
-            f"""
-            CREATE TABLE IF NOT EXISTS {partition_name} 
-            PARTITION OF conversations 
-            FOR VALUES FROM ('{partition_date.strftime('%Y-%m-01')}') 
-            TO ('{(partition_date + timedelta(days=30)).strftime('%Y-%m-01')}')
-        """
-        )
-
-        # Создаем индексы для партиции
-        await conn.execute(
-            f"""
-            CREATE INDEX IF NOT EXISTS idx_{partition_name}_user_id 
-            ON {partition_name} (user_id)
-        """
+    # Партиции можно создавать только у партиционированной таблицы
+    if not await is_partitioned(conn):
+        logger.warning(
+            "Таблица conversations не партиционирована, пропускаем. "
+            "Для перевода: python -m scripts.partition_conversations migrate"
         )
+        return
 
-        await conn.execute(
-            f"""
-            CREATE INDEX IF NOT EXISTS idx_{partition_name}_created_at 
-            ON {partition_name} (created_at)
-        """
-        )
+    await ensure_future_partitions(conn, months_ahead=12)
 
     logger.info("Партиции для conversations созданы")
 
@@ -113,18 +95,27 @@ async def create_optimized_indexes(conn: asyncpg.Connection) -> None:
 
 
 async def create_materialized_views(conn: asyncpg.Connection) -> None:
-    """Создание материализованных представлений"""
+    """Создание представлений отчетов поверх дневных агрегатов.
+
+    Раньше это были материализованные представления, которые при каждом
+    обновлении заново агрегировали 7-30 дней conversations. Теперь отчеты
+    читают маленькие таблицы style_daily_stats и user_daily_stats, которые
+    MaintenanceService пополняет только новыми строками.
+    """
+
+    await conn.execute("DROP MATERIALIZED VIEW IF EXISTS popular_styles")
+    await conn.execute("DROP MATERIALIZED VIEW IF EXISTS active_users")
 
     # Представление для популярных стилей общения
     await conn.execute(
         """
-        CREATE MATERIALIZED VIEW IF NOT EXISTS popular_styles AS
-        SELECT 
+        CREATE OR REPLACE VIEW popular_styles AS
+        SELECT
             communication_style,
-            COUNT(*) as usage_count,
-            AVG(tokens_used) as avg_tokens
-        FROM conversations 
-        WHERE created_at >= NOW() - INTERVAL '30 days'
+            SUM(message_count) as usage_count,
+            SUM(tokens_used)::float / NULLIF(SUM(message_count), 0) as avg_tokens
+        FROM style_daily_stats
+        WHERE day >= CURRENT_DATE - 30
         GROUP BY communication_style
         ORDER BY usage_count DESC
     """
@@ -133,37 +124,43 @@ async def create_materialized_views(conn: asyncpg.Connection) -> None:
     # Представление для активных пользователей
     await conn.execute(
         """
-        CREATE MATERIALIZED VIEW IF NOT EXISTS active_users AS
-        SELECT 
+        CREATE OR REPLACE VIEW active_users AS
+        SELECT
             u.user_id,
             u.first_name,
-            COUNT(c.id) as message_count,
-            MAX(c.created_at) as last_message
-        FROM users u
-        LEFT JOIN conversations c ON u.user_id = c.user_id
-        WHERE u.is_active = true 
-        AND c.created_at >= NOW() - INTERVAL '7 days'
+            SUM(d.message_count) as message_count,
+            MAX(d.last_message) as last_message
+        FROM user_daily_stats d
+        JOIN users u ON u.user_id = d.user_id
+        WHERE u.is_active = true
+        AND d.day >= CURRENT_DATE - 7
         GROUP BY u.user_id, u.first_name
         ORDER BY message_count DESC
     """
     )
 
-    logger.info("Материализованные представления созданы")
+    logger.info("Представления отчетов созданы")
 
 
 async def configure_autovacuum(conn: asyncpg.Connection) -> None:
     """Настройка автовакуума для оптимизации"""
 
-    # Настройки автовакуума для таблицы conversations
-    await conn.execute(
+    # Настройки автовакуума для таблицы conversations. У партиционированной
+    # таблицы параметры хранения задаются на каждой партиции
+    if await is_partitioned(conn):
+        tables = [name for name, _ in await list_partitions(conn)]
+    else:
+        tables = ["conversations"]
+    for table in tables:
+        await conn.execute(
+            f"""
+            ALTER TABLE {table} SET (
+                autovacuum_vacuum_scale_factor = 0.1,
+                autovacuum_analyze_scale_factor = 0.05,
+                autovacuum_vacuum_cost_limit = 2000
+            )
         """
-        ALTER TABLE conversations SET (
-            autovacuum_vacuum_scale_factor = 0.1,
-            autovacuum_analyze_scale_factor = 0.05,
-            autovacuum_vacuum_cost_limit = 2000
         )
-    """
-    )
 
     # Настройки для таблицы users
     await conn.execute(
@@ -181,102 +178,18 @@ async def configure_autovacuum(conn: asyncpg.Connection) -> None:
 async def create_cleanup_functions(conn: asyncpg.Connection) -> None:
     """Создание функций для очистки старых данных"""
 
-    # Функция для очистки старых диалогов
-    await conn.execute(
-        """
-        CREATE OR REPLACE FUNCTION cleanup_old_conversations(days_to_keep INTEGER DEFAULT 90)
-        RETURNS INTEGER AS $$
-        DECLARE
-            deleted_count INTEGER;
-        BEGIN
-            DELETE FROM conversations 
-            WHERE created_at < NOW() - INTERVAL '1 day' * days_to_keep;
-            
-            GET DIAGNOSTICS deleted_count = ROW_COUNT;
-            RETURN deleted_count;
-        END;
-        $$ LANGUAGE plpgsql;
-    """
-    )
+    # Очистка старых диалогов выполняется пачками в MaintenanceService,
+    # прежняя функция с одним большим DELETE удаляется
+    await conn.execute("DROP FUNCTION IF EXISTS cleanup_old_conversations(INTEGER)")
 
-    # Функция для архивирования неактивных пользователей
-    await conn.execute(
-        """
-        CREATE OR REPLACE FUNCTION archive_inactive_users(days_inactive INTEGER DEFAULT 30)
-        RETURNS INTEGER AS $$
-        DECLARE
-            archived_count INTEGER;
-        BEGIN
-            UPDATE users 
-            SET is_active = false 
-            WHERE user_id IN (
-                SELECT u.user_id 
-                FROM users u 
-                LEFT JOIN conversations c ON u.user_id = c.user_id 
-                WHERE c.created_at IS NULL 
-                   OR c.created_at < NOW() - INTERVAL '1 day' * days_inactive
-            );
-            
-            GET DIAGNOSTICS archived_count = ROW_COUNT;
-            RETURN archived_count;
-        END;
-        $$ LANGUAGE plpgsql;
-    """
-    )
+    # Архивирование неактивных пользователей выполняется пачками по
+    # user_stats.last_activity в MaintenanceService. Прежняя функция
+    # соединяла users со всеми диалогами и отключала любого пользователя,
+    # у которого есть хотя бы одно старое сообщение
+    await conn.execute("DROP FUNCTION IF EXISTS archive_inactive_users(INTEGER)")
 
     logger.info("Функции очистки созданы")
 
 
-async def create_scheduled_jobs() -> None:
-    """Создание запланированных задач"""
-
-    conn = await asyncpg.connect(settings.database_url)
-
-    try:
-        # Создаем расширение для планировщика
-        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_cron")
-
-        # Задача для обновления материализованных представлений
-        await conn.execute(
-            """
-            SELECT cron.schedule(
-                'update-popular-styles',
-                '0 */6 * * *',  -- Каждые 6 часов
-                'REFRESH MATERIALIZED VIEW popular_styles'
-            );
-        """
-        )
-
-        # Задача для очистки старых данных
-        await conn.execute(
-            """
-            SELECT cron.schedule(
-                'cleanup-old-data',
-                '0 2 * * 0',  -- Каждое воскресенье в 2:00
-                'SELECT cleanup_old_conversations(90)'
-            );
-        """
-        )
-
-        # Задача для архивирования неактивных пользователей
-        await conn.execute(
-            """
-            SELECT cron.schedule(
-                'archive-inactive-users',
-                '0 3 * * 0',  -- Каждое воскресенье в 3:00
-                'SELECT archive_inactive_users(30)'
-            );
-        """
-        )
-
-        logger.info("Запланированные задачи созданы")
-
-    except Exception as e:
-        logger.warning(f"Не удалось создать запланированные задачи: {e}")
-    finally:
-        await conn.close()
-
-
 if __name__ == "__main__":
     asyncio.run(optimize_database())
-    asyncio.run(create_scheduled_jobs())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Перевод таблицы conversations на помесячные партиции и обслуживание партиций
+
+    python -m scripts.partition_conversations migrate --batch-size 5000
+    python -m scripts.partition_conversations ensure --months-ahead 3
+    python -m scripts.partition_conversations drop-expired --keep-months 3
+"""
+import argparse
+import asyncio
+
+import asyncpg
+from loguru import logger
+
+from config.settings import settings
+from database.partitions import (
+    drop_expired_partitions,
+    ensure_future_partitions,
+    migrate_to_partitioned,
+)
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Выполнение выбранной команды"""
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        if args.command == "migrate":
+            await migrate_to_partitioned(
+                conn,
+                batch_size=args.batch_size,
+                pause=args.pause,
+                months_ahead=args.months_ahead,
+            )
+        elif args.command == "ensure":
+            await ensure_future_partitions(conn, months_ahead=args.months_ahead)
+        elif args.command == "drop-expired":
+            await drop_expired_partitions(
+                conn,
+                keep_months=args.keep_months,
+                concurrently=not args.no_concurrently,
+            )
+    except Exception as e:
+        logger.error(f"Ошибка при работе с партициями: {e}")
+        raise
+    finally:
+        await conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="онлайн-перевод на партиции")
+    migrate.add_argument("--batch-size", type=int, default=5000)
+    migrate.add_argument("--pause", type=float, default=0.1)
+    migrate.add_argument("--months-ahead", type=int, default=3)
+
+    ensure = subparsers.add_parser("ensure", help="создание будущих партиций")
+    ensure.add_argument("--months-ahead", type=int, default=3)
+
+    drop = subparsers.add_parser("drop-expired", help="удаление старых партиций")
+    drop.add_argument("--keep-months", type=int, default=3)
+    drop.add_argument("--no-concurrently", action="store_true")
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
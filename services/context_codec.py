@@ -0,0 +1,112 @@
+"""
+Компактная бинарная сериализация контекста диалога для Redis
+"""
+import json
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Union, cast
+
+# Формат: байт версии, байт флагов, затем (возможно сжатое) тело:
+# varint число сообщений и для каждого - байт роли, uint32 время в секундах
+# эпохи (0 - без времени), varint длина и UTF-8 текст
+CODEC_VERSION = 1
+FLAG_ZLIB = 0x01
+
+# Тело короче порога не сжимается: zlib на коротких строках не выигрывает
+COMPRESS_THRESHOLD = 512
+
+ROLES = ("user", "assistant", "system")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+_HEADER = struct.Struct(">BB")
+_MESSAGE = struct.Struct(">BI")
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _to_epoch(timestamp: Any) -> int:
+    if not timestamp:
+        return 0
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+
+def encode_context(context: List[Dict[str, Any]]) -> bytes:
+    """Кодирование списка сообщений {role, content, timestamp}"""
+    body = bytearray()
+    _write_varint(body, len(context))
+    for message in context:
+        role = message.get("role", "user")
+        if role not in _ROLE_CODES:
+            raise ValueError(f"Unsupported context role: {role}")
+        content = message.get("content", "").encode("utf-8")
+        body += _MESSAGE.pack(_ROLE_CODES[role], _to_epoch(message.get("timestamp")))
+        _write_varint(body, len(content))
+        body += content
+
+    flags = 0
+    payload = bytes(body)
+    if len(payload) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            flags |= FLAG_ZLIB
+            payload = compressed
+    return _HEADER.pack(CODEC_VERSION, flags) + payload
+
+
+def decode_context(data: Union[bytes, str]) -> List[Dict[str, str]]:
+    """Декодирование контекста; старые JSON-значения читаются как есть.
+
+    Ошибки формата поднимаются как ValueError (json.JSONDecodeError тоже
+    его подкласс).
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if data[:1] == b"[":
+        legacy = json.loads(data)
+        if not isinstance(legacy, list):
+            raise ValueError("Context JSON is not a list")
+        return cast(List[Dict[str, str]], legacy)
+
+    try:
+        version, flags = _HEADER.unpack_from(data)
+        if version != CODEC_VERSION:
+            raise ValueError(f"Unknown context codec version: {version}")
+        body = data[_HEADER.size :]
+        if flags & FLAG_ZLIB:
+            body = zlib.decompress(body)
+
+        count, pos = _read_varint(body, 0)
+        context: List[Dict[str, str]] = []
+        for _ in range(count):
+            role, epoch = _MESSAGE.unpack_from(body, pos)
+            length, pos = _read_varint(body, pos + _MESSAGE.size)
+            if pos + length > len(body):
+                raise ValueError("Truncated context value")
+            message = {
+                "role": ROLES[role],
+                "content": body[pos : pos + length].decode("utf-8"),
+            }
+            if epoch:
+                message["timestamp"] = datetime.fromtimestamp(epoch).isoformat()
+            context.append(message)
+            pos += length
+    except (struct.error, IndexError, zlib.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Corrupted context value: {e}") from e
+    return context
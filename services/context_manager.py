@@ -1,16 +1,30 @@
 """
 Сервис для управления контекстом диалогов с оптимизацией для масштабирования
 """
+import asyncio
 import hashlib
-import json
+import os
+import uuid
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
-import redis
 from loguru import logger
+from redis.asyncio.client import Pipeline
 
 from config.settings import settings
 from database.models import Conversation
+from services import deadline
+from services.context_store import CONTEXT_INVALIDATION_CHANNEL, ContextStore
+from services.local_cache import LocalCache
+from services.metrics import CONTEXT_CACHE_REQUESTS, CONTEXT_CACHE_SIZE
+from services.preferences import PreferenceProfile, detect_preferences
+from services.redis_shards import RedisShards
+
+# Сообщений в активном контексте
+CONTEXT_MAX_MESSAGES = 20
+
+# Версия и сообщения контекста
+VersionedContext = Tuple[int, List[Dict[str, Any]]]
 
 
 class ContextManager:
@@ -20,13 +34,95 @@ class ContextManager:
         # Проверяем, что settings не None
         if settings is None:
             raise RuntimeError("Settings not initialized")
-        self.redis_client = redis.from_url(settings.redis_url)
-        self.context_ttl = 3600  # 1 час для активного контекста
-        self.summary_ttl = 86400 * 7  # 7 дней для сводок
+        self.redis = RedisShards(settings)
+        self.redis_timeout = settings.redis_timeout
+        # Сроки жизни продлеваются при чтении, а не только при перезаписи
+        self.context_ttl = settings.context_ttl
+        self.summary_ttl = settings.summary_ttl
+        self.preferences_ttl = settings.preferences_ttl
+
+        # Локальный кеш декодированных контекстов. Используется только пока
+        # есть подписка на инвалидации на всех шардах, иначе запись с другой
+        # реплики осталась бы незамеченной
+        self.cache_enabled = settings.context_cache_enabled
+        self.cache: LocalCache[VersionedContext] = LocalCache(
+            settings.context_cache_max_bytes, settings.context_cache_ttl
+        )
+        self._instance_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.store = ContextStore(
+            self.redis, self.context_ttl, self.redis_timeout, self._instance_id
+        )
+        self._subscribed: Set[int] = set()
+        self._listeners: List["asyncio.Task[None]"] = []
 
-    def _get_context_key(self, user_id: int) -> str:
-        """Генерация ключа для контекста пользователя"""
-        return f"context:{user_id}"
+        gauges = {
+            "entries": lambda: len(self.cache),
+            "bytes": lambda: self.cache.size,
+            "hit_ratio": lambda: self.cache.hit_ratio,
+        }
+        for stat, value in gauges.items():
+            CONTEXT_CACHE_SIZE.labels(stat).set_function(value)
+
+    def start(self) -> None:
+        """Запуск подписок на инвалидации, включающих локальный кеш"""
+        if self.cache_enabled and not self._listeners:
+            self._listeners = [
+                asyncio.create_task(self._listen(shard))
+                for shard in range(len(self.redis))
+            ]
+
+    async def stop(self) -> None:
+        """Остановка подписок"""
+        for listener in self._listeners:
+            listener.cancel()
+        await asyncio.gather(*self._listeners, return_exceptions=True)
+        self._listeners = []
+
+    async def _listen(self, shard: int) -> None:
+        """Сброс локальных записей, измененных другими репликами.
+
+        Уведомление публикуется на шарде пользователя в одном пайплайне с
+        записью, поэтому подписка нужна на каждом шарде.
+        """
+        while True:
+            pubsub = self.redis.clients[shard].pubsub()
+            try:
+                await pubsub.subscribe(CONTEXT_INVALIDATION_CHANNEL)
+                # Пока подписки не было, инвалидации могли быть пропущены
+                self.cache.clear()
+                self._subscribed.add(shard)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    sender, _, user_id = message["data"].decode().partition(":")
+                    if sender != self._instance_id:
+                        self.cache.invalidate(int(user_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Context invalidation subscription lost: {e}")
+            finally:
+                self._subscribed.discard(shard)
+                self.cache.clear()
+                await pubsub.aclose()
+            await asyncio.sleep(1)
+
+    @property
+    def _coherent(self) -> bool:
+        return len(self._subscribed) == len(self.redis)
+
+    def _cache_get(self, user_id: int) -> Optional[VersionedContext]:
+        if not self._coherent:
+            return None
+        entry = self.cache.get(user_id)
+        CONTEXT_CACHE_REQUESTS.labels("miss" if entry is None else "hit").inc()
+        return entry
+
+    def _cache_set(self, user_id: int, entry: VersionedContext) -> None:
+        if self._coherent:
+            # Вес - примерный размер закодированного значения
+            size = sum(len(msg.get("content", "")) + 8 for msg in entry[1])
+            self.cache.set(user_id, entry, size)
 
     def _get_summary_key(self, user_id: int) -> str:
         """Генерация ключа для сводки контекста"""
@@ -36,39 +132,51 @@ class ContextManager:
         """Генерация ключа для активной сессии"""
         return f"session:{user_id}"
 
+    def _get_preferences_key(self, user_id: int) -> str:
+        """Генерация ключа для профиля предпочтений"""
+        return f"prefs:{user_id}"
+
     async def add_message_to_context(
         self, user_id: int, message: str, bot_response: str, communication_style: str
     ) -> None:
         """Добавление сообщения в контекст с оптимизацией"""
 
-        # Получаем текущий контекст
-        context = await self.get_context(user_id)
-
-        # Добавляем новое сообщение
-        context.append(
-            {
-                "role": "user",
-                "content": message,
-                "timestamp": datetime.now().isoformat(),
-            }
-        )
-        context.append(
-            {
-                "role": "assistant",
-                "content": bot_response,
-                "timestamp": datetime.now().isoformat(),
-            }
+        now = datetime.now().isoformat()
+        messages = [
+            {"role": "user", "content": message, "timestamp": now},
+            {"role": "assistant", "content": bot_response, "timestamp": now},
+        ]
+
+        # Профиль предпочтений обновляется в пайплайне первой попытки записи
+        counters, mood = detect_preferences(message)
+
+        def update_preferences(pipe: Pipeline) -> None:
+            preferences_key = self._get_preferences_key(user_id)
+            for name in counters:
+                pipe.hincrby(preferences_key, name, 1)
+            if mood:
+                pipe.hset(preferences_key, "mood", mood)
+            pipe.expire(preferences_key, self.preferences_ttl)
+
+        # Атомарное дописывание: конкурирующая запись с другой реплики или
+        # очистка контекста не теряются, а заставляют повторить попытку.
+        # Локальный кеш - только первое предположение о текущей версии, до
+        # успешной записи его запись сбрасывается
+        current = self._cache_get(user_id)
+        self.cache.invalidate(user_id)
+        entry = await self.store.append(
+            user_id,
+            messages,
+            CONTEXT_MAX_MESSAGES,
+            current=current,
+            hook=update_preferences if counters or mood else None,
         )
+        self._cache_set(user_id, entry)
+        context = entry[1]
 
-        # Ограничиваем размер контекста (последние 20 сообщений)
-        if len(context) > 20:
-            context = context[-20:]
-
-        # Сохраняем в Redis
-        await self._save_context(user_id, context)
-
-        # Обновляем сводку каждые 10 сообщений
-        if len(context) % 10 == 0:
+        # Обновляем сводку каждые 10 сообщений (5 записей пар). По длине
+        # контекста нельзя: заполненный контекст всегда из 20 сообщений
+        if entry[0] % 5 == 0:
             await self._update_summary(user_id, context)
 
     async def get_context(
@@ -76,24 +184,22 @@ class ContextManager:
     ) -> List[Dict[str, str]]:
         """Получение контекста с оптимизацией"""
 
-        # Сначала пробуем получить из Redis
-        context_key = self._get_context_key(user_id)
-        cached_context = self.redis_client.get(context_key)
-
-        if cached_context:
-            try:
-                context = json.loads(cached_context)
-                # Проверяем, что context это список словарей
-                if isinstance(context, list):
-                    # Возвращаем только последние max_messages
-                    return context[
-                        -max_messages * 2 :
-                    ]  # *2 потому что user + assistant
-            except (json.JSONDecodeError, TypeError):
-                logger.warning(f"Invalid JSON in context cache for user {user_id}")
-
-        # Если нет в кеше или ошибка, возвращаем пустой контекст
-        return []
+        entry = self._cache_get(user_id)
+        if entry is None:
+            # Если нет в локальном кеше, читаем из Redis, продлевая заодно
+            # сводку и профиль: активный пользователь не теряет их, даже
+            # если сводка давно не пересчитывалась
+            entry = await self.store.load(
+                user_id,
+                touch=[
+                    (self._get_summary_key(user_id), self.summary_ttl),
+                    (self._get_preferences_key(user_id), self.preferences_ttl),
+                ],
+            )
+            self._cache_set(user_id, entry)
+
+        # Возвращаем только последние max_messages
+        return entry[1][-max_messages * 2 :]  # *2 потому что user + assistant
 
     async def get_optimized_context(
         self, user_id: int, max_tokens: int = 1000
@@ -121,7 +227,10 @@ class ContextManager:
     async def get_summary(self, user_id: int) -> Optional[str]:
         """Получение сводки контекста"""
         summary_key = self._get_summary_key(user_id)
-        cached_summary = self.redis_client.get(summary_key)
+        pipe = self.redis.client(user_id).pipeline(transaction=False)
+        pipe.get(summary_key)
+        pipe.expire(summary_key, self.summary_ttl)
+        cached_summary, _ = await deadline.run(pipe.execute(), self.redis_timeout)
 
         if cached_summary:
             try:
@@ -133,13 +242,6 @@ class ContextManager:
 
         return None
 
-    async def _save_context(self, user_id: int, context: List[Dict[str, Any]]) -> None:
-        """Сохранение контекста в Redis"""
-        context_key = self._get_context_key(user_id)
-        self.redis_client.setex(
-            context_key, self.context_ttl, json.dumps(context, ensure_ascii=False)
-        )
-
     async def _update_summary(
         self, user_id: int, context: List[Dict[str, Any]]
     ) -> None:
@@ -153,7 +255,12 @@ class ContextManager:
 
         if summary:
             summary_key = self._get_summary_key(user_id)
-            self.redis_client.setex(summary_key, self.summary_ttl, summary)
+            await deadline.run(
+                self.redis.client(user_id).setex(
+                    summary_key, self.summary_ttl, summary
+                ),
+                self.redis_timeout,
+            )
 
     def _create_summary(self, messages: List[Dict[str, Any]]) -> str:
         """Создание сводки контекста"""
@@ -193,52 +300,27 @@ class ContextManager:
 
     async def clear_context(self, user_id: int) -> None:
         """Очистка контекста пользователя"""
-        context_key = self._get_context_key(user_id)
         summary_key = self._get_summary_key(user_id)
         session_key = self._get_session_key(user_id)
-
-        self.redis_client.delete(context_key, summary_key, session_key)
-
-    async def get_user_preferences(self, user_id: int) -> Dict[str, str]:
-        """Получение предпочтений пользователя из контекста"""
-        context = await self.get_context(user_id, max_messages=50)
-
-        preferences: Dict[str, str] = {
-            "topics": "",
-            "communication_style": "neutral",
-            "mood": "neutral",
-        }
-
-        if not context:
-            return preferences
-
-        # Анализируем контекст для извлечения предпочтений
-        all_content = " ".join([msg.get("content", "") for msg in context])
-
-        # Определяем стиль общения
-        if any(word in all_content.lower() for word in ["шутка", "игра", "весело"]):
-            preferences["communication_style"] = "playful"
-        elif any(
-            word in all_content.lower() for word in ["романтика", "любовь", "нежность"]
-        ):
-            preferences["communication_style"] = "romantic"
-        elif any(
-            word in all_content.lower() for word in ["страсть", "эмоции", "чувства"]
-        ):
-            preferences["communication_style"] = "passionate"
-
-        # Извлекаем темы
-        topics: List[str] = []
-        if any(word in all_content.lower() for word in ["работа", "карьера"]):
-            topics.append("работа")
-        if any(word in all_content.lower() for word in ["путешествие", "поездка"]):
-            topics.append("путешествия")
-        if any(word in all_content.lower() for word in ["музыка", "фильм"]):
-            topics.append("развлечения")
-
-        preferences["topics"] = ", ".join(topics) if topics else "общие темы"
-
-        return preferences
+        preferences_key = self._get_preferences_key(user_id)
+
+        # Очистка повышает версию контекста, поэтому дописывание, начатое
+        # до нее, будет отклонено и не вернет старые сообщения
+        try:
+            await self.store.clear(
+                user_id, extra_keys=[summary_key, session_key, preferences_key]
+            )
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def get_user_preferences(self, user_id: int) -> PreferenceProfile:
+        """Получение профиля предпочтений пользователя"""
+        preferences_key = self._get_preferences_key(user_id)
+        pipe = self.redis.client(user_id).pipeline(transaction=False)
+        pipe.hgetall(preferences_key)
+        pipe.expire(preferences_key, self.preferences_ttl)
+        data, _ = await deadline.run(pipe.execute(), self.redis_timeout)
+        return PreferenceProfile.from_hash(data)
 
 
 # Глобальный экземпляр менеджера контекста
@@ -0,0 +1,200 @@
+"""
+Версионированное хранение контекста в Redis с атомарными изменениями
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from redis.asyncio.client import Pipeline
+from redis.exceptions import NoScriptError
+
+from services import deadline
+from services.context_codec import decode_context, encode_context
+from services.redis_shards import RedisShards
+
+# Канал, по которому реплики сообщают друг другу об изменении контекста
+CONTEXT_INVALIDATION_CHANNEL = "context:invalidate"
+
+# Попыток записи при конфликте версий: за каждую попытку хотя бы один из
+# конкурентов записывает свой вариант, так что это предел параллельных
+# записей одного пользователя, а не вероятностная оценка
+CONTEXT_WRITE_ATTEMPTS = 16
+
+# Контекст хранится хешем {v: версия, d: закодированные сообщения}. Ключ
+# старого формата - строка без версии, читается как версия 0.
+# Чтение продлевает срок жизни контекста и остальных ключей пользователя
+# (ARGV[i] - TTL ключа KEYS[i]) без перезаписи значений
+LOAD_SCRIPT = """
+local reply
+if redis.call('TYPE', KEYS[1]).ok == 'string' then
+    reply = {0, redis.call('GET', KEYS[1])}
+else
+    reply = redis.call('HMGET', KEYS[1], 'v', 'd')
+end
+for i = 1, #KEYS do
+    redis.call('EXPIRE', KEYS[i], ARGV[i])
+end
+return reply
+"""
+
+# Запись только поверх прочитанной версии: KEYS[1] - контекст;
+# ARGV - ожидаемая версия, данные, TTL, канал и сообщение инвалидации.
+# Возвращает новую версию или -1, если контекст уже изменился
+COMPARE_AND_SET_SCRIPT = """
+local version = 0
+if redis.call('TYPE', KEYS[1]).ok == 'hash' then
+    version = tonumber(redis.call('HGET', KEYS[1], 'v') or '0')
+end
+if version ~= tonumber(ARGV[1]) then
+    return -1
+end
+if version == 0 then
+    redis.call('DEL', KEYS[1])
+end
+redis.call('HSET', KEYS[1], 'v', version + 1, 'd', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PUBLISH', ARGV[4], ARGV[5])
+return version + 1
+"""
+
+# Очистка не удаляет ключ контекста, а пишет пустые данные со следующей
+# версией: запись, прочитавшая контекст до очистки, будет отклонена.
+# KEYS[1] - контекст, остальные ключи удаляются; ARGV - TTL, канал, сообщение
+CLEAR_SCRIPT = """
+local version = 0
+if redis.call('TYPE', KEYS[1]).ok == 'hash' then
+    version = tonumber(redis.call('HGET', KEYS[1], 'v') or '0')
+end
+redis.call('DEL', unpack(KEYS))
+redis.call('HSET', KEYS[1], 'v', version + 1, 'd', '')
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('PUBLISH', ARGV[2], ARGV[3])
+return version + 1
+"""
+
+Context = List[Dict[str, Any]]
+PipelineHook = Callable[[Pipeline], None]
+
+
+class ContextConflictError(RuntimeError):
+    """Контекст не удалось записать за CONTEXT_WRITE_ATTEMPTS попыток"""
+
+
+class ContextStore:
+    """Контекст пользователя с версией, изменяемый без потерянных обновлений.
+
+    Изменение - оптимистичное: прочитать версию и сообщения, дописать,
+    записать скриптом, который проверяет, что версия не изменилась. При
+    конфликте контекст перечитывается и изменение применяется заново.
+    Распределенных блокировок нет, одна попытка - два запроса к Redis.
+    """
+
+    def __init__(
+        self, redis: RedisShards, ttl: int, timeout: float, instance_id: str
+    ) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.timeout = timeout
+        self.instance_id = instance_id
+        # Скрипты привязаны к первому клиенту, но выполняются на узле шарда
+        registrar = redis.clients[0]
+        self._load = registrar.register_script(LOAD_SCRIPT)
+        self._compare_and_set = registrar.register_script(COMPARE_AND_SET_SCRIPT)
+        self._clear = registrar.register_script(CLEAR_SCRIPT)
+
+    def key(self, user_id: int) -> str:
+        return f"context:{user_id}"
+
+    def _notification(self, user_id: int) -> str:
+        return f"{self.instance_id}:{user_id}"
+
+    async def load(
+        self, user_id: int, touch: Sequence[Tuple[str, int]] = ()
+    ) -> Tuple[int, Context]:
+        """Текущая версия и сообщения контекста.
+
+        Срок жизни контекста продлевается до ttl, ключей из touch - до
+        указанного для каждого TTL.
+        """
+        reply = await deadline.run(
+            self._load(
+                keys=[self.key(user_id), *(key for key, _ in touch)],
+                args=[self.ttl, *(ttl for _, ttl in touch)],
+                client=self.redis.client(user_id),
+            ),
+            self.timeout,
+        )
+        version = int(reply[0] or 0)
+        data = reply[1] if len(reply) > 1 else None
+        if not data:
+            return version, []
+        try:
+            return version, decode_context(data)
+        except ValueError:
+            logger.warning(f"Invalid context cache for user {user_id}")
+            return version, []
+
+    async def append(
+        self,
+        user_id: int,
+        messages: Sequence[Dict[str, Any]],
+        max_messages: int,
+        current: Optional[Tuple[int, Context]] = None,
+        hook: Optional[PipelineHook] = None,
+    ) -> Tuple[int, Context]:
+        """Дописывание сообщений с сохранением последних max_messages.
+
+        current - уже известные версия и сообщения (например, из локального
+        кеша); если они устарели, запись отклонится и контекст перечитается.
+        hook добавляет команды в пайплайн первой попытки, чтобы они
+        выполнились ровно один раз. Возвращает новую версию и контекст.
+        """
+        client = self.redis.client(user_id)
+        for _ in range(CONTEXT_WRITE_ATTEMPTS):
+            version, context = current or await self.load(user_id)
+            current = None
+            context = (context + list(messages))[-max_messages:]
+            # EVALSHA напрямую: скрипт в пайплайне заставил бы redis-py
+            # проверять SCRIPT EXISTS перед каждым выполнением
+            pipe = client.pipeline(transaction=False)
+            pipe.evalsha(
+                self._compare_and_set.sha,
+                1,
+                self.key(user_id),
+                version,
+                encode_context(context),
+                self.ttl,
+                CONTEXT_INVALIDATION_CHANNEL,
+                self._notification(user_id),
+            )
+            if hook is not None:
+                hook(pipe)
+                hook = None
+            try:
+                replies = await deadline.run(pipe.execute(), self.timeout)
+            except NoScriptError:
+                # Узел перезапущен или новый: загружаем скрипт и повторяем,
+                # остальные команды пайплайна уже выполнены
+                await client.script_load(COMPARE_AND_SET_SCRIPT)
+                continue
+            if replies[0] >= 0:
+                return int(replies[0]), context
+        raise ContextConflictError(
+            f"Context of user {user_id} changed {CONTEXT_WRITE_ATTEMPTS} times "
+            "during one write"
+        )
+
+    async def clear(self, user_id: int, extra_keys: Sequence[str] = ()) -> int:
+        """Очистка контекста (и удаление extra_keys) с новой версией"""
+        version = await deadline.run(
+            self._clear(
+                keys=[self.key(user_id), *extra_keys],
+                args=[
+                    self.ttl,
+                    CONTEXT_INVALIDATION_CHANNEL,
+                    self._notification(user_id),
+                ],
+                client=self.redis.client(user_id),
+            ),
+            self.timeout,
+        )
+        return int(version)
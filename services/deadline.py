@@ -0,0 +1,67 @@
+"""
+Дедлайн обработки апдейта, передаваемый в зависимости через contextvar
+"""
+import asyncio
+import time
+from contextvars import ContextVar, Token
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Бюджет времени на обработку апдейта исчерпан"""
+
+
+def start(budget: float) -> "Token[Optional[float]]":
+    """Установка дедлайна через budget секунд от текущего момента"""
+    return _deadline.set(time.monotonic() + budget)
+
+
+def reset(token: "Token[Optional[float]]") -> None:
+    """Снятие дедлайна, установленного через start"""
+    _deadline.reset(token)
+
+
+def clear() -> None:
+    """Снятие дедлайна в текущем контексте (для фоновых задач из апдейта)"""
+    _deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Оставшееся время в секундах (None, если дедлайн не задан)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def timeout(default: Optional[float] = None) -> Optional[float]:
+    """Таймаут для вызова зависимости: минимум из default и остатка бюджета"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Update deadline exceeded")
+    return left if default is None else min(default, left)
+
+
+async def run(aw: Awaitable[T], default: Optional[float] = None) -> T:
+    """Выполнение awaitable с учетом дедлайна, по истечении вызов отменяется"""
+    try:
+        budget = timeout(default)
+    except DeadlineExceeded:
+        # Корутина так и не будет запущена - закрываем, чтобы не было warning
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise
+
+    try:
+        return await asyncio.wait_for(aw, budget)
+    except asyncio.TimeoutError as e:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("Update deadline exceeded") from e
+        raise
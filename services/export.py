@@ -0,0 +1,55 @@
+"""
+Выгрузка истории диалогов пользователя в сжатый JSONL
+"""
+import asyncio
+import gzip
+import json
+from io import BufferedIOBase
+from typing import Any, Dict, List
+
+from database.connection import db
+from database.models import Conversation
+
+# Сколько строк копится в памяти перед записью в файл
+EXPORT_CHUNK_SIZE = 500
+
+
+def conversation_to_json(conversation: Conversation) -> Dict[str, Any]:
+    """Диалог -> словарь для выгрузки"""
+    return {
+        "id": conversation.id,
+        "created_at": conversation.created_at.isoformat(),
+        "communication_style": conversation.communication_style.value,
+        "message": conversation.message,
+        "bot_response": conversation.bot_response,
+        "tokens_used": conversation.tokens_used,
+    }
+
+
+def _write_lines(file: BufferedIOBase, lines: List[str]) -> None:
+    file.write("".join(lines).encode("utf-8"))
+
+
+async def export_conversations(user_id: int, path: str) -> int:
+    """Запись всей истории пользователя в gzip-файл, возвращает число строк.
+
+    История читается постранично, сжатие и запись идут в отдельном потоке,
+    в памяти одновременно держится не больше одной пачки.
+    """
+    count = 0
+    lines: List[str] = []
+    with gzip.open(path, "wb") as file:
+        async for conversation in db.iter_conversations(
+            user_id, batch_size=EXPORT_CHUNK_SIZE
+        ):
+            lines.append(
+                json.dumps(conversation_to_json(conversation), ensure_ascii=False)
+                + "\n"
+            )
+            count += 1
+            if len(lines) >= EXPORT_CHUNK_SIZE:
+                await asyncio.to_thread(_write_lines, file, lines)
+                lines = []
+        if lines:
+            await asyncio.to_thread(_write_lines, file, lines)
+    return count
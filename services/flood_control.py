@@ -0,0 +1,128 @@
+"""
+Защита от флуда: дырявое ведро на пользователя в Redis
+"""
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+from config.settings import Settings, settings
+from services import deadline
+from services.redis_shards import RedisShards
+
+# Ответ на первый отброшенный апдейт серии
+FLOOD_COOLDOWN_MESSAGE = "Ого, сколько сообщений! Дай мне секундочку перевести дух 😅"
+
+# Ведро - хеш {level: уровень, ts: время последнего апдейта, n: отправлено
+# ли предупреждение}. Время берется из Redis, чтобы реплики с разными
+# часами видели одно ведро. ARGV - скорость вытекания, емкость, допустимое
+# ожидание в очереди и TTL ведра. Возвращает {статус, ожидание в мс}:
+# 0 - апдейт принят (возможно, после ожидания), 1 - отброшен впервые за
+# серию, 2 - отброшен, предупреждение уже отправлено
+LEAKY_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'level', 'ts', 'n')
+local level = tonumber(state[1]) or 0
+local ts = tonumber(state[2]) or now
+level = math.max(0, level - math.max(0, now - ts) * rate)
+local wait = math.max(0, (level + 1 - tonumber(ARGV[2])) / rate)
+local status = 0
+if wait <= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], 'level', level + 1, 'ts', now, 'n', 0)
+elseif state[3] == '1' then
+    status = 2
+    redis.call('HSET', KEYS[1], 'level', level, 'ts', now)
+else
+    status = 1
+    wait = 0
+    redis.call('HSET', KEYS[1], 'level', level, 'ts', now, 'n', 1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if status > 0 then
+    return {status, 0}
+end
+return {0, math.ceil(wait * 1000)}
+"""
+
+
+@dataclass
+class FloodDecision:
+    """Результат проверки апдейта пользователя"""
+
+    allowed: bool
+    wait: float = 0.0
+    notify: bool = False
+
+
+class FloodControl:
+    """Ограничение частоты апдейтов пользователя.
+
+    Каждый апдейт доливает единицу в ведро емкостью flood_burst, которое
+    вытекает со скоростью flood_rate в секунду. Апдейт, не помещающийся в
+    ведро, ждет своей очереди не дольше flood_queue_delay, иначе
+    отбрасывается. Состояние хранится в Redis, поэтому лимит общий для
+    всех реплик бота.
+    """
+
+    def __init__(self, app_settings: Optional[Settings] = None) -> None:
+        # Используем переданные настройки, settings или создаем новый экземпляр
+        if app_settings is not None:
+            self.settings: Settings = app_settings
+        elif settings is None:
+            # В тестах или CI/CD создаем с дефолтными значениями
+            self.settings = Settings(
+                bot_token="dummy_token",
+                openai_api_key="dummy_key",
+                database_url="dummy_url",
+                redis_url="redis://localhost:6379/0",
+                openai_model="gpt-4-turbo-preview",
+            )
+        else:
+            self.settings = settings
+        self.redis = RedisShards(self.settings)
+        self._bucket = self.redis.clients[0].register_script(LEAKY_BUCKET_SCRIPT)
+        # Ведро без апдейтов полностью вытекает за это время
+        self.ttl = 0
+        if self.enabled:
+            drain = self.settings.flood_burst / self.settings.flood_rate
+            self.ttl = math.ceil(drain + self.settings.flood_queue_delay) + 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.flood_control_enabled and self.settings.flood_rate > 0
+
+    def key(self, user_id: int) -> str:
+        return f"flood:{user_id}"
+
+    async def check(self, user_id: int) -> FloodDecision:
+        """Учет апдейта пользователя в его ведре"""
+        if not self.enabled:
+            return FloodDecision(allowed=True)
+        try:
+            status, wait_ms = await deadline.run(
+                self._bucket(
+                    keys=[self.key(user_id)],
+                    args=[
+                        self.settings.flood_rate,
+                        self.settings.flood_burst,
+                        self.settings.flood_queue_delay,
+                        self.ttl,
+                    ],
+                    client=self.redis.client(user_id),
+                ),
+                self.settings.redis_timeout,
+            )
+        except Exception as e:
+            # Без Redis пропускаем апдейты, а не отключаем бота
+            logger.warning(f"Flood control check for user {user_id} failed: {e}")
+            return FloodDecision(allowed=True)
+        if status:
+            return FloodDecision(allowed=False, notify=int(status) == 1)
+        return FloodDecision(allowed=True, wait=int(wait_ms) / 1000)
+
+
+# Глобальный экземпляр защиты от флуда
+flood_control = FloodControl()
@@ -0,0 +1,74 @@
+"""
+Внутрипроцессный LRU-кеш с TTL и ограничением по объему
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class LocalCache(Generic[V]):
+    """LRU-кеш значений с весом (примерный размер в байтах) и сроком жизни.
+
+    Вытесняет самые давно использованные записи, пока суммарный вес больше
+    max_bytes. Не потокобезопасен: рассчитан на один event loop.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[V, int, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, _, expires = entry
+        if expires <= time.monotonic():
+            self.invalidate(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, weight: int) -> None:
+        self.invalidate(key)
+        if weight > self.max_bytes:
+            return
+        self._entries[key] = (value, weight, time.monotonic() + self.ttl)
+        self.size += weight
+        while self.size > self.max_bytes:
+            _, (_, evicted_weight, _) = self._entries.popitem(last=False)
+            self.size -= evicted_weight
+
+    def invalidate(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
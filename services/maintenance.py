@@ -0,0 +1,188 @@
+"""
+Фоновое обслуживание базы данных внутри процесса бота
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+from loguru import logger
+
+from config.settings import Settings
+from database.archive import archive_inactive_users
+from database.partitions import (
+    check_partition_coverage,
+    drop_partitions_before,
+    ensure_future_partitions,
+    is_partitioned,
+    try_migration_lock,
+)
+from database.rollups import aggregate_new_conversations
+
+# Ключ advisory-лока: обслуживание выполняет только одна реплика
+MAINTENANCE_LOCK_ID = 0x4348_4B59_0001
+
+PURGE_BATCH_SQL = """
+DELETE FROM conversations
+WHERE (id, created_at) IN (
+    SELECT id, created_at FROM conversations
+    WHERE created_at < $1
+    LIMIT $2
+)
+"""
+
+Step = Callable[[asyncpg.Connection], Awaitable[Optional[str]]]
+
+
+class MaintenanceService:
+    """Периодические задачи обслуживания: партиции, агрегаты, очистка.
+
+    Заменяет pg_cron, который недоступен в управляемом PostgreSQL. Каждая
+    реплика бота запускает цикл, но работу выполняет только та, что взяла
+    advisory-лок.
+    """
+
+    def __init__(self, app_settings: Settings) -> None:
+        self.settings = app_settings
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        """Запуск фонового цикла"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logger.info("Maintenance loop started")
+
+    async def stop(self) -> None:
+        """Остановка фонового цикла"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Maintenance run failed: {e}")
+            await asyncio.sleep(self.settings.maintenance_interval)
+
+    def _steps(self) -> List[Tuple[str, Step]]:
+        return [
+            ("partitions", self._maintain_partitions),
+            ("partition_coverage", self._check_partition_coverage),
+            ("rollups", self._update_rollups),
+            ("purge", self._purge_old_conversations),
+            ("archive", self._archive_inactive_users),
+        ]
+
+    async def run_once(self) -> bool:
+        """Один проход обслуживания. False, если лидер - другая реплика"""
+        # Отдельное соединение: сессионный лок нельзя держать на соединении
+        # из пула, пул снимает все advisory-локи при возврате соединения
+        conn = await asyncpg.connect(self.settings.database_url)
+        try:
+            if not await conn.fetchval(
+                "SELECT pg_try_advisory_lock($1)", MAINTENANCE_LOCK_ID
+            ):
+                logger.debug("Maintenance is run by another replica")
+                return False
+            try:
+                await self._run_steps(conn)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MAINTENANCE_LOCK_ID)
+        finally:
+            await conn.close()
+        return True
+
+    async def _run_steps(self, conn: asyncpg.Connection) -> None:
+        started = time.monotonic()
+        timings: Dict[str, float] = {}
+        for name, step in self._steps():
+            step_started = time.monotonic()
+            try:
+                summary = await step(conn)
+            except Exception as e:
+                logger.error(f"Maintenance step {name} failed: {e}")
+                summary = "failed"
+            timings[name] = time.monotonic() - step_started
+            logger.info(
+                f"Maintenance step {name} took {timings[name]:.2f}s"
+                + (f": {summary}" if summary else "")
+            )
+        total = time.monotonic() - started
+        steps = ", ".join(f"{name}={took:.2f}s" for name, took in timings.items())
+        logger.info(f"Maintenance run finished in {total:.2f}s ({steps})")
+
+    def _retention_cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(
+            days=self.settings.conversation_retention_days
+        )
+
+    async def _maintain_partitions(self, conn: asyncpg.Connection) -> Optional[str]:
+        """Создание будущих партиций и удаление истекших"""
+        if not await is_partitioned(conn):
+            return "conversations is not partitioned, skipped"
+        created = await ensure_future_partitions(
+            conn, months_ahead=self.settings.partition_months_ahead
+        )
+        dropped = await drop_partitions_before(conn, self._retention_cutoff().date())
+        return f"created {len(created)}, dropped {len(dropped)}"
+
+    async def _check_partition_coverage(
+        self, conn: asyncpg.Connection
+    ) -> Optional[str]:
+        """Проверка запаса партиций, даже если их создание не удалось"""
+        ahead = await check_partition_coverage(
+            conn, self.settings.partition_months_ahead
+        )
+        if ahead is None:
+            return "conversations is not partitioned, skipped"
+        return f"partitions exist for {ahead} month(s) ahead"
+
+    async def _update_rollups(self, conn: asyncpg.Connection) -> str:
+        """Добавление новых диалогов в дневные агрегаты"""
+        last_id = await aggregate_new_conversations(
+            conn, batch_size=self.settings.rollup_batch_size
+        )
+        return f"rolled up to conversation id {last_id}"
+
+    async def _purge_old_conversations(self, conn: asyncpg.Connection) -> str:
+        """Удаление старых диалогов небольшими пачками с паузами.
+
+        После удаления партиций здесь остаются только строки пограничного
+        месяца; на непартиционированной таблице это основной способ очистки.
+        Во время переноса в партиции очистка пропускается: удаление строки
+        посреди пачки переноса не попадет в новую таблицу.
+        """
+        async with try_migration_lock(conn) as locked:
+            if not locked:
+                return "conversations are being partitioned, skipped"
+            cutoff = self._retention_cutoff()
+            total = 0
+            while True:
+                status = await conn.execute(
+                    PURGE_BATCH_SQL, cutoff, self.settings.purge_batch_size
+                )
+                deleted = int(status.split()[-1])
+                total += deleted
+                if deleted < self.settings.purge_batch_size:
+                    break
+                await asyncio.sleep(self.settings.purge_batch_pause)
+        return f"deleted {total} conversations older than {cutoff:%Y-%m-%d}"
+
+    async def _archive_inactive_users(self, conn: asyncpg.Connection) -> str:
+        """Отключение давно неактивных пользователей"""
+        result = await archive_inactive_users(
+            conn,
+            days_inactive=self.settings.inactive_user_days,
+            batch_size=self.settings.archive_batch_size,
+        )
+        return f"archived {result.archived}, scanned {result.scanned}"
@@ -0,0 +1,361 @@
+"""
+Долговременная память: BM25-индекс старых реплик пользователя
+"""
+import asyncio
+import math
+from collections import Counter
+from typing import (
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from loguru import logger
+
+from config.settings import Settings, settings
+from database.connection import db
+from database.models import Conversation
+from services import deadline
+from services.redis_shards import RedisShards
+from services.stemmer import tokenize
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+
+# Грубая оценка числа токенов модели в русском тексте
+CHARS_PER_TOKEN = 3
+
+# Реплик за один вызов скрипта при построении индекса
+REBUILD_BATCH = 100
+
+# Индекс пользователя - три ключа одного шарда:
+#   memory:<id>:docs - хеш: id реплики -> "длина терм терм ...", total -
+#     суммарная длина; наличие ключа означает, что индекс построен;
+#   memory:<id>:ids - id реплик в sorted set для вытеснения старых;
+#   memory:<id>:postings - хеш: терм -> "id:tf:длина,id:tf:длина,...".
+# Скрипт добавляет реплики и вытесняет самые старые сверх лимита, меняя
+# только поля их термов. KEYS - docs, ids, postings; ARGV - TTL, лимит
+# реплик, 1 - только в уже построенный индекс, затем для каждой реплики:
+# id, длина, число термов и пары терм, tf. Возвращает -1, если индекса
+# нет, иначе число вытесненных реплик. Повторно реплика не добавляется
+ADD_SCRIPT = """
+if ARGV[3] == '1' and redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+redis.call('HINCRBY', KEYS[1], 'total', 0)
+local i = 4
+while i <= #ARGV do
+    local id, length, count = ARGV[i], ARGV[i + 1], tonumber(ARGV[i + 2])
+    i = i + 3
+    if not redis.call('ZSCORE', KEYS[2], id) then
+        local terms = {}
+        for j = i, i + 2 * count - 1, 2 do
+            local entry = id .. ':' .. ARGV[j + 1] .. ':' .. length
+            local postings = redis.call('HGET', KEYS[3], ARGV[j])
+            if postings then
+                entry = postings .. ',' .. entry
+            end
+            redis.call('HSET', KEYS[3], ARGV[j], entry)
+            terms[#terms + 1] = ARGV[j]
+        end
+        redis.call('HSET', KEYS[1], id, length .. ' ' .. table.concat(terms, ' '))
+        redis.call('HINCRBY', KEYS[1], 'total', length)
+        redis.call('ZADD', KEYS[2], id, id)
+    end
+    i = i + 2 * count
+end
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[2])
+if excess > 0 then
+    for _, id in ipairs(redis.call('ZRANGE', KEYS[2], 0, excess - 1)) do
+        local prefix = id .. ':'
+        local length
+        for word in string.gmatch(redis.call('HGET', KEYS[1], id) or '', '%S+') do
+            if not length then
+                length = tonumber(word)
+            else
+                local postings = redis.call('HGET', KEYS[3], word) or ''
+                -- Вхождения идут по возрастанию id, старое обычно первое
+                local first, last
+                if string.sub(postings, 1, #prefix) == prefix then
+                    first = 1
+                else
+                    first = string.find(postings, ',' .. prefix, 1, true)
+                end
+                if first then
+                    last = string.find(postings, ',', first + 1, true)
+                    if first == 1 then
+                        postings = last and string.sub(postings, last + 1) or ''
+                    else
+                        postings = string.sub(postings, 1, first - 1)
+                            .. (last and string.sub(postings, last) or '')
+                    end
+                end
+                if postings ~= '' then
+                    redis.call('HSET', KEYS[3], word, postings)
+                else
+                    redis.call('HDEL', KEYS[3], word)
+                end
+            end
+        end
+        redis.call('HINCRBY', KEYS[1], 'total', -(length or 0))
+        redis.call('HDEL', KEYS[1], id)
+        redis.call('ZREM', KEYS[2], id)
+    end
+else
+    excess = 0
+end
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ARGV[1])
+end
+return excess
+"""
+
+# Вхождение терма: id реплики, частота терма в ней и длина реплики
+Posting = Tuple[int, int, int]
+
+
+def parse_postings(raw: Union[bytes, str]) -> List[Posting]:
+    """Вхождения терма из поля хеша postings"""
+    text = raw.decode() if isinstance(raw, bytes) else raw
+    postings = []
+    for entry in text.split(","):
+        doc_id, tf, length = entry.split(":")
+        postings.append((int(doc_id), int(tf), int(length)))
+    return postings
+
+
+def bm25_rank(
+    postings: Mapping[str, Sequence[Posting]],
+    total_docs: int,
+    total_length: int,
+    top_k: int,
+    excluded: Collection[int] = (),
+) -> List[Tuple[int, float]]:
+    """Лучшие реплики по BM25 среди вхождений термов запроса"""
+    if total_docs == 0:
+        return []
+    average = max(total_length / total_docs, 1.0)
+    scores: Dict[int, float] = {}
+    for docs in postings.values():
+        if not docs:
+            continue
+        idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        for doc_id, tf, length in docs:
+            if doc_id in excluded:
+                continue
+            norm = K1 * (1 - B + B * length / average)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def conversation_tokens(conversation: Conversation) -> List[str]:
+    """Термы документа-реплики"""
+    return tokenize(f"{conversation.message} {conversation.bot_response}")
+
+
+def documents_args(conversations: Iterable[Conversation]) -> List[Union[int, str]]:
+    """Аргументы скрипта для реплик: id, длина, число термов, пары терм, tf"""
+    args: List[Union[int, str]] = []
+    for conversation in conversations:
+        counts = Counter(conversation_tokens(conversation))
+        args.extend((conversation.id, sum(counts.values()), len(counts)))
+        for term, tf in counts.items():
+            args.extend((term, tf))
+    return args
+
+
+class MemoryIndex:
+    """Индексы памяти пользователей, хранимые в Redis.
+
+    Индекс обновляется при каждом сохранении диалога; если индекса еще нет,
+    он строится в фоне по последним memory_max_docs репликам из
+    conversations. Запись меняет только поля термов добавленной реплики,
+    поиск читает только вхождения термов запроса.
+    """
+
+    def __init__(self, app_settings: Optional[Settings] = None) -> None:
+        # Используем переданные настройки, settings или создаем новый экземпляр
+        if app_settings is not None:
+            self.settings: Settings = app_settings
+        elif settings is None:
+            # В тестах или CI/CD создаем с дефолтными значениями
+            self.settings = Settings(
+                bot_token="dummy_token",
+                openai_api_key="dummy_key",
+                database_url="dummy_url",
+                redis_url="redis://localhost:6379/0",
+                openai_model="gpt-4-turbo-preview",
+            )
+        else:
+            self.settings = settings
+        self.redis = RedisShards(self.settings)
+        self._add_script = self.redis.clients[0].register_script(ADD_SCRIPT)
+        self._building: Set[int] = set()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def _get_keys(self, user_id: int) -> Tuple[str, str, str]:
+        prefix = f"memory:{user_id}"
+        return f"{prefix}:docs", f"{prefix}:ids", f"{prefix}:postings"
+
+    async def retrieve(self, user_id: int, query: str) -> List[str]:
+        """Фрагменты старых диалогов, относящиеся к запросу, в пределах бюджета"""
+        if not self.settings.memory_enabled:
+            return []
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        docs_key, ids_key, postings_key = self._get_keys(user_id)
+        # Самые новые реплики уже есть в контексте; (1, 0) - пустой диапазон
+        skip_recent = self.settings.memory_skip_recent
+        recent_range = (-skip_recent, -1) if skip_recent else (1, 0)
+        try:
+            # Чтение продлевает срок жизни индекса в том же запросе
+            pipe = self.redis.client(user_id).pipeline(transaction=False)
+            pipe.hget(docs_key, "total")
+            pipe.zcard(ids_key)
+            pipe.zrange(ids_key, *recent_range)
+            pipe.hmget(postings_key, terms)
+            for key in (docs_key, ids_key, postings_key):
+                pipe.expire(key, self.settings.memory_ttl)
+            total_length, total_docs, recent, raw_postings, *_ = await deadline.run(
+                pipe.execute(), self.settings.redis_timeout
+            )
+            if total_length is None:
+                self._schedule_build(user_id)
+                return []
+            postings = {
+                term: parse_postings(raw)
+                for term, raw in zip(terms, raw_postings)
+                if raw
+            }
+            hits = bm25_rank(
+                postings,
+                int(total_docs),
+                int(total_length),
+                self.settings.memory_top_k,
+                excluded={int(doc_id) for doc_id in recent},
+            )
+            if not hits:
+                return []
+            conversations = await db.get_conversations_by_ids(
+                user_id, [doc_id for doc_id, _ in hits]
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Memory retrieval for user {user_id} timed out")
+            return []
+        except Exception as e:
+            logger.error(f"Memory retrieval for user {user_id} failed: {e}")
+            return []
+
+        by_id = {conversation.id: conversation for conversation in conversations}
+        return self._fit_budget(
+            [by_id[doc_id] for doc_id, _ in hits if doc_id in by_id]
+        )
+
+    def _fit_budget(self, conversations: List[Conversation]) -> List[str]:
+        """Фрагменты по убыванию релевантности, пока хватает бюджета токенов"""
+        budget = self.settings.memory_token_budget * CHARS_PER_TOKEN
+        snippets: List[str] = []
+        for conversation in conversations:
+            snippet = (
+                f"{conversation.created_at:%d.%m.%Y}: собеседник: "
+                f"{conversation.message} / ты: {conversation.bot_response}"
+            )
+            if len(snippet) > budget:
+                if snippets:
+                    break
+                snippet = snippet[: max(budget - 1, 0)] + "…"
+            snippets.append(snippet)
+            budget -= len(snippet)
+        return snippets
+
+    async def _apply(
+        self,
+        user_id: int,
+        documents: Sequence[Union[int, str]],
+        existing_only: bool,
+    ) -> int:
+        """Добавление реплик (аргументы из documents_args) с вытеснением старых"""
+        args: List[Union[int, str]] = [
+            self.settings.memory_ttl,
+            self.settings.memory_max_docs,
+            1 if existing_only else 0,
+            *documents,
+        ]
+        result = await self._add_script(
+            keys=self._get_keys(user_id),
+            args=args,
+            client=self.redis.client(user_id),
+        )
+        return int(result)
+
+    async def add_conversation(self, conversation: Conversation) -> None:
+        """Добавление сохраненного диалога в индекс пользователя"""
+        if not self.settings.memory_enabled or not conversation.id:
+            return
+        try:
+            result = await deadline.run(
+                self._apply(
+                    conversation.user_id,
+                    documents_args([conversation]),
+                    existing_only=True,
+                ),
+                self.settings.redis_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Memory index update for {conversation.user_id} timed out")
+            return
+        except Exception as e:
+            logger.error(f"Memory index update for {conversation.user_id} failed: {e}")
+            return
+        if result < 0:
+            # Новый диалог уже в базе и попадет в построенный индекс
+            self._schedule_build(conversation.user_id)
+
+    def _schedule_build(self, user_id: int) -> None:
+        if user_id in self._building:
+            return
+        self._building.add(user_id)
+        task = asyncio.create_task(self.rebuild(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def rebuild(self, user_id: int) -> None:
+        """Построение индекса по последним memory_max_docs репликам"""
+        # Фоновая задача не ограничена дедлайном апдейта, который ее запустил
+        deadline.clear()
+        try:
+            # Индекс отмечается построенным до чтения истории: реплики,
+            # сохраненные после этого, add_conversation допишет сам, а
+            # сохраненные раньше попадут в выборку ниже. Скрипт не добавляет
+            # реплику дважды, поэтому порядок записей не важен
+            await self._apply(user_id, [], existing_only=False)
+            conversations = await db.get_recent_conversations(
+                user_id, self.settings.memory_max_docs
+            )
+            conversations.reverse()
+            for start in range(0, len(conversations), REBUILD_BATCH):
+                # Стемминг пачки - заметная работа CPU, не держим ею event loop
+                documents = await asyncio.to_thread(
+                    documents_args, conversations[start : start + REBUILD_BATCH]
+                )
+                await self._apply(user_id, documents, existing_only=False)
+            logger.info(
+                f"Built memory index for user {user_id}: {len(conversations)} turns"
+            )
+        except Exception as e:
+            logger.error(f"Failed to build memory index for user {user_id}: {e}")
+        finally:
+            self._building.discard(user_id)
+
+
+# Глобальный экземпляр индекса памяти
+memory_index = MemoryIndex()
@@ -0,0 +1,91 @@
+"""
+Метрики Prometheus
+"""
+from typing import Optional
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds",
+    "Ожидание соединения из пула",
+    ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Соединения пула по состоянию: in_use, idle, limit, max",
+    ["pool", "state"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds",
+    "Время выполнения запроса по имени",
+    ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+CONVERSATION_PARTITIONS_AHEAD = Gauge(
+    "conversation_partitions_ahead",
+    "Месяцы после текущего, на которые уже есть партиции conversations",
+)
+CONTEXT_CACHE_REQUESTS = Counter(
+    "context_cache_requests",
+    "Обращения к локальному кешу контекстов: hit, miss",
+    ["result"],
+)
+CONTEXT_CACHE_SIZE = Gauge(
+    "context_cache_size",
+    "Локальный кеш контекстов: entries, bytes, hit_ratio",
+    ["stat"],
+)
+FLOOD_CONTROL_UPDATES = Counter(
+    "flood_control_updates",
+    "Апдейты сверх лимита частоты: queued - задержаны, dropped - отброшены",
+    ["result"],
+)
+DUPLICATE_UPDATES = Counter(
+    "duplicate_updates",
+    "Повторно доставленные апдейты, отброшенные по update_id",
+)
+TELEGRAM_SEND_SECONDS = Histogram(
+    "telegram_send_seconds",
+    "Время исходящего запроса к Telegram вместе с ожиданием лимита",
+    ["method"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+TELEGRAM_SEND_RETRIES = Counter(
+    "telegram_send_retries",
+    "Повторы запросов к Telegram после RetryAfter",
+    ["method"],
+)
+TELEGRAM_EDITS_COALESCED = Counter(
+    "telegram_edits_coalesced",
+    "Правки сообщения, замененные более поздней правкой до отправки",
+)
+WORKER_UPDATES = Counter(
+    "worker_updates",
+    "Апдейты, переданные процессу-воркеру",
+    ["worker"],
+)
+WORKER_QUEUE_DEPTH = Gauge(
+    "worker_queue_depth",
+    "Апдейты в очереди процесса-воркера",
+    ["worker"],
+)
+WORKER_UPDATES_LOST = Counter(
+    "worker_updates_lost",
+    "Апдейты, потерянные вместе с упавшим процессом-воркером",
+    ["worker"],
+)
+WORKER_RESTARTS = Counter(
+    "worker_restarts",
+    "Перезапуски упавших процессов-воркеров",
+    ["worker"],
+)
+
+
+def start_metrics_server(port: Optional[int]) -> None:
+    """HTTP-эндпоинт /metrics, если задан порт"""
+    if not port:
+        return
+    start_http_server(port)
+    logger.info(f"Metrics server listening on :{port}")
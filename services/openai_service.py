@@ -1,13 +1,30 @@
+import asyncio
 import hashlib
 import json
 from typing import Any, Dict, List, Optional, cast
 
 import openai
-import redis
 from loguru import logger
 
 from config.settings import Settings, settings
 from database.models import CommunicationStyle, Gender
+from services import deadline
+from services.redis_shards import RedisShards
+from services.token_quota import QuotaDecision, estimate_tokens, token_quota
+
+# Быстрый ответ, когда бюджет времени на апдейт исчерпан
+TIMEOUT_FALLBACK_MESSAGE = (
+    "Извини, я задумался и не успел ответить. Напиши мне еще раз 🙏"
+)
+
+# Ответ вместо запроса к OpenAI, когда квота токенов исчерпана
+QUOTA_COOLDOWN_MESSAGE = (
+    "Мы сегодня так много болтали, что мне нужна передышка 😌 "
+    "Давай продолжим чуть позже!"
+)
+
+# Предел длины обычного ответа
+RESPONSE_MAX_TOKENS = 500
 
 
 def get_poetic_instructions(mood: str = "") -> str:
@@ -52,8 +69,11 @@ class OpenAIService:
         else:
             self.settings = settings
 
-        self.client = openai.AsyncOpenAI(api_key=self.settings.openai_api_key)
-        self.redis_client = redis.from_url(self.settings.redis_url)
+        self.client = openai.AsyncOpenAI(
+            api_key=self.settings.openai_api_key,
+            timeout=self.settings.openai_timeout,
+        )
+        self.redis = RedisShards(self.settings)
         self.model = self.settings.openai_model
 
     def _generate_cache_key(
@@ -167,8 +187,14 @@ class OpenAIService:
         poetic: bool = False,
         mood: str = "",
         ranevskaya: bool = False,
+        memories: Optional[List[str]] = None,
+        profile_hint: str = "",
+        user_id: Optional[int] = None,
     ) -> Optional[str]:
-        """Генерация ответа с использованием OpenAI API и контекстной памяти"""
+        """Генерация ответа с использованием OpenAI API и контекстной памяти.
+
+        С user_id расход учитывается в квоте токенов пользователя.
+        """
 
         # Проверка стоп-слов
         if stop_words:
@@ -177,12 +203,19 @@ class OpenAIService:
                 if word.lower() in message_lower:
                     return "Извини, но я не могу ответить на это сообщение."
 
-        # Проверка кеша (только для одиночных сообщений без истории)
-        if not conversation_history:
+        # Проверка кеша (только для одиночных сообщений без истории и памяти)
+        if not conversation_history and not memories and not profile_hint:
             cache_key = self._generate_cache_key(
                 message, style, user_gender, bot_gender
             )
-            cached_response = self.redis_client.get(cache_key)
+            try:
+                cached_response = await deadline.run(
+                    self.redis.client(cache_key).get(cache_key),
+                    self.settings.redis_timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Response cache lookup timed out")
+                cached_response = None
 
             if cached_response:
                 logger.info(f"Using cached response for message: {message[:50]}...")
@@ -227,10 +260,23 @@ class OpenAIService:
             """
 
             full_system_prompt = f"{system_prompt}\n\n{safety_prompt}"
+            if profile_hint:
+                full_system_prompt += f"\n\n{profile_hint}"
 
             # Формируем сообщения для API
             messages = [{"role": "system", "content": full_system_prompt}]
 
+            # Фрагменты давних диалогов из долговременной памяти
+            if memories:
+                memory_lines = "\n".join(f"- {memory}" for memory in memories)
+                messages.append(
+                    {
+                        "role": "system",
+                        "content": "Что ты помнишь из давних разговоров с "
+                        f"собеседником:\n{memory_lines}",
+                    }
+                )
+
             # Добавляем историю диалога (последние 10 сообщений для экономии токенов)
             if conversation_history:
                 recent_history = conversation_history[-10:]  # Последние 10 сообщений
@@ -245,14 +291,42 @@ class OpenAIService:
             # Добавляем текущее сообщение
             messages.append({"role": "user", "content": message})
 
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=500,
-                temperature=0.8,
-                presence_penalty=0.1,
-                frequency_penalty=0.1,
-            )
+            # Квота токенов: оценка резервируется до запроса, при превышении
+            # ответ деградирует по настройке token_quota_degrade
+            model = self.model
+            max_tokens = RESPONSE_MAX_TOKENS
+            estimate = estimate_tokens(m["content"] for m in messages) + max_tokens
+            quota: Optional[QuotaDecision] = None
+            if user_id is not None:
+                quota = await token_quota.reserve(user_id, estimate)
+                if not quota.allowed:
+                    degrade = self.settings.token_quota_degrade
+                    if degrade == "cooldown":
+                        return QUOTA_COOLDOWN_MESSAGE
+                    if degrade == "cheap_model":
+                        model = self.settings.token_quota_cheap_model
+                    else:
+                        max_tokens = self.settings.token_quota_degraded_max_tokens
+
+            used = 0
+            try:
+                response = await deadline.run(
+                    self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=0.8,
+                        presence_penalty=0.1,
+                        frequency_penalty=0.1,
+                    ),
+                    self.settings.openai_timeout,
+                )
+                used = response.usage.total_tokens if response.usage else estimate
+            finally:
+                # Резерв заменяется фактическим расходом, неудачный запрос
+                # резерв возвращает
+                if quota is not None and user_id is not None:
+                    await token_quota.settle(user_id, quota, used)
 
             bot_response = response.choices[0].message.content
             if bot_response is not None and isinstance(bot_response, str):
@@ -260,6 +334,10 @@ class OpenAIService:
             else:
                 return None
 
+        except (asyncio.TimeoutError, openai.APITimeoutError):
+            logger.warning("OpenAI request timed out, using fallback reply")
+            return TIMEOUT_FALLBACK_MESSAGE
+
         except openai.RateLimitError:
             logger.error("OpenAI API rate limit exceeded")
             rate_limit_msg: str = (
@@ -388,14 +466,20 @@ class OpenAIService:
             8. Создай ощущение реальности и присутствия в сценарии
             """
 
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "Начни ролевую игру в этом сценарии"},
-                ],
-                max_tokens=400,
-                temperature=0.9,
+            response = await deadline.run(
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {
+                            "role": "user",
+                            "content": "Начни ролевую игру в этом сценарии",
+                        },
+                    ],
+                    max_tokens=400,
+                    temperature=0.9,
+                ),
+                self.settings.openai_timeout,
             )
 
             content = response.choices[0].message.content
@@ -404,6 +488,10 @@ class OpenAIService:
             else:
                 return None
 
+        except (asyncio.TimeoutError, openai.APITimeoutError):
+            logger.warning("Roleplay scenario generation timed out")
+            return TIMEOUT_FALLBACK_MESSAGE
+
         except Exception as e:
             logger.error(f"Error generating roleplay scenario: {e}")
             scenario_error_msg: str = (
@@ -420,14 +508,17 @@ class OpenAIService:
         frequency_penalty: float = 0.1,
         **kwargs: Any,
     ) -> Optional[str]:
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            presence_penalty=presence_penalty,
-            frequency_penalty=frequency_penalty,
-            **kwargs,
+        response = await deadline.run(
+            self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                presence_penalty=presence_penalty,
+                frequency_penalty=frequency_penalty,
+                **kwargs,
+            ),
+            self.settings.openai_timeout,
         )
         content = response.choices[0].message.content
         return content.strip() if content else None
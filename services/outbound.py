@@ -0,0 +1,231 @@
+"""
+Исходящие запросы к Telegram: лимиты частоты, приоритеты, RetryAfter
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from loguru import logger
+
+from config.settings import Settings
+from services.metrics import (
+    TELEGRAM_EDITS_COALESCED,
+    TELEGRAM_SEND_RETRIES,
+    TELEGRAM_SEND_SECONDS,
+)
+
+# Приоритеты: ответы пользователю идут раньше фоновых отправок
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+# Шаг ожидания, пока ведро занято запросами более высокого приоритета
+PRIORITY_POLL_INTERVAL = 0.01
+
+# Сколько ведер чатов держать, прежде чем выбросить уже полные
+MAX_CHAT_BUCKETS = 10000
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    """Отправки внутри блока уступают очередь интерактивным ответам"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Ведро токенов с приоритетами ожидающих.
+
+    Запрос забирает токен, если он есть и никто с более высоким
+    приоритетом не ждет. block() запрещает выдачу на время RetryAfter.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._waiting = [0, 0]
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def idle(self) -> bool:
+        """Ведро полное и никому не нужно - его можно выбросить"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and not any(self._waiting)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        self._waiting[priority] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                elif self.tokens >= 1 and not any(self._waiting[:priority]):
+                    self.tokens -= 1
+                    return
+                else:
+                    await asyncio.sleep(
+                        max((1 - self.tokens) / self.rate, PRIORITY_POLL_INTERVAL)
+                    )
+        finally:
+            self._waiting[priority] -= 1
+
+
+@dataclass
+class _PendingEdit:
+    """Правка сообщения, ожидающая лимита; новые правки заменяют method.
+
+    result - задача отправки, ее ждут все схлопнутые вызовы.
+    """
+
+    method: EditMessageText
+    result: "asyncio.Future[Any]"
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """Middleware сессии бота для запросов, адресованных чатам.
+
+    Каждый запрос с chat_id ждет токен в ведре своего чата (для групп -
+    с меньшей скоростью), затем в общем ведре бота. На RetryAfter чат
+    блокируется на указанное время и запрос повторяется. Несколько правок
+    одного сообщения, ожидающих лимита, отправляются одной - последней.
+    """
+
+    def __init__(self, app_settings: Settings) -> None:
+        self.settings = app_settings
+        self.global_bucket = TokenBucket(
+            app_settings.telegram_global_rate, app_settings.telegram_global_rate
+        )
+        self._chats: Dict[int, TokenBucket] = {}
+        self._edits: Dict[Tuple[int, int], _PendingEdit] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                idle: List[int] = [k for k, b in self._chats.items() if b.idle]
+                for key in idle:
+                    del self._chats[key]
+            # Отрицательные id - группы и каналы
+            rate = (
+                self.settings.telegram_group_rate
+                if chat_id < 0
+                else self.settings.telegram_chat_rate
+            )
+            bucket = TokenBucket(rate, self.settings.telegram_chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id: int) -> None:
+        priority = _priority.get()
+        await self._chat_bucket(chat_id).acquire(priority)
+        await self.global_bucket.acquire(priority)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        # Строковые @username в chat_id бот сюда не передает
+        if not isinstance(chat_id, int):
+            return await make_request(bot, method)
+
+        started = time.monotonic()
+        try:
+            if isinstance(method, EditMessageText) and method.message_id:
+                return await self._edit(make_request, bot, method, chat_id)
+            await self._acquire(chat_id)
+            return await self._send(make_request, bot, method, chat_id)
+        finally:
+            TELEGRAM_SEND_SECONDS.labels(type(method).__name__).observe(
+                time.monotonic() - started
+            )
+
+    async def _edit(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: EditMessageText,
+        chat_id: int,
+    ) -> Response[TelegramType]:
+        key = (chat_id, method.message_id or 0)
+        pending = self._edits.get(key)
+        if pending is not None:
+            # Предыдущая правка еще ждет лимита: отправится эта
+            pending.method = method
+            TELEGRAM_EDITS_COALESCED.inc()
+        else:
+            # Отправка идет отдельной задачей: отмена вызывающего не отменяет
+            # ее для остальных, и последняя правка все равно уходит
+            pending = _PendingEdit(
+                method,
+                asyncio.ensure_future(
+                    self._deliver_edit(make_request, bot, key, chat_id)
+                ),
+            )
+            self._edits[key] = pending
+        return await asyncio.shield(pending.result)
+
+    async def _deliver_edit(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        key: Tuple[int, int],
+        chat_id: int,
+    ) -> Response[TelegramType]:
+        try:
+            await self._acquire(chat_id)
+        finally:
+            # Правки, пришедшие во время отправки, уйдут следующим запросом
+            method = self._edits.pop(key).method
+        return await self._send(make_request, bot, method, chat_id)
+
+    async def _send(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[Any],
+        chat_id: int,
+    ) -> Response[Any]:
+        attempt = 0
+        while True:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.settings.telegram_max_retries:
+                    raise
+                attempt += 1
+                name = type(method).__name__
+                TELEGRAM_SEND_RETRIES.labels(name).inc()
+                logger.warning(
+                    f"Telegram flood control on {name} to chat {chat_id}, "
+                    f"retry in {e.retry_after}s"
+                )
+                self._chat_bucket(chat_id).block(e.retry_after)
+                await self._acquire(chat_id)
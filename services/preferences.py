@@ -0,0 +1,100 @@
+"""
+Профиль предпочтений пользователя: счетчики тем и стиля, последнее настроение
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Tuple, Union
+
+TOPIC_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "работа": ("работа", "карьера", "бизнес"),
+    "путешествия": ("путешествие", "поездка", "отпуск"),
+    "развлечения": ("музыка", "фильм", "книга"),
+    "спорт": ("спорт", "фитнес", "тренировка"),
+}
+STYLE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "playful": ("шутка", "игра", "весело"),
+    "romantic": ("романтика", "любовь", "нежность"),
+    "passionate": ("страсть", "эмоции", "чувства"),
+}
+MOOD_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "радостное": ("😊", "😄", "радость", "весело"),
+    "грустное": ("😢", "грусть", "печаль"),
+    "романтичное": ("😍", "любовь", "романтика"),
+}
+
+# Поля хеша в Redis: topic:<тема>, style:<стиль> - счетчики сообщений,
+# mood - последнее распознанное настроение
+_FIELDS: Dict[str, List[str]] = {}
+for _prefix, _vocabulary in (
+    ("topic", TOPIC_KEYWORDS),
+    ("style", STYLE_KEYWORDS),
+    ("mood", MOOD_KEYWORDS),
+):
+    for _name, _words in _vocabulary.items():
+        for _word in _words:
+            _FIELDS.setdefault(_word, []).append(f"{_prefix}:{_name}")
+
+# Одно регулярное выражение на все ключевые слова: сообщение просматривается
+# за один проход. Более длинные слова идут первыми, как и при поиске
+# подстрокой, совпадения внутри слов тоже считаются
+_KEYWORDS_RE = re.compile(
+    "|".join(re.escape(word) for word in sorted(_FIELDS, key=len, reverse=True))
+)
+
+TOP_TOPICS = 3
+
+
+def detect_preferences(text: str) -> Tuple[List[str], str]:
+    """Темы и стили сообщения (поля счетчиков) и его настроение"""
+    counters: List[str] = []
+    mood = ""
+    for match in _KEYWORDS_RE.finditer(text.lower()):
+        for name in _FIELDS[match.group()]:
+            if name.startswith("mood:"):
+                mood = name[len("mood:") :]
+            elif name not in counters:
+                counters.append(name)
+    return counters, mood
+
+
+@dataclass
+class PreferenceProfile:
+    topics: List[str] = field(default_factory=list)
+    communication_style: str = "neutral"
+    mood: str = "neutral"
+
+    @classmethod
+    def from_hash(
+        cls, data: Mapping[Union[bytes, str], Union[bytes, str]]
+    ) -> "PreferenceProfile":
+        """Профиль из полей хеша Redis"""
+        topics: Dict[str, int] = {}
+        styles: Dict[str, int] = {}
+        profile = cls()
+        for raw_key, raw_value in data.items():
+            key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+            value = raw_value.decode() if isinstance(raw_value, bytes) else raw_value
+            prefix, _, name = key.partition(":")
+            if prefix == "topic":
+                topics[name] = int(value)
+            elif prefix == "style":
+                styles[name] = int(value)
+            elif prefix == "mood":
+                profile.mood = value
+        profile.topics = sorted(topics, key=lambda name: -topics[name])[:TOP_TOPICS]
+        if styles:
+            profile.communication_style = max(styles, key=lambda name: styles[name])
+        return profile
+
+    def prompt_hint(self) -> str:
+        """Описание профиля для системного промпта"""
+        parts = []
+        if self.topics:
+            parts.append(f"любимые темы: {', '.join(self.topics)}")
+        if self.communication_style != "neutral":
+            parts.append(f"тяготеет к стилю {self.communication_style}")
+        if self.mood != "neutral":
+            parts.append(f"последнее настроение: {self.mood}")
+        if not parts:
+            return ""
+        return f"О собеседнике: {'; '.join(parts)}."
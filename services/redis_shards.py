@@ -0,0 +1,68 @@
+"""
+Шардирование Redis: консистентное хеширование ключей по списку узлов
+"""
+import bisect
+import hashlib
+from typing import List, Sequence, Tuple, Union
+
+import redis.asyncio as redis
+
+from config.settings import Settings
+
+# Виртуальных точек на узел: чем больше, тем ровнее распределение
+RING_POINTS = 160
+
+ShardKey = Union[int, str]
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Кольцо консистентного хеширования.
+
+    При добавлении узла на него переезжает примерно 1/N ключей, остальные
+    остаются на своих узлах. Ключ шарда - user_id для данных пользователя,
+    либо сама строка ключа для общих данных.
+    """
+
+    def __init__(self, nodes: Sequence[str], points: int = RING_POINTS) -> None:
+        if not nodes:
+            raise ValueError("Hash ring needs at least one node")
+        ring: List[Tuple[int, int]] = []
+        for index, node in enumerate(nodes):
+            ring.extend((_hash(f"{node}#{point}"), index) for point in range(points))
+        ring.sort()
+        self._hashes = [point for point, _ in ring]
+        self._nodes = [index for _, index in ring]
+
+    def node_for(self, key: ShardKey) -> int:
+        """Индекс узла для ключа"""
+        position = bisect.bisect(self._hashes, _hash(str(key)))
+        return self._nodes[position % len(self._nodes)]
+
+
+class RedisShards:
+    """Клиенты узлов Redis и маршрутизация на них.
+
+    Узлы берутся из redis_urls, при пустом списке - единственный redis_url.
+    Пайплайн строится на client(ключ шарда) и содержит команды только
+    этого ключа, поэтому он всегда целиком уходит на один узел. Ключи
+    пользователя (контекст, сводка, сессия, память, квоты) шардируются по
+    user_id, так что пайплайн пользователя - это и есть группа его узла.
+    """
+
+    def __init__(self, app_settings: Settings) -> None:
+        urls = app_settings.redis_urls or [app_settings.redis_url]
+        # Кольцо строится по адресам, поэтому порядок в списке не важен,
+        # а смена пароля в адресе переносит ключи - используем только хост
+        self.ring = HashRing([url.rsplit("@", 1)[-1] for url in urls])
+        self.clients = [redis.from_url(url) for url in urls]
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def client(self, key: ShardKey) -> redis.Redis:
+        """Клиент узла, хранящего ключ шарда"""
+        return self.clients[self.ring.node_for(key)]
@@ -0,0 +1,159 @@
+"""
+Стеммер для русского языка (алгоритм Snowball/Портера) и токенизатор
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+_VOWELS = frozenset("аеиоуыэюя")
+
+
+def _endings(words: str) -> Tuple[str, ...]:
+    return tuple(words.split())
+
+
+# Группы окончаний: (после а/я, без условия)
+_PERFECTIVE_GERUND = (
+    _endings("в вши вшись"),
+    _endings("ив ивши ившись ыв ывши ывшись"),
+)
+_ADJECTIVE = (
+    (),
+    _endings(
+        "ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю "
+        "ая яя ою ею"
+    ),
+)
+_PARTICIPLE = (_endings("ем нн вш ющ щ"), _endings("ивш ывш ующ"))
+_REFLEXIVE = ((), _endings("ся сь"))
+_VERB = (
+    _endings("ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно"),
+    _endings(
+        "ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят "
+        "ует уют ит ыт ены ить ыть ишь ую ю"
+    ),
+)
+_NOUN = (
+    (),
+    _endings(
+        "а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом "
+        "о у ах иях ях ы ь ию ью ю ия ья я"
+    ),
+)
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+# Частые служебные слова, которые не несут смысла для поиска
+STOP_WORDS = frozenset(
+    """
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за
+    бы по только ее мне было вот от меня еще нет о из ему теперь когда даже ну
+    вдруг ли если уже или ни быть был него до вас нибудь опять уж вам ведь там
+    потом себя ничего ей может они тут где есть надо ней для мы тебя их чем
+    была сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того
+    потому этого какой совсем ним здесь этом один почти мой тем чтобы нее
+    были куда зачем всех никогда можно при наконец два об другой хоть после
+    над больше тот через эти нас про всего них какая много разве три эту моя
+    впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более
+    всегда конечно всю между это мы меня тебе
+    """.split()
+)
+
+_TOKEN_RE = re.compile(r"[а-яёa-z0-9]+")
+
+
+def _strip(word: str, groups: Tuple[Sequence[str], Sequence[str]]) -> Optional[str]:
+    """Снятие самого длинного окончания из групп.
+
+    Окончания первой группы снимаются, только если перед ними стоит а или я.
+    """
+    best = ""
+    for ending in groups[0]:
+        if (
+            len(ending) > len(best)
+            and word.endswith(ending)
+            and word[: -len(ending)][-1:] in ("а", "я")
+        ):
+            best = ending
+    for ending in groups[1]:
+        if len(ending) > len(best) and word.endswith(ending):
+            best = ending
+    return word[: -len(best)] if best else None
+
+
+def _regions(word: str) -> Tuple[int, int]:
+    """Начала областей RV и R2"""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    return rv, next_region(r1)
+
+
+def stem(word: str) -> str:
+    """Основа русского слова"""
+    word = word.lower().replace("ё", "е")
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе возвратная частица и окончания
+    stripped = _strip(rv, _PERFECTIVE_GERUND)
+    if stripped is not None:
+        rv = stripped
+    else:
+        stripped = _strip(rv, _REFLEXIVE)
+        if stripped is not None:
+            rv = stripped
+        for groups in (_ADJECTIVE, _VERB, _NOUN):
+            stripped = _strip(rv, groups)
+            if stripped is not None:
+                rv = stripped
+                # Перед окончанием прилагательного может стоять причастие
+                participle = _strip(rv, _PARTICIPLE) if groups is _ADJECTIVE else None
+                if participle is not None:
+                    rv = participle
+                break
+
+    # Шаг 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание в R2
+    r2 = max(r2_start - rv_start, 0)
+    for ending in _DERIVATIONAL:
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2:
+            rv = rv[: -len(ending)]
+            break
+
+    # Шаг 4
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        for ending in _SUPERLATIVE:
+            if rv.endswith(ending):
+                rv = rv[: -len(ending)]
+                if rv.endswith("нн"):
+                    rv = rv[:-1]
+                break
+        else:
+            if rv.endswith("ь"):
+                rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text: str) -> List[str]:
+    """Основы значимых слов текста"""
+    return [
+        stem(token)
+        for token in _TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
@@ -0,0 +1,187 @@
+"""
+Квоты токенов OpenAI на пользователя: счетчики в Redis, сброс в PostgreSQL
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import Settings, settings
+from database.connection import db
+from services import deadline
+from services.redis_shards import RedisShards
+
+# Проверка и резервирование одним шагом: KEYS - дневной и месячный
+# счетчики; ARGV - резерв, дневной и месячный лимиты (0 - без лимита) и
+# TTL счетчиков. Возвращает 0 при успехе, иначе номер превышенного лимита
+RESERVE_SCRIPT = """
+local amount = tonumber(ARGV[1])
+for i = 1, 2 do
+    local limit = tonumber(ARGV[i + 1])
+    if limit > 0 and tonumber(redis.call('GET', KEYS[i]) or '0') + amount > limit then
+        return i
+    end
+end
+for i = 1, 2 do
+    redis.call('INCRBY', KEYS[i], amount)
+    redis.call('EXPIRE', KEYS[i], ARGV[i + 3])
+end
+return 0
+"""
+
+# Счетчики живут чуть дольше своего периода
+DAILY_TTL = 2 * 86400
+MONTHLY_TTL = 32 * 86400
+
+PERIODS = ("daily", "monthly")
+
+# Грубая оценка числа токенов модели в русском тексте
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(texts: Iterable[str]) -> int:
+    """Оценка числа токенов промпта до запроса"""
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN
+
+
+@dataclass
+class QuotaDecision:
+    """Результат проверки квоты перед запросом к OpenAI"""
+
+    allowed: bool
+    reserved: int = 0
+    exceeded: str = ""
+    keys: Tuple[str, ...] = ()
+    day: Optional[date] = None
+
+
+class TokenQuota:
+    """Дневные и месячные квоты токенов пользователя.
+
+    Перед запросом оценка расхода атомарно проверяется и резервируется в
+    Redis, после ответа резерв исправляется на фактический расход из
+    usage. Фактический расход копится в памяти процесса и периодически
+    прибавляется к user_token_usage в PostgreSQL.
+    """
+
+    def __init__(self, app_settings: Optional[Settings] = None) -> None:
+        # Используем переданные настройки, settings или создаем новый экземпляр
+        if app_settings is not None:
+            self.settings: Settings = app_settings
+        elif settings is None:
+            # В тестах или CI/CD создаем с дефолтными значениями
+            self.settings = Settings(
+                bot_token="dummy_token",
+                openai_api_key="dummy_key",
+                database_url="dummy_url",
+                redis_url="redis://localhost:6379/0",
+                openai_model="gpt-4-turbo-preview",
+            )
+        else:
+            self.settings = settings
+        self.redis = RedisShards(self.settings)
+        self._reserve = self.redis.clients[0].register_script(RESERVE_SCRIPT)
+        self._pending: Dict[Tuple[int, date], int] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.settings.token_quota_daily > 0 or self.settings.token_quota_monthly > 0
+        )
+
+    def _keys(self, user_id: int, day: date) -> Tuple[str, str]:
+        return f"quota:{user_id}:d:{day:%Y%m%d}", f"quota:{user_id}:m:{day:%Y%m}"
+
+    async def reserve(self, user_id: int, estimate: int) -> QuotaDecision:
+        """Проверка квоты и резервирование оценки расхода"""
+        day = datetime.now(timezone.utc).date()
+        keys = self._keys(user_id, day)
+        if not self.enabled:
+            return QuotaDecision(allowed=True, keys=keys, day=day)
+        try:
+            exceeded = await deadline.run(
+                self._reserve(
+                    keys=keys,
+                    args=[
+                        estimate,
+                        self.settings.token_quota_daily,
+                        self.settings.token_quota_monthly,
+                        DAILY_TTL,
+                        MONTHLY_TTL,
+                    ],
+                    client=self.redis.client(user_id),
+                ),
+                self.settings.redis_timeout,
+            )
+        except Exception as e:
+            # Недоступность Redis не должна лишать всех ответов
+            logger.warning(f"Token quota check for user {user_id} failed: {e}")
+            return QuotaDecision(allowed=True, keys=keys, day=day)
+        if exceeded:
+            period = PERIODS[int(exceeded) - 1]
+            logger.info(f"User {user_id} exceeded {period} token quota")
+            return QuotaDecision(allowed=False, exceeded=period, keys=keys, day=day)
+        return QuotaDecision(allowed=True, reserved=estimate, keys=keys, day=day)
+
+    async def settle(self, user_id: int, decision: QuotaDecision, used: int) -> None:
+        """Замена резерва фактическим расходом (0, если запрос не удался)"""
+        if decision.day is None:
+            return
+        if used:
+            usage_key = (user_id, decision.day)
+            self._pending[usage_key] = self._pending.get(usage_key, 0) + used
+        delta = used - decision.reserved
+        if not self.enabled or delta == 0:
+            return
+        pipe = self.redis.client(user_id).pipeline(transaction=False)
+        for key, ttl in zip(decision.keys, (DAILY_TTL, MONTHLY_TTL)):
+            pipe.incrby(key, delta)
+            pipe.expire(key, ttl)
+        try:
+            await deadline.run(pipe.execute(), self.settings.redis_timeout)
+        except Exception as e:
+            logger.warning(f"Token quota settle for user {user_id} failed: {e}")
+
+    def start(self) -> None:
+        """Запуск периодического сброса расхода в базу"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Остановка цикла и сброс накопленного расхода"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.token_usage_flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Прибавление накопленного расхода к user_token_usage"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        usage: List[Tuple[int, date, int]] = [
+            (user_id, day, tokens) for (user_id, day), tokens in pending.items()
+        ]
+        try:
+            await db.add_token_usage(usage)
+        except Exception as e:
+            logger.error(f"Failed to flush token usage of {len(usage)} users: {e}")
+            # Возвращаем расход к новому, накопленному за время запроса
+            for key, tokens in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + tokens
+
+
+# Глобальный экземпляр квот токенов
+token_quota = TokenQuota()
@@ -0,0 +1,77 @@
+"""
+Отсев повторно доставленных апдейтов Telegram по update_id
+"""
+from typing import Optional
+
+from loguru import logger
+
+from config.settings import Settings, settings
+from services import deadline
+from services.redis_shards import RedisShards
+
+
+class UpdateDeduplicator:
+    """Общий для реплик журнал обработанных update_id.
+
+    Апдейт захватывается атомарным SET NX с TTL update_dedup_ttl: повторная
+    доставка после перезапуска или таймаута вебхука не пройдет, пока ключ
+    жив. Если обработка упала с ошибкой, захват снимается, чтобы повторная
+    доставка могла ее завершить.
+    """
+
+    def __init__(self, app_settings: Optional[Settings] = None) -> None:
+        # Используем переданные настройки, settings или создаем новый экземпляр
+        if app_settings is not None:
+            self.settings: Settings = app_settings
+        elif settings is None:
+            # В тестах или CI/CD создаем с дефолтными значениями
+            self.settings = Settings(
+                bot_token="dummy_token",
+                openai_api_key="dummy_key",
+                database_url="dummy_url",
+                redis_url="redis://localhost:6379/0",
+                openai_model="gpt-4-turbo-preview",
+            )
+        else:
+            self.settings = settings
+        self.redis = RedisShards(self.settings)
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.update_dedup_ttl > 0
+
+    def key(self, update_id: int) -> str:
+        return f"update:{update_id}"
+
+    async def claim(self, update_id: int) -> bool:
+        """Захват апдейта; False - он уже обработан или обрабатывается"""
+        if not self.enabled:
+            return True
+        try:
+            claimed = await deadline.run(
+                self.redis.client(update_id).set(
+                    self.key(update_id), 1, nx=True, ex=self.settings.update_dedup_ttl
+                ),
+                self.settings.redis_timeout,
+            )
+        except Exception as e:
+            # Без Redis лучше возможный дубль, чем потерянное сообщение
+            logger.warning(f"Update {update_id} dedup check failed: {e}")
+            return True
+        return bool(claimed)
+
+    async def release(self, update_id: int) -> None:
+        """Снятие захвата после неудачной обработки"""
+        if not self.enabled:
+            return
+        try:
+            await deadline.run(
+                self.redis.client(update_id).delete(self.key(update_id)),
+                self.settings.redis_timeout,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to release update {update_id}: {e}")
+
+
+# Глобальный экземпляр журнала апдейтов
+update_deduplicator = UpdateDeduplicator()
@@ -0,0 +1,299 @@
+"""
+Режим нескольких процессов: прием апдейтов и раздача воркерам по user_id
+"""
+import asyncio
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from queue import Empty
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+from loguru import logger
+
+from services.metrics import (
+    WORKER_QUEUE_DEPTH,
+    WORKER_RESTARTS,
+    WORKER_UPDATES,
+    WORKER_UPDATES_LOST,
+)
+
+# Элемент очереди воркера: ключ порядка и апдейт в формате Bot API;
+# None - сигнал остановки
+WorkItem = Optional[Tuple[int, Dict[str, Any]]]
+WorkerTarget = Callable[[int, "Queue[WorkItem]"], None]
+Handle = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+POLLING_TIMEOUT = 30
+POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+
+# Сколько ждать, пока воркер дообработает очередь при остановке
+WORKER_STOP_TIMEOUT = 30.0
+
+# Как часто простаивающий воркер проверяет, жив ли процесс приема
+PARENT_CHECK_INTERVAL = 1.0
+
+# Сколько ждать очередной элемент при разборе очереди упавшего воркера
+DRAIN_TIMEOUT = 0.1
+
+
+def partition_key(update: Update) -> int:
+    """Ключ воркера: пользователь, иначе чат, иначе сам апдейт"""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.user is not None:
+        return context.user.id
+    if context.chat is not None:
+        return context.chat.id
+    return update.update_id
+
+
+class KeyedSerializer:
+    """Параллельная обработка с сохранением порядка внутри ключа.
+
+    Задачи разных ключей выполняются одновременно, задача ключа
+    начинается только после завершения предыдущей задачи того же ключа.
+    """
+
+    def __init__(self) -> None:
+        self._tails: Dict[int, "asyncio.Task[None]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._tails)
+
+    def submit(
+        self, key: int, make: Callable[[], Awaitable[Any]]
+    ) -> "asyncio.Task[None]":
+        task = asyncio.create_task(self._run(self._tails.get(key), make))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def _forget(self, key: int, task: "asyncio.Task[None]") -> None:
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _run(
+        self,
+        previous: Optional["asyncio.Task[None]"],
+        make: Callable[[], Awaitable[Any]],
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await make()
+        except Exception as e:
+            logger.error(f"Failed to process update: {e}")
+
+    async def join(self) -> None:
+        """Ожидание всех отправленных задач"""
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+def _next_item(queue: "Queue[WorkItem]") -> WorkItem:
+    """Следующий элемент очереди; None и после смерти процесса приема.
+
+    Воркер игнорирует сигналы терминала, поэтому сам следит за родителем:
+    если прием убит, сигнал остановки уже никто не пришлет.
+    """
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            return queue.get(timeout=PARENT_CHECK_INTERVAL)
+        except Empty:
+            if parent is not None and not parent.is_alive():
+                logger.error("Ingest process exited, stopping worker")
+                return None
+
+
+async def consume(queue: "Queue[WorkItem]", handle: Handle) -> None:
+    """Обработка очереди воркера до сигнала остановки и ее дообработка"""
+    loop = asyncio.get_running_loop()
+    serializer = KeyedSerializer()
+    while True:
+        item = await loop.run_in_executor(None, _next_item, queue)
+        if item is None:
+            break
+        key, data = item
+        serializer.submit(key, lambda data=data: handle(data))  # type: ignore[misc]
+    await serializer.join()
+
+
+def drain_queue(queue: "Queue[WorkItem]") -> Tuple[List[WorkItem], int]:
+    """Разбор очереди упавшего воркера: оставшиеся апдейты и число потерянных.
+
+    Воркер мог умереть внутри get() с захваченной блокировкой чтения или
+    посреди чтения элемента - тогда то, что осталось в очереди, достать
+    нельзя, и оно только считается.
+    """
+    items: List[WorkItem] = []
+    while True:
+        try:
+            item = queue.get(timeout=DRAIN_TIMEOUT)
+        except Empty:
+            break
+        except Exception as e:
+            logger.error(f"Failed to read the queue of a crashed worker: {e}")
+            break
+        if item is not None:
+            items.append(item)
+    try:
+        lost = queue.qsize()
+    except NotImplementedError:
+        # qsize недоступен на macOS
+        lost = 0
+    # Очередь больше никто не читает: не ждать ее сброса при выходе
+    queue.cancel_join_thread()
+    return items, lost
+
+
+class WorkerPool:
+    """Процессы-воркеры со своими очередями.
+
+    Апдейты пользователя всегда уходят одному воркеру (user_id по модулю
+    числа воркеров), поэтому их порядок сохраняется, а состояние в памяти
+    воркера (FSM, локальные кеши) ни с кем не делится. Упавший воркер
+    перезапускается с тем же номером и продолжает обслуживать тех же
+    пользователей.
+    """
+
+    def __init__(self, size: int, target: WorkerTarget) -> None:
+        self.size = size
+        self.target = target
+        # spawn: воркеры не наследуют event loop и соединения приема
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List["Queue[WorkItem]"] = []
+        self._processes: List[BaseProcess] = []
+
+    def start(self) -> None:
+        for index in range(self.size):
+            queue, process = self._spawn(index)
+            self._queues.append(queue)
+            self._processes.append(process)
+        logger.info(f"Started {self.size} worker processes")
+
+    def _spawn(
+        self, index: int, queue: Optional["Queue[WorkItem]"] = None
+    ) -> Tuple["Queue[WorkItem]", BaseProcess]:
+        if queue is None:
+            queue = self._context.Queue()
+        # daemon: штатно завершающийся прием не оставляет воркеров за собой
+        process = self._context.Process(
+            target=self.target,
+            args=(index, queue),
+            name=f"worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return queue, process
+
+    def worker_for(self, key: int) -> int:
+        return key % self.size
+
+    def dispatch(self, update: Update) -> None:
+        """Передача апдейта воркеру его пользователя"""
+        key = partition_key(update)
+        index = self.worker_for(key)
+        data = update.model_dump(mode="json", exclude_unset=True, by_alias=True)
+        self._queues[index].put((key, data))
+        WORKER_UPDATES.labels(str(index)).inc()
+
+    def supervise(self) -> None:
+        """Перезапуск упавших воркеров и обновление метрик очередей"""
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                logger.error(
+                    f"Worker {index} exited with code {process.exitcode}, restarting"
+                )
+                WORKER_RESTARTS.labels(str(index)).inc()
+                if process.exitcode == 0:
+                    # Штатно вышедший воркер оставляет очередь целой
+                    queue, process = self._spawn(index, self._queues[index])
+                else:
+                    queue, process = self._spawn(index)
+                    self._requeue(index, queue)
+                self._queues[index], self._processes[index] = queue, process
+            try:
+                WORKER_QUEUE_DEPTH.labels(str(index)).set(self._queues[index].qsize())
+            except NotImplementedError:
+                # qsize недоступен на macOS
+                pass
+
+    def _requeue(self, index: int, queue: "Queue[WorkItem]") -> None:
+        """Перенос апдейтов из очереди упавшего воркера в очередь нового.
+
+        Апдейты, которые упавший воркер уже забрал и не успел обработать,
+        не вернуть: Telegram их повторно не доставит.
+        """
+        items, lost = drain_queue(self._queues[index])
+        for item in items:
+            queue.put(item)
+        if lost:
+            WORKER_UPDATES_LOST.labels(str(index)).inc(lost)
+        logger.warning(
+            f"Worker {index}: moved {len(items)} queued updates to the new "
+            f"process, lost {lost} stuck in the old queue"
+        )
+
+    async def stop(self) -> None:
+        """Остановка воркеров после дообработки их очередей"""
+        loop = asyncio.get_running_loop()
+        for queue in self._queues:
+            queue.put(None)
+        for index, process in enumerate(self._processes):
+            await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in time, terminating")
+                process.terminate()
+        logger.info("Worker processes stopped")
+
+
+async def ingest(
+    bot: Bot,
+    pool: WorkerPool,
+    stop: asyncio.Event,
+    allowed_updates: Optional[List[str]] = None,
+) -> None:
+    """Long polling Telegram с раздачей апдейтов воркерам до события stop"""
+    backoff = Backoff(POLLING_BACKOFF)
+    get_updates = GetUpdates(timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates)
+    # Запрос висит до POLLING_TIMEOUT, таймаут сессии считается сверх него
+    request_timeout = int(bot.session.timeout + POLLING_TIMEOUT)
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        while True:
+            poll = asyncio.create_task(
+                bot(get_updates, request_timeout=request_timeout)
+            )
+            await asyncio.wait({poll, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if stopped.done():
+                # Неподтвержденные апдейты Telegram доставит после перезапуска
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except Exception as e:
+                logger.error(f"Failed to fetch updates: {e}")
+                pool.supervise()
+                await backoff.asleep()
+                continue
+            backoff.reset()
+            # Воркер мог упасть за время long polling: апдейты не должны уйти
+            # в очередь, которую перезапуск выбросит
+            pool.supervise()
+            for update in updates:
+                pool.dispatch(update)
+                get_updates.offset = update.update_id + 1
+    finally:
+        stopped.cancel()
+
+    # Подтверждение уже разданных апдейтов, чтобы они не пришли повторно
+    if get_updates.offset is not None:
+        try:
+            await bot(GetUpdates(offset=get_updates.offset, limit=1, timeout=0))
+        except Exception as e:
+            logger.warning(f"Failed to confirm dispatched updates: {e}")
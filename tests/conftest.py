@@ -2,6 +2,11 @@ import os
 from unittest.mock import patch
 
 import pytest
+import redis
+import redis.asyncio
+
+# Отдельная база локального Redis, чтобы тесты не задевали данные бота
+REDIS_URL = "redis://localhost:6379/15"
 
 
 @pytest.fixture(autouse=True)
@@ -40,3 +45,45 @@ def settings():
         cache_ttl=3600,
         log_level="INFO",
     )
+
+
+@pytest.fixture(scope="session")
+def redis_server():
+    """Сервер для тестов Lua-скриптов: None - локальный Redis, иначе fakeredis"""
+    client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1)
+    try:
+        client.ping()
+        return None
+    except redis.RedisError:
+        pass
+    finally:
+        client.close()
+    fakeredis = pytest.importorskip(
+        "fakeredis", reason="neither Redis nor fakeredis is available"
+    )
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_settings(redis_server, monkeypatch):
+    """Фабрика Settings для сервисов на Redis (локальном или fakeredis)"""
+    if redis_server is not None:
+        import fakeredis
+
+        monkeypatch.setattr(
+            redis.asyncio,
+            "from_url",
+            lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=redis_server),
+        )
+    from config.settings import Settings
+
+    def make(**overrides):
+        return Settings(
+            bot_token="dummy_token",
+            openai_api_key="dummy_key",
+            database_url="dummy_url",
+            redis_url=REDIS_URL,
+            **overrides,
+        )
+
+    return make
@@ -0,0 +1,63 @@
+import json
+import zlib
+
+import pytest
+
+from services.context_codec import (
+    COMPRESS_THRESHOLD,
+    FLAG_ZLIB,
+    decode_context,
+    encode_context,
+)
+
+
+class TestContextCodec:
+    """Тесты для бинарного кодека контекста"""
+
+    def make_context(self, repeat=1):
+        return [
+            {
+                "role": "user",
+                "content": "Привет! Как прошел день? 😊" * repeat,
+                "timestamp": "2024-05-01T12:30:15",
+            },
+            {
+                "role": "assistant",
+                "content": "Отлично, думала о тебе",
+                "timestamp": "2024-05-01T12:30:20",
+            },
+            {"role": "system", "content": "Сводка разговора"},
+        ]
+
+    def test_roundtrip(self):
+        """Сообщения восстанавливаются с точностью до секунды"""
+        context = self.make_context()
+        assert decode_context(encode_context(context)) == context
+
+    def test_large_values_are_compressed(self):
+        """Тело длиннее порога сжимается"""
+        blob = encode_context(self.make_context(repeat=50))
+        assert blob[1] & FLAG_ZLIB
+        assert len(blob) < COMPRESS_THRESHOLD
+        assert decode_context(blob) == self.make_context(repeat=50)
+
+    def test_smaller_than_json(self):
+        """Значение заметно меньше JSON того же контекста"""
+        context = self.make_context()
+        legacy = json.dumps(context, ensure_ascii=False).encode("utf-8")
+        assert len(encode_context(context)) < len(legacy) / 2
+
+    def test_reads_legacy_json(self):
+        """Старые JSON-значения в Redis читаются прозрачно"""
+        context = self.make_context()
+        legacy = json.dumps(context, ensure_ascii=False).encode("utf-8")
+        assert decode_context(legacy) == context
+
+    @pytest.mark.parametrize(
+        "blob",
+        [b"", b"\x07\x00", b"\x01\x00\x01\x00", b"\x01\x01" + zlib.compress(b"")[:3]],
+    )
+    def test_corrupted_values_raise_value_error(self, blob):
+        """Поврежденные значения дают ValueError"""
+        with pytest.raises(ValueError):
+            decode_context(blob)
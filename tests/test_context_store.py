@@ -0,0 +1,68 @@
+import asyncio
+import uuid
+
+import pytest
+
+from services.context_store import ContextStore
+from services.redis_shards import RedisShards
+
+
+class TestContextStore:
+    """Стресс-тесты атомарных изменений контекста"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writers_lose_nothing(self, redis_settings):
+        """Параллельные записи двух реплик не теряют ни одного сообщения"""
+        shards = RedisShards(redis_settings())
+        user_id = uuid.uuid4().int % 10**9
+        replicas = [ContextStore(shards, 60, 5.0, f"replica-{i}") for i in range(2)]
+
+        async def write(i):
+            store = replicas[i % 2]
+            # Половина писателей начинает с заведомо устаревшей версии
+            current = (0, []) if i % 3 == 0 else None
+            message = {"role": "user", "content": f"turn {i}"}
+            await store.append(user_id, [message], 100, current=current)
+
+        await asyncio.gather(*(write(i) for i in range(12)))
+
+        version, context = await replicas[0].load(user_id)
+        assert version == 12
+        assert sorted(m["content"] for m in context) == sorted(
+            f"turn {i}" for i in range(12)
+        )
+        await replicas[0].clear(user_id)
+
+    @pytest.mark.asyncio
+    async def test_clear_rejects_in_flight_write(self, redis_settings):
+        """Запись, прочитавшая контекст до очистки, не возвращает старые данные"""
+        shards = RedisShards(redis_settings())
+        user_id = uuid.uuid4().int % 10**9
+        store = ContextStore(shards, 60, 5.0, "replica")
+        old = {"role": "user", "content": "old"}
+        snapshot = await store.append(user_id, [old], 100)
+
+        await store.clear(user_id)
+        new = {"role": "user", "content": "new"}
+        version, context = await store.append(user_id, [new], 100, current=snapshot)
+
+        assert version == snapshot[0] + 2
+        assert context == [new]
+        await store.clear(user_id)
+
+    @pytest.mark.asyncio
+    async def test_load_extends_ttls_without_rewrite(self, redis_settings):
+        """Чтение продлевает TTL контекста и связанных ключей"""
+        shards = RedisShards(redis_settings())
+        user_id = uuid.uuid4().int % 10**9
+        store = ContextStore(shards, 60, 5.0, "replica")
+        client = shards.client(user_id)
+        await store.append(user_id, [{"role": "user", "content": "hi"}], 100)
+        await client.expire(store.key(user_id), 5)
+        await client.set(f"summary:{user_id}", "summary", ex=5)
+
+        await store.load(user_id, touch=[(f"summary:{user_id}", 600)])
+
+        assert await client.ttl(store.key(user_id)) > 5
+        assert await client.ttl(f"summary:{user_id}") > 60
+        await store.clear(user_id, extra_keys=[f"summary:{user_id}"])
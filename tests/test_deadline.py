@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from services import deadline
+
+
+class TestDeadline:
+    """Тесты для дедлайна обработки апдейта"""
+
+    def test_no_deadline_uses_default(self):
+        """Без дедлайна используется таймаут по умолчанию"""
+        assert deadline.remaining() is None
+        assert deadline.timeout(5.0) == 5.0
+        assert deadline.timeout() is None
+
+    def test_timeout_capped_by_remaining_budget(self):
+        """Таймаут не превышает оставшийся бюджет"""
+        token = deadline.start(1.0)
+        try:
+            assert deadline.timeout(10.0) <= 1.0
+            assert deadline.timeout(0.5) == 0.5
+        finally:
+            deadline.reset(token)
+        assert deadline.remaining() is None
+
+    def test_exhausted_budget_raises(self):
+        """Исчерпанный бюджет сразу дает DeadlineExceeded"""
+        token = deadline.start(-1.0)
+        try:
+            with pytest.raises(deadline.DeadlineExceeded):
+                deadline.timeout(5.0)
+        finally:
+            deadline.reset(token)
+
+    @pytest.mark.asyncio
+    async def test_run_cancels_slow_call(self):
+        """Медленный вызов отменяется по дедлайну"""
+        cancelled = False
+
+        async def slow() -> None:
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        token = deadline.start(0.05)
+        try:
+            with pytest.raises(deadline.DeadlineExceeded):
+                await deadline.run(slow(), default=5.0)
+        finally:
+            deadline.reset(token)
+        assert cancelled
+
+    @pytest.mark.asyncio
+    async def test_run_default_timeout_is_plain_timeout(self):
+        """Таймаут зависимости при живом бюджете - обычный TimeoutError"""
+        token = deadline.start(5.0)
+        try:
+            with pytest.raises(asyncio.TimeoutError) as exc_info:
+                await deadline.run(asyncio.sleep(1), default=0.01)
+        finally:
+            deadline.reset(token)
+        assert not isinstance(exc_info.value, deadline.DeadlineExceeded)
+
+    @pytest.mark.asyncio
+    async def test_run_returns_result(self):
+        """Быстрый вызов возвращает результат"""
+
+        async def fast() -> int:
+            return 42
+
+        assert await deadline.run(fast(), default=1.0) == 42
@@ -0,0 +1,68 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database.connection import DatabaseManager
+
+
+def _rows(count):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "id": i,
+            "user_id": 1,
+            "message": f"m{i}",
+            "bot_response": f"r{i}",
+            "communication_style": "playful",
+            "tokens_used": i,
+            "created_at": start + timedelta(minutes=i),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def _fake_read(rows, calls):
+    async def _read(user_id, statement, uid, last_created, last_id, limit, one=False):
+        calls.append((last_created, last_id))
+        after = [
+            r for r in rows if (r["created_at"], r["id"]) > (last_created, last_id)
+        ]
+        return after[:limit]
+
+    return _read
+
+
+class TestExport:
+    """Тесты для постраничной выгрузки истории"""
+
+    @pytest.mark.asyncio
+    async def test_iter_conversations_pages_by_keyset(self):
+        """История читается страницами от последнего ключа"""
+        rows, calls = _rows(5), []
+        manager = DatabaseManager()
+        manager._read = _fake_read(rows, calls)
+
+        ids = [c.id async for c in manager.iter_conversations(1, batch_size=2)]
+
+        assert ids == [1, 2, 3, 4, 5]
+        assert [last_id for _, last_id in calls] == [0, 2, 4]
+
+    @pytest.mark.asyncio
+    async def test_export_writes_gzip_jsonl(self, tmp_path, monkeypatch):
+        """Выгрузка пишет по строке JSON на диалог"""
+        from services import export
+
+        manager = DatabaseManager()
+        manager._read = _fake_read(_rows(3), [])
+        monkeypatch.setattr(export, "db", manager)
+        path = tmp_path / "export.jsonl.gz"
+
+        count = await export.export_conversations(1, str(path))
+
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            lines = [json.loads(line) for line in file]
+        assert count == 3
+        assert [line["message"] for line in lines] == ["m1", "m2", "m3"]
+        assert lines[0]["communication_style"] == "playful"
@@ -0,0 +1,52 @@
+import asyncio
+import uuid
+
+import pytest
+
+from config.settings import Settings
+from services.flood_control import FloodControl
+
+
+class TestFloodControl:
+    """Тесты для защиты от флуда"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_single_notice(self, redis_settings):
+        """Сверх емкости ведра апдейты отбрасываются, предупреждение одно"""
+        flood = FloodControl(redis_settings(flood_rate=0.1, flood_burst=3))
+        user_id = uuid.uuid4().int % 10**9
+
+        decisions = await asyncio.gather(*(flood.check(user_id) for _ in range(6)))
+        assert sum(decision.allowed for decision in decisions) == 3
+        assert sum(decision.notify for decision in decisions) == 1
+        assert all(decision.wait == 0 for decision in decisions)
+
+        await flood.redis.client(user_id).delete(flood.key(user_id))
+
+    @pytest.mark.asyncio
+    async def test_excess_waits_in_queue(self, redis_settings):
+        """С очередью лишний апдейт ждет, пока ведро не вытечет"""
+        flood = FloodControl(
+            redis_settings(flood_rate=10, flood_burst=1, flood_queue_delay=0.25)
+        )
+        user_id = uuid.uuid4().int % 10**9
+
+        first, second, third, fourth = [await flood.check(user_id) for _ in range(4)]
+        assert first.allowed and first.wait == 0
+        assert second.allowed and 0 < second.wait <= 0.1
+        assert third.allowed and 0.1 < third.wait <= 0.2
+        assert not fourth.allowed and fourth.notify
+
+        await flood.redis.client(user_id).delete(flood.key(user_id))
+
+    def test_disabled_without_rate(self):
+        """Нулевая скорость отключает ограничение"""
+        flood = FloodControl(
+            Settings(
+                bot_token="dummy_token",
+                openai_api_key="dummy_key",
+                database_url="dummy_url",
+                flood_rate=0,
+            )
+        )
+        assert not flood.enabled
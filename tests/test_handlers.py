@@ -0,0 +1,53 @@
+import pytest
+from aiogram.types import Message
+
+import config.settings
+
+
+@pytest.fixture
+def user_handlers(settings, monkeypatch):
+    """Модуль обработчиков; его синглтоны создаются из тестовых настроек"""
+    monkeypatch.setattr(config.settings, "settings", settings)
+    from handlers import user_handlers
+
+    return user_handlers
+
+
+def make_message(text):
+    return Message.model_validate(
+        {
+            "message_id": 1,
+            "date": 1700000000,
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Аня"},
+            "text": text,
+        }
+    )
+
+
+async def routed_handler(router, text, state):
+    """Обработчик, который выберет роутер для сообщения в состоянии state"""
+    message = make_message(text)
+    for handler in router.message.handlers:
+        matched, _ = await handler.check(message, bot=None, raw_state=state)
+        if matched:
+            return handler.callback
+    return None
+
+
+class TestHandlerRouting:
+    """Тесты для порядка регистрации обработчиков"""
+
+    @pytest.mark.asyncio
+    async def test_export_in_conversation(self, user_handlers):
+        """/export в режиме общения не уходит в диалог с моделью"""
+        state = user_handlers.UserStates.in_conversation.state
+        handler = await routed_handler(user_handlers.router, "/export", state)
+        assert handler is user_handlers.cmd_export
+
+    @pytest.mark.asyncio
+    async def test_search_in_conversation(self, user_handlers):
+        """/search в режиме общения ищет, а не отвечает моделью"""
+        state = user_handlers.UserStates.in_conversation.state
+        handler = await routed_handler(user_handlers.router, "/search море", state)
+        assert handler is user_handlers.cmd_search
@@ -0,0 +1,39 @@
+import time
+
+from services.local_cache import LocalCache
+
+
+class TestLocalCache:
+    """Тесты для локального LRU-кеша"""
+
+    def test_lru_eviction_by_size(self):
+        """При превышении объема вытесняются давно использованные записи"""
+        cache = LocalCache(max_bytes=30, ttl=60)
+        cache.set(1, "a", 10)
+        cache.set(2, "b", 10)
+        cache.set(3, "c", 10)
+        assert cache.get(1) == "a"
+        cache.set(4, "d", 10)
+        assert cache.get(2) is None
+        assert cache.get(1) == "a"
+        assert cache.size == 30
+
+    def test_oversized_value_not_cached(self):
+        """Значение больше всего кеша не сохраняется"""
+        cache = LocalCache(max_bytes=10, ttl=60)
+        cache.set(1, "a", 5)
+        cache.set(1, "big", 11)
+        assert cache.get(1) is None
+        assert cache.size == 0
+
+    def test_ttl_and_stats(self):
+        """Записи истекают по TTL, попадания и промахи считаются"""
+        cache = LocalCache(max_bytes=100, ttl=0.01)
+        cache.set(1, "a", 1)
+        assert cache.get(1) == "a"
+        time.sleep(0.02)
+        assert cache.get(1) is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.hit_ratio == 0.5
+        assert len(cache) == 0
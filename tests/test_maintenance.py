@@ -0,0 +1,49 @@
+import pytest
+
+from config.settings import Settings
+from services.maintenance import MaintenanceService
+
+
+class FakeConnection:
+    """Соединение, в котором advisory-лок переноса уже занят или свободен"""
+
+    def __init__(self, lock_free):
+        self.lock_free = lock_free
+        self.executed = []
+
+    async def fetchval(self, query, *args):
+        return self.lock_free
+
+    async def execute(self, query, *args):
+        self.executed.append(query)
+        return "DELETE 0"
+
+
+def make_service():
+    return MaintenanceService(
+        Settings(
+            bot_token="dummy_token",
+            openai_api_key="dummy_key",
+            database_url="dummy_url",
+        )
+    )
+
+
+class TestMaintenance:
+    """Тесты для фонового обслуживания БД"""
+
+    @pytest.mark.asyncio
+    async def test_purge_skipped_during_partitioning(self):
+        """Пока идет перенос в партиции, старые диалоги не удаляются"""
+        conn = FakeConnection(lock_free=False)
+        summary = await make_service()._purge_old_conversations(conn)
+        assert "skipped" in summary
+        assert conn.executed == []
+
+    @pytest.mark.asyncio
+    async def test_purge_releases_migration_lock(self):
+        """Очистка отпускает лок переноса после удаления"""
+        conn = FakeConnection(lock_free=True)
+        await make_service()._purge_old_conversations(conn)
+        assert "DELETE" in conn.executed[0]
+        assert "pg_advisory_unlock" in conn.executed[-1]
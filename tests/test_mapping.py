@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from database.mapping import (
+    record_to_conversation,
+    record_to_search_result,
+    record_to_user,
+    record_to_user_stats,
+)
+from database.models import CommunicationStyle, Gender
+
+
+class TestMapping:
+    """Тесты для преобразования строк БД в модели"""
+
+    def test_record_to_user(self):
+        """Строка users превращается в User с enum-полями"""
+        now = datetime.now()
+        user = record_to_user(
+            {
+                "user_id": 1,
+                "username": None,
+                "first_name": "Test",
+                "last_name": None,
+                "gender": "male",
+                "bot_gender": "female",
+                "communication_style": "mysterious",
+                "consent_given": True,
+                "stop_words": None,
+                "persona": "poet",
+                "created_at": now,
+                "updated_at": now,
+                "is_active": True,
+            }
+        )
+
+        assert user.gender is Gender.MALE
+        assert user.bot_gender is Gender.FEMALE
+        assert user.communication_style is CommunicationStyle.MYSTERIOUS
+        assert user.stop_words == []
+        assert user.persona == "poet"
+
+    def test_record_to_user_stats_and_conversation(self):
+        """Строки user_stats и conversations превращаются в модели"""
+        now = datetime.now()
+        stats = record_to_user_stats(
+            {
+                "user_id": 1,
+                "total_messages": 3,
+                "total_tokens": 30,
+                "favorite_style": "romantic",
+                "last_activity": now,
+                "created_at": now,
+                "updated_at": now,
+                "playful_messages": 1,
+                "romantic_messages": 2,
+                "passionate_messages": 0,
+                "mysterious_messages": 0,
+            }
+        )
+        conversation = record_to_conversation(
+            {
+                "id": 7,
+                "user_id": 1,
+                "message": "Привет",
+                "bot_response": "Привет!",
+                "communication_style": "playful",
+                "tokens_used": 2,
+                "created_at": now,
+            }
+        )
+
+        assert stats.favorite_style is CommunicationStyle.ROMANTIC
+        assert stats.style_messages[CommunicationStyle.ROMANTIC] == 2
+        assert conversation.communication_style is CommunicationStyle.PLAYFUL
+        assert conversation.id == 7
+
+    def test_record_to_search_result(self):
+        """Строка поиска превращается в SearchResult с диалогом внутри"""
+        result = record_to_search_result(
+            {
+                "id": 3,
+                "user_id": 1,
+                "message": "Поедем на море",
+                "bot_response": "Конечно!",
+                "communication_style": "romantic",
+                "tokens_used": 5,
+                "created_at": datetime.now(),
+                "rank": 0.5,
+                "headline": "Поедем на «море»",
+            }
+        )
+
+        assert result.conversation.id == 3
+        assert result.conversation.communication_style is CommunicationStyle.ROMANTIC
+        assert result.headline == "Поедем на «море»"
@@ -0,0 +1,130 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+
+from database.models import CommunicationStyle, Conversation
+from services.memory_index import MemoryIndex, bm25_rank, documents_args, parse_postings
+from services.stemmer import stem, tokenize
+
+TURNS = {
+    1: "Летом ездили на море, купались каждый день",
+    2: "Мой кот любит спать на подоконнике",
+    3: "Работа опять задерживает допоздна",
+    4: "Коту купили новую лежанку",
+}
+
+
+def build_postings(turns):
+    """Вхождения термов, длины и суммарная длина, как их хранит Redis"""
+    postings = {}
+    total_length = 0
+    for doc_id, text in turns.items():
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        total_length += length
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_id, tf, length))
+    return postings, total_length
+
+
+def rank(query, excluded=()):
+    postings, total_length = build_postings(TURNS)
+    terms = set(tokenize(query))
+    query_postings = {term: postings[term] for term in terms if term in postings}
+    return bm25_rank(query_postings, len(TURNS), total_length, 3, excluded)
+
+
+def conversation(doc_id, user_id, text):
+    return Conversation(
+        id=doc_id,
+        user_id=user_id,
+        message=text,
+        bot_response="",
+        communication_style=CommunicationStyle.PLAYFUL,
+        tokens_used=0,
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+class TestStemmer:
+    """Тесты для стеммера и токенизатора"""
+
+    def test_word_forms_share_stem(self):
+        """Падежные формы приводятся к одной основе"""
+        assert stem("море") == stem("морем") == stem("моря")
+        assert stem("Красивая") == stem("красивый")
+
+    def test_tokenize_drops_stop_words(self):
+        """Служебные слова и одиночные символы отбрасываются"""
+        assert tokenize("Я и ты у моря") == [stem("моря")]
+
+
+class TestMemoryIndex:
+    """Тесты для BM25-индекса памяти"""
+
+    def test_search_ranks_matching_turns(self):
+        """Находятся реплики с общими основами слов"""
+        assert {doc_id for doc_id, _ in rank("как поживает твой кот?")} == {2, 4}
+        assert rank("погода") == []
+
+    def test_excluded_turns_are_skipped(self):
+        """Самые новые реплики уже есть в контексте и не возвращаются"""
+        assert [doc_id for doc_id, _ in rank("кот", excluded={4})] == [2]
+
+    def test_parse_postings(self):
+        """Вхождения читаются из поля хеша"""
+        assert parse_postings(b"1:2:10,7:1:4") == [(1, 2, 10), (7, 1, 4)]
+
+    @pytest.mark.asyncio
+    async def test_add_and_evict_in_redis(self, redis_settings):
+        """Реплики добавляются по одной, старые сверх лимита вытесняются"""
+        index = MemoryIndex(redis_settings(memory_max_docs=3))
+        user_id = 10**9 + 7
+        client = index.redis.client(user_id)
+        keys = index._get_keys(user_id)
+        await client.delete(*keys)
+
+        # Пока индекс не построен, реплика не записывается
+        assert (
+            await index._apply(
+                user_id,
+                documents_args([conversation(1, user_id, TURNS[1])]),
+                existing_only=True,
+            )
+            == -1
+        )
+        assert await index._apply(user_id, [], existing_only=False) == 0
+        for doc_id, text in TURNS.items():
+            await index._apply(
+                user_id,
+                documents_args([conversation(doc_id, user_id, text)]),
+                existing_only=True,
+            )
+        # Повторное добавление ничего не меняет
+        await index._apply(
+            user_id,
+            documents_args([conversation(4, user_id, TURNS[4])]),
+            existing_only=True,
+        )
+
+        docs_key, ids_key, postings_key = keys
+        assert [int(i) for i in await client.zrange(ids_key, 0, -1)] == [2, 3, 4]
+        assert await client.hget(postings_key, stem("море")) is None
+        cat = parse_postings(await client.hget(postings_key, stem("кот")))
+        assert [doc_id for doc_id, _, _ in cat] == [2, 4]
+        expected_total = sum(length for doc_id, _, length in cat)
+        expected_total += len(tokenize(TURNS[3]))
+        assert int(await client.hget(docs_key, "total")) == expected_total
+
+        # Реплика старше всех сразу вытесняется, даже из конца вхождений
+        await index._apply(
+            user_id,
+            documents_args([conversation(1, user_id, TURNS[2])]),
+            existing_only=False,
+        )
+        assert [int(i) for i in await client.zrange(ids_key, 0, -1)] == [2, 3, 4]
+        assert parse_postings(await client.hget(postings_key, stem("кот"))) == cat
+        assert int(await client.hget(docs_key, "total")) == expected_total
+
+        await client.delete(*keys)
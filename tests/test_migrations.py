@@ -0,0 +1,19 @@
+from database.migrations import LATEST_VERSION, MIGRATIONS, pending_migrations
+
+
+class TestMigrations:
+    """Тесты для реестра миграций"""
+
+    def test_versions_are_sequential(self):
+        """Версии идут подряд с 1 без пропусков и повторов"""
+        versions = [migration.version for migration in MIGRATIONS]
+        assert versions == list(range(1, len(MIGRATIONS) + 1))
+        assert LATEST_VERSION == versions[-1]
+
+    def test_pending_migrations(self):
+        """Ожидающие миграции - строго после текущей версии до цели"""
+        assert pending_migrations(LATEST_VERSION) == []
+        assert [m.version for m in pending_migrations(0, target=2)] == [1, 2]
+        assert [m.version for m in pending_migrations(4)] == list(
+            range(5, LATEST_VERSION + 1)
+        )
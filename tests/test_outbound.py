@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, SendMessage
+
+from config.settings import Settings
+from services.outbound import BACKGROUND, OutboundLimiter, TokenBucket
+
+
+def make_limiter(**overrides):
+    return OutboundLimiter(
+        Settings(
+            bot_token="dummy_token",
+            openai_api_key="dummy_key",
+            database_url="dummy_url",
+            **overrides,
+        )
+    )
+
+
+class TestOutbound:
+    """Тесты для лимитов исходящих запросов к Telegram"""
+
+    @pytest.mark.asyncio
+    async def test_bucket_limits_rate(self):
+        """Сверх емкости токены выдаются со скоростью rate"""
+        bucket = TokenBucket(rate=100, capacity=2)
+        started = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        assert time.monotonic() - started >= 0.015
+
+    @pytest.mark.asyncio
+    async def test_interactive_goes_before_background(self):
+        """Интерактивный запрос получает токен раньше фонового"""
+        bucket = TokenBucket(rate=20, capacity=1)
+        await bucket.acquire()
+        order = []
+
+        async def take(priority, name):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        background = asyncio.create_task(take(BACKGROUND, "background"))
+        await asyncio.sleep(0)
+        await take(0, "interactive")
+        await background
+        assert order == ["interactive", "background"]
+
+    @pytest.mark.asyncio
+    async def test_retry_after_is_retried(self):
+        """После RetryAfter запрос повторяется"""
+        limiter = make_limiter()
+        method = SendMessage(chat_id=1, text="привет")
+        calls = []
+
+        async def make_request(bot, request):
+            calls.append(request)
+            if len(calls) == 1:
+                raise TelegramRetryAfter(request, "Flood control exceeded", 0)
+            return "ok"
+
+        assert await limiter(make_request, None, method) == "ok"
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_pending_edits_are_coalesced(self):
+        """Правки, ждущие лимита, отправляются одной последней"""
+        limiter = make_limiter(telegram_chat_rate=20, telegram_chat_burst=1)
+        sent = []
+
+        async def make_request(bot, request):
+            sent.append(request.text)
+            return request.text
+
+        def edit(text):
+            method = EditMessageText(chat_id=1, message_id=7, text=text)
+            return asyncio.create_task(limiter(make_request, None, method))
+
+        first = edit("1")
+        await asyncio.sleep(0)
+        second, third = edit("2"), edit("3")
+        results = await asyncio.gather(first, second, third)
+        assert sent == ["1", "3"]
+        assert results == ["1", "3", "3"]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_editor_does_not_drop_coalesced_edit(self):
+        """Отмена первой правки не отменяет схлопнутые: уходит последняя"""
+        limiter = make_limiter(telegram_chat_rate=20, telegram_chat_burst=1)
+        sent = []
+
+        async def make_request(bot, request):
+            sent.append(request.text)
+            return request.text
+
+        def edit(text):
+            method = EditMessageText(chat_id=1, message_id=7, text=text)
+            return asyncio.create_task(limiter(make_request, None, method))
+
+        await edit("0")
+        first = edit("1")
+        await asyncio.sleep(0)
+        second = edit("2")
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "2"
+        assert sent == ["0", "2"]
+        with pytest.raises(asyncio.CancelledError):
+            await first
@@ -0,0 +1,57 @@
+from datetime import date
+
+import pytest
+
+from database.partitions import (
+    add_months,
+    check_partition_coverage,
+    current_month,
+    month_start,
+    parse_partition_month,
+    partition_name,
+)
+
+
+class FakeConnection:
+    """Партиционированная conversations с заданными партициями"""
+
+    def __init__(self, names):
+        self.names = names
+
+    async def fetchval(self, query, *args):
+        return "p"
+
+    async def fetch(self, query, *args):
+        return [{"name": name} for name in self.names]
+
+
+class TestPartitions:
+    """Тесты для расчета помесячных партиций"""
+
+    def test_add_months_uses_calendar_months(self):
+        """Сдвиг идет по календарным месяцам, а не по 30 дням"""
+        assert add_months(date(2024, 1, 1), 1) == date(2024, 2, 1)
+        assert add_months(date(2024, 12, 1), 1) == date(2025, 1, 1)
+        assert add_months(date(2024, 3, 1), -3) == date(2023, 12, 1)
+        assert add_months(date(2024, 1, 1), 24) == date(2026, 1, 1)
+
+    def test_month_start(self):
+        """Начало месяца"""
+        assert month_start(date(2024, 2, 29)) == date(2024, 2, 1)
+
+    def test_partition_name_roundtrip(self):
+        """Имя партиции однозначно задает ее месяц"""
+        name = partition_name(date(2024, 7, 1))
+        assert name == "conversations_2024_07"
+        assert parse_partition_month(name) == date(2024, 7, 1)
+        assert parse_partition_month("conversations_default") is None
+        assert parse_partition_month("conversations_old") is None
+
+    @pytest.mark.asyncio
+    async def test_partition_coverage(self):
+        """Запас считается по месяцам подряд от текущего, пропуск его обрывает"""
+        this_month = current_month()
+        names = [partition_name(add_months(this_month, i)) for i in (0, 1, 3)]
+        names.append("conversations_default")
+        assert await check_partition_coverage(FakeConnection(names), 3) == 1
+        assert await check_partition_coverage(FakeConnection([]), 3) == -1
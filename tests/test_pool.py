@@ -0,0 +1,48 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from database.pool import MonitoredPool
+
+
+class FakePool:
+    """Пул-заглушка без ограничений"""
+
+    def get_idle_size(self):
+        return 0
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield object()
+
+
+class TestMonitoredPool:
+    """Тесты для адаптивного лимита пула"""
+
+    @pytest.mark.asyncio
+    async def test_gate_limits_concurrency(self):
+        """Сверх лимита соединения не выдаются"""
+        pool = MonitoredPool(FakePool(), "test-gate", 1, 4, adaptive=True)
+
+        async with pool.acquire():
+            with pytest.raises(asyncio.TimeoutError):
+                async with pool.acquire(timeout=0.05):
+                    pass
+        async with pool.acquire(timeout=0.05):
+            assert pool.in_use == 1
+        assert pool.in_use == 0
+
+    def test_limit_grows_on_waits_and_shrinks_when_idle(self):
+        """Лимит растет при долгом ожидании и снижается при простое"""
+        pool = MonitoredPool(
+            FakePool(), "test-adjust", 2, 8, adaptive=True, adjust_interval=0
+        )
+
+        pool._observe(1.0)
+        assert pool.limit == 3
+
+        pool._observe(0.0)
+        assert pool.limit == 2
+        pool._observe(0.0)
+        assert pool.limit == 2
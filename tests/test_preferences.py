@@ -0,0 +1,39 @@
+from services.preferences import PreferenceProfile, detect_preferences
+
+
+class TestPreferences:
+    """Тесты для профиля предпочтений"""
+
+    def test_detect_preferences(self):
+        """Темы и стили считаются один раз на сообщение, настроение - последнее"""
+        counters, mood = detect_preferences(
+            "Работа и карьера надоели, хочу в отпуск! Грусть... но весело 😊"
+        )
+        assert counters == ["topic:работа", "topic:путешествия", "style:playful"]
+        assert mood == "радостное"
+
+    def test_no_keywords(self):
+        """Сообщение без ключевых слов не меняет профиль"""
+        assert detect_preferences("Привет, как дела?") == ([], "")
+
+    def test_profile_from_hash(self):
+        """Профиль собирается из полей хеша Redis"""
+        profile = PreferenceProfile.from_hash(
+            {
+                "topic:работа".encode(): b"2",
+                "topic:спорт".encode(): b"5",
+                b"style:romantic": b"3",
+                b"style:playful": b"1",
+                b"mood": "грустное".encode(),
+            }
+        )
+        assert profile.topics == ["спорт", "работа"]
+        assert profile.communication_style == "romantic"
+        assert profile.mood == "грустное"
+        assert "спорт, работа" in profile.prompt_hint()
+
+    def test_empty_profile(self):
+        """Пустой профиль не добавляет подсказку в промпт"""
+        profile = PreferenceProfile.from_hash({})
+        assert profile.communication_style == "neutral"
+        assert profile.prompt_hint() == ""
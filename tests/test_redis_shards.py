@@ -0,0 +1,49 @@
+from collections import Counter
+
+from config.settings import Settings
+from services.redis_shards import HashRing, RedisShards
+
+
+def make_settings(urls):
+    return Settings(
+        bot_token="dummy_token",
+        openai_api_key="dummy_key",
+        database_url="dummy_url",
+        redis_urls=urls,
+    )
+
+
+class TestHashRing:
+    """Тесты для консистентного хеширования"""
+
+    def test_keys_spread_evenly(self):
+        """Ключи распределяются по узлам примерно поровну"""
+        ring = HashRing(["a:6379", "b:6379", "c:6379", "d:6379"])
+        counts = Counter(ring.node_for(user_id) for user_id in range(40000))
+        assert len(counts) == 4
+        assert min(counts.values()) > 40000 / 4 * 0.8
+
+    def test_adding_node_moves_few_keys(self):
+        """Новый узел забирает примерно свою долю ключей, не больше"""
+        before = HashRing(["a:6379", "b:6379", "c:6379"])
+        after = HashRing(["a:6379", "b:6379", "c:6379", "d:6379"])
+        moved = sum(
+            before.node_for(user_id) != after.node_for(user_id)
+            for user_id in range(20000)
+        )
+        assert moved < 20000 * 0.35
+        # Ключи переезжают только на новый узел
+        assert all(
+            after.node_for(user_id) in (before.node_for(user_id), 3)
+            for user_id in range(20000)
+        )
+
+
+class TestRedisShards:
+    """Тесты для маршрутизации по шардам Redis"""
+
+    def test_single_node_fallback(self):
+        """Без redis_urls используется redis_url"""
+        shards = RedisShards(make_settings([]))
+        assert len(shards) == 1
+        assert shards.client(42) is shards.clients[0]
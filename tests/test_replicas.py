@@ -0,0 +1,42 @@
+from database.replicas import ReplicaRouter
+
+
+async def _no_pool(url):
+    raise OSError("unused")
+
+
+def _router(**kwargs):
+    router = ReplicaRouter(["postgresql://a", "postgresql://b"], _no_pool, **kwargs)
+    for replica in router.replicas:
+        replica.pool = object()
+        replica.healthy = True
+    return router
+
+
+class TestReplicaRouter:
+    """Тесты для выбора пула чтения"""
+
+    def test_round_robin_over_healthy(self):
+        """Чтения распределяются по здоровым репликам"""
+        router = _router()
+        first, second = (replica.pool for replica in router.replicas)
+        assert {router.pick(1), router.pick(1)} == {first, second}
+
+        router.mark_down(first, OSError("down"))
+        assert {router.pick(1) for _ in range(4)} == {second}
+
+        router.mark_down(second, OSError("down"))
+        assert router.pick(1) is None
+
+    def test_sticky_after_write(self):
+        """После записи пользователь читает с основного сервера"""
+        router = _router(sticky_seconds=60)
+        router.mark_write(1)
+        assert router.pick(1) is None
+        assert router.pick(2) is not None
+
+    def test_sticky_expires(self):
+        """Закрепление снимается после окна"""
+        router = _router(sticky_seconds=0)
+        router.mark_write(1)
+        assert router.pick(1) is not None
@@ -0,0 +1,35 @@
+import asyncio
+import uuid
+
+import pytest
+
+from services.token_quota import TokenQuota, estimate_tokens
+
+
+class TestTokenQuota:
+    """Тесты для квот токенов"""
+
+    def test_estimate_tokens(self):
+        """Оценка - около трех символов на токен"""
+        assert estimate_tokens(["а" * 300, "b" * 30]) == 110
+
+    @pytest.mark.asyncio
+    async def test_concurrent_reservations_respect_limit(self, redis_settings):
+        """Параллельные резервы не превышают дневной лимит"""
+        quota = TokenQuota(redis_settings(token_quota_daily=1000))
+        user_id = uuid.uuid4().int % 10**9
+
+        decisions = await asyncio.gather(
+            *(quota.reserve(user_id, 300) for _ in range(10))
+        )
+        assert sum(decision.allowed for decision in decisions) == 3
+        assert {d.exceeded for d in decisions if not d.allowed} == {"daily"}
+
+        # Фактический расход меньше резерва освобождает квоту
+        allowed = [d for d in decisions if d.allowed]
+        for decision in allowed:
+            await quota.settle(user_id, decision, 100)
+        assert (await quota.reserve(user_id, 300)).allowed
+        assert quota._pending == {(user_id, allowed[0].day): 300}
+
+        await quota.redis.client(user_id).delete(*allowed[0].keys)
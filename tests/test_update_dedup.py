@@ -0,0 +1,35 @@
+import asyncio
+import uuid
+
+import pytest
+
+from services.update_dedup import UpdateDeduplicator
+
+
+class TestUpdateDeduplicator:
+    """Тесты для отсева повторных апдейтов"""
+
+    @pytest.mark.asyncio
+    async def test_redelivered_update_is_claimed_once(self, redis_settings):
+        """Из параллельных доставок одного апдейта проходит одна"""
+        deduplicator = UpdateDeduplicator(redis_settings())
+        update_id = uuid.uuid4().int % 10**9
+
+        claims = await asyncio.gather(
+            *(deduplicator.claim(update_id) for _ in range(5))
+        )
+        assert sorted(claims) == [False, False, False, False, True]
+
+        await deduplicator.release(update_id)
+
+    @pytest.mark.asyncio
+    async def test_release_allows_retry(self, redis_settings):
+        """После неудачной обработки апдейт можно обработать снова"""
+        deduplicator = UpdateDeduplicator(redis_settings())
+        update_id = uuid.uuid4().int % 10**9
+
+        assert await deduplicator.claim(update_id)
+        await deduplicator.release(update_id)
+        assert await deduplicator.claim(update_id)
+
+        await deduplicator.release(update_id)
@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import queue
+
+import pytest
+from aiogram.types import Update
+
+from services import workers
+from services.workers import (
+    KeyedSerializer,
+    WorkerPool,
+    consume,
+    drain_queue,
+    partition_key,
+)
+
+
+def message_update(update_id, user_id, text="привет"):
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 1700000000,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Аня"},
+                "text": text,
+            },
+        }
+    )
+
+
+class TestWorkers:
+    """Тесты для раздачи апдейтов процессам-воркерам"""
+
+    def test_partition_key(self):
+        """Апдейты раздаются по пользователю, без него - по чату"""
+        assert partition_key(message_update(1, 42)) == 42
+        channel_post = Update.model_validate(
+            {
+                "update_id": 2,
+                "channel_post": {
+                    "message_id": 1,
+                    "date": 1700000000,
+                    "chat": {"id": -100500, "type": "channel"},
+                    "text": "новости",
+                },
+            }
+        )
+        assert partition_key(channel_post) == -100500
+
+    def test_worker_for_is_stable(self):
+        """Пользователь всегда попадает к одному воркеру"""
+        pool = WorkerPool(4, target=print)
+        assert pool.worker_for(42) == pool.worker_for(42) == 2
+        assert 0 <= pool.worker_for(-100500) < 4
+
+    @pytest.mark.asyncio
+    async def test_serializer_keeps_order_within_key(self):
+        """Задачи одного ключа идут по порядку, разных - параллельно"""
+        serializer = KeyedSerializer()
+        events = []
+
+        async def job(name, delay):
+            events.append(f"{name}+")
+            await asyncio.sleep(delay)
+            events.append(f"{name}-")
+
+        serializer.submit(1, lambda: job("a1", 0.02))
+        serializer.submit(1, lambda: job("a2", 0))
+        serializer.submit(2, lambda: job("b1", 0))
+        await serializer.join()
+
+        assert events.index("a1-") < events.index("a2+")
+        assert events.index("b1-") < events.index("a1-")
+        assert len(serializer) == 0
+
+    @pytest.mark.asyncio
+    async def test_consume_drains_queue_before_stop(self):
+        """Воркер обрабатывает всю очередь до сигнала остановки"""
+        work = queue.Queue()
+        for text in ("1", "2", "3"):
+            data = message_update(7, 42, text).model_dump(mode="json", by_alias=True)
+            work.put((42, data))
+        work.put(None)
+        handled = []
+
+        async def handle(data):
+            handled.append(Update.model_validate(data).message.text)
+
+        await consume(work, handle)
+        assert handled == ["1", "2", "3"]
+
+    @pytest.mark.asyncio
+    async def test_consume_stops_when_ingest_is_gone(self, monkeypatch):
+        """Без процесса приема воркер дообрабатывает очередь и выходит"""
+
+        class DeadParent:
+            def is_alive(self):
+                return False
+
+        monkeypatch.setattr(workers.multiprocessing, "parent_process", DeadParent)
+        monkeypatch.setattr(workers, "PARENT_CHECK_INTERVAL", 0.01)
+        work = queue.Queue()
+        data = message_update(7, 42).model_dump(mode="json", by_alias=True)
+        work.put((42, data))
+        handled = []
+
+        async def handle(data):
+            handled.append(data["update_id"])
+
+        await asyncio.wait_for(consume(work, handle), 1)
+        assert handled == [7]
+
+    def test_drain_queue_of_crashed_worker(self):
+        """Оставшиеся в очереди апдейты достаются по порядку"""
+        work = multiprocessing.get_context("spawn").Queue()
+        for update_id in (1, 2, 3):
+            work.put((42, {"update_id": update_id}))
+        items, lost = drain_queue(work)
+        assert [data["update_id"] for _, data in items] == [1, 2, 3]
+        assert lost == 0